@@ -1,21 +1,119 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context, url_for
 from flask_cors import CORS
-from pymongo import MongoClient
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest
+from pymongo import ASCENDING, DESCENDING, MongoClient
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from bson import ObjectId
+from bson.errors import InvalidId
 from dotenv import load_dotenv
+import base64
+import binascii
+import json
 import os
 import re
+import sys
+import threading
+import uuid
 from datetime import datetime
+from functools import lru_cache
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from evaluate_jobs import QUEUED, JobRunner, JobStore
+from grade_cache import GradeCache, content_hash, rubric_version
+from write_behind import DUPLICATE_KEY, WriteBehindFull, WriteBehindWriter
 
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['X-Next-Cursor'])
 
 # MongoDB setup
 client = MongoClient(os.getenv('MONGO_URI'))
 db = client[os.getenv('DB_NAME')]
 responses_collection = db['graded_responses']
 
+# Prometheus metrics, served at /metrics
+GRADE_SECONDS = Histogram('api_grade_seconds', 'Time to grade and store one response')
+GRADE_BATCH_SECONDS = Histogram('api_grade_batch_seconds', 'Time to grade and store a batch of responses')
+GRADE_CACHE_LOOKUPS = Counter('api_grade_cache_lookups_total', 'Graded response lookups by content hash', ['result'])
+
+# Largest number of responses accepted by /api/grade/batch
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', 500))
+
+# Page sizes of GET /api/grade/responses
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', 500))
+# Newest first; the index below serves this sort and the cursor range together
+RESPONSES_ORDER = [('timestamp', DESCENDING), ('_id', DESCENDING)]
+# Fields listed by default: everything but response_text
+LISTED_FIELDS = {'score': 1, 'score_color': 1, 'matched_criteria': 1, 'timestamp': 1}
+
+# Fields of the unique index that identifies a graded response
+DEDUP_FIELDS = ('content_hash', 'rubric_version')
+# Repeat submissions of a response are answered from this LRU, then from the content_hash index
+grade_cache = GradeCache(int(os.getenv('GRADE_CACHE_SIZE', 10000)))
+
+# Flowchart image evaluation jobs (POST /api/evaluate), run by the DG_backend pipeline
+DG_BACKEND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'DG_backend')
+sys.path.append(DG_BACKEND)
+# Registers the pipeline's stage and model-call metrics, so /metrics lists them before the first evaluation
+import metrics as pipeline_metrics  # noqa: F401
+JOBS_DIR = os.getenv('EVALUATE_JOBS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.jobs'))
+EVALUATE_WORKERS = int(os.getenv('EVALUATE_WORKERS', 2))
+MAX_QUEUED_JOBS = int(os.getenv('MAX_QUEUED_JOBS', 1000))
+# Caps every request body; Werkzeug answers 413 before reading a larger one
+MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', 20 * 1024 * 1024))
+app.config['MAX_CONTENT_LENGTH'] = MAX_IMAGE_BYTES
+ALLOWED_IMAGE_EXTENSIONS = json.loads(os.getenv('ALLOWED_EXTENSIONS', '["jpg", "jpeg", "png"]'))
+
+def remember_stored_grade(document, stored_id):
+    """Write-behind dropped `document` because another writer stored it first: repeats get the stored id."""
+    grade_cache.remember((document['content_hash'], document['rubric_version']), stored_grade({**document, '_id': stored_id}))
+
+# Optional write-behind: graded responses are queued and written in bulk by a background thread
+write_behind = None
+if os.getenv('WRITE_BEHIND', 'false').lower() in ('1', 'true', 'yes'):
+    write_behind = WriteBehindWriter(
+        responses_collection,
+        max_queue=int(os.getenv('WRITE_BEHIND_QUEUE_SIZE', 10000)),
+        batch_size=int(os.getenv('WRITE_BEHIND_BATCH_SIZE', 500)),
+        flush_interval=float(os.getenv('WRITE_BEHIND_FLUSH_SECONDS', 0.5)),
+        put_timeout=float(os.getenv('WRITE_BEHIND_PUT_TIMEOUT', 2.0)),
+        unique_fields=DEDUP_FIELDS,
+        on_duplicate=remember_stored_grade
+    )
+
+def store_responses(documents):
+    """
+    Store graded response documents; returns their ids. With write-behind they
+    are only queued. A document whose content_hash was stored meanwhile by
+    another request gets the id of the stored one.
+    """
+    if write_behind is not None:
+        return write_behind.submit_many(documents)
+    try:
+        if len(documents) == 1:
+            return [responses_collection.insert_one(documents[0]).inserted_id]
+        return responses_collection.insert_many(documents, ordered=False).inserted_ids
+    except DuplicateKeyError:
+        pass
+    except BulkWriteError as e:
+        if any(error.get('code') != DUPLICATE_KEY for error in e.details.get('writeErrors', [])):
+            raise
+    stored = {
+        document['content_hash']: document['_id']
+        for document in responses_collection.find(
+            {'content_hash': {'$in': [document['content_hash'] for document in documents]}, 'rubric_version': RUBRIC_VERSION},
+            {'content_hash': 1}
+        )
+    }
+    return [stored[document['content_hash']] for document in documents]
+
+def queue_full_response(error):
+    response = jsonify({'error': f'Grading store is busy, retry shortly ({error})'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 # Grading criteria (matches your Angular frontend)
 GRADING_CRITERIA = [
     {
@@ -45,16 +143,59 @@ GRADING_CRITERIA = [
     }
 ]
 
+# Stored grades carry this version; documents graded under other criteria are never reused
+RUBRIC_VERSION = rubric_version(GRADING_CRITERIA)
+
+def check_criteria(criteria):
+    """
+    Raise ValueError for a criterion criteria_matcher would silently get
+    wrong: the combined pattern drops each pattern's own flags (IGNORECASE
+    is replaced by lower-casing the text) and is matched against lower-cased
+    text, so upper-case literals (escapes such as \\S aside) never match.
+    """
+    for criterion in criteria:
+        pattern = criterion['pattern']
+        if pattern.flags & ~(re.IGNORECASE | re.UNICODE):
+            raise ValueError(f"Criterion {criterion['name']!r}: only re.IGNORECASE is supported")
+        if any(char.isupper() for char in re.sub(r'\\.', '', pattern.pattern)):
+            raise ValueError(f"Criterion {criterion['name']!r}: patterns must be written in lower case")
+
+check_criteria(GRADING_CRITERIA)
+
+@lru_cache(maxsize=None)
+def criteria_matcher(remaining):
+    """
+    One pattern for the criteria in `remaining` (a frozenset of indexes), one
+    named group per criterion. It is matched case-sensitively against the
+    lower-cased text, which is much faster than IGNORECASE, so criteria
+    patterns must be written in lower case (check_criteria enforces it).
+    """
+    return re.compile(
+        '|'.join(f'(?P<c{index}>{GRADING_CRITERIA[index]["pattern"].pattern})' for index in sorted(remaining))
+    )
+
+def match_criteria(response_text):
+    """
+    Indexes of the GRADING_CRITERIA found in the text, in one forward scan:
+    each search looks only for the criteria not found yet and resumes where
+    the previous match started, so at most one search runs per criterion.
+    """
+    text = response_text.lower()
+    remaining = frozenset(range(len(GRADING_CRITERIA)))
+    position = 0
+    while remaining:
+        match = criteria_matcher(remaining).search(text, position)
+        if not match:
+            break
+        remaining -= {int(match.lastgroup[1:])}
+        position = match.start()
+    return set(range(len(GRADING_CRITERIA))) - remaining
+
 def calculate_score(response_text):
-    score = 0
-    matched_criteria = []
-    
-    for criteria in GRADING_CRITERIA:
-        is_matched = bool(criteria['pattern'].search(response_text))
-        if is_matched:
-            score += criteria['weight']
-            matched_criteria.append(criteria['name'])
-    
+    found = match_criteria(response_text)
+    matched_criteria = [criteria['name'] for index, criteria in enumerate(GRADING_CRITERIA) if index in found]
+    score = sum(criteria['weight'] for index, criteria in enumerate(GRADING_CRITERIA) if index in found)
+
     # Determine score color
     if score >= 80:
         score_color = '#4CAF50'  # Green
@@ -71,6 +212,7 @@ def calculate_score(response_text):
     }
 
 @app.route('/api/grade', methods=['POST'])
+@GRADE_SECONDS.time()
 def grade_response():
     data = request.json
     response_text = data.get('response')
@@ -78,37 +220,274 @@ def grade_response():
     if not response_text:
         return jsonify({'error': 'No response provided'}), 400
     
-    # Calculate score
-    grading_result = calculate_score(response_text)
+    # Grade, or find the stored grade of the same response, and store it in MongoDB
+    try:
+        [graded] = grade_responses([response_text])
+    except WriteBehindFull as e:
+        return queue_full_response(e)
     
-    # Store in MongoDB
-    response_doc = {
+    return jsonify(graded)
+
+@app.route('/api/grade/batch', methods=['POST'])
+@GRADE_BATCH_SECONDS.time()
+def grade_batch():
+    """Grade a list of responses ({"responses": [text, ...]}) and store them with one database write."""
+    data = request.json or {}
+    response_texts = data.get('responses')
+
+    if not isinstance(response_texts, list) or not response_texts:
+        return jsonify({'error': 'No responses provided'}), 400
+    if len(response_texts) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} responses per batch'}), 413
+    invalid = [index for index, text in enumerate(response_texts) if not isinstance(text, str) or not text]
+    if invalid:
+        return jsonify({'error': 'Empty or non-text responses', 'invalid_indexes': invalid}), 400
+
+    try:
+        results = grade_responses(response_texts)
+    except WriteBehindFull as e:
+        return queue_full_response(e)
+
+    return jsonify({'count': len(results), 'results': results})
+
+def graded_response(inserted_id, response_text, grading_result):
+    return {
+        'id': str(inserted_id),
+        **grading_result,
+        'formatted_response': format_response(response_text, grading_result['matched_criteria'])
+    }
+
+def stored_grade(document):
+    """The (id, grading result) of a stored graded response."""
+    return document['_id'], {
+        'score': document['score'],
+        'max_score': 100,
+        'score_color': document['score_color'],
+        'matched_criteria': document['matched_criteria']
+    }
+
+def grade_responses(response_texts):
+    """
+    The graded response of each text, in order. Texts are keyed by their
+    normalized content hash: a text graded before under the current rubric
+    gets its stored id and grade back, from grade_cache or from
+    graded_responses, and only new texts are graded and stored (with a
+    single write). The formatted response is always built from the text
+    submitted, since normalization changes it but not the grade.
+    """
+    hashes = [content_hash(text) for text in response_texts]
+    grades = {}
+    for text_hash in set(hashes):
+        cached = grade_cache.get((text_hash, RUBRIC_VERSION))
+        if cached is not None:
+            grades[text_hash] = cached
+    GRADE_CACHE_LOOKUPS.labels('memory').inc(len(grades))
+
+    missing = set(hashes) - grades.keys()
+    if missing:
+        stored = responses_collection.find(
+            {'content_hash': {'$in': list(missing)}, 'rubric_version': RUBRIC_VERSION},
+            {'content_hash': 1, **LISTED_FIELDS}
+        )
+        for document in stored:
+            grades[document['content_hash']] = stored_grade(document)
+            grade_cache.remember((document['content_hash'], RUBRIC_VERSION), grades[document['content_hash']])
+        found = missing & grades.keys()
+        GRADE_CACHE_LOOKUPS.labels('database').inc(len(found))
+        missing -= found
+
+    if missing:
+        # Grade the first occurrence of each new text
+        new_texts = {}
+        for text, text_hash in zip(response_texts, hashes):
+            if text_hash in missing:
+                new_texts.setdefault(text_hash, text)
+        GRADE_CACHE_LOOKUPS.labels('miss').inc(len(new_texts))
+        grading_results = {text_hash: calculate_score(text) for text_hash, text in new_texts.items()}
+        inserted_ids = store_responses([
+            response_document(text, grading_results[text_hash], text_hash) for text_hash, text in new_texts.items()
+        ])
+        for inserted_id, text_hash in zip(inserted_ids, new_texts):
+            grades[text_hash] = (inserted_id, grading_results[text_hash])
+            grade_cache.remember((text_hash, RUBRIC_VERSION), grades[text_hash])
+
+    return [graded_response(grades[text_hash][0], text, grades[text_hash][1]) for text, text_hash in zip(response_texts, hashes)]
+
+def ensure_indexes(collection):
+    """Create the indexes of graded responses (a no-op when they exist); run once at startup."""
+    collection.create_index(RESPONSES_ORDER, name='timestamp_id')
+    # Sparse, so documents stored before content hashing are left out of it
+    collection.create_index([(field, ASCENDING) for field in DEDUP_FIELDS],
+                            name='content_hash_rubric', unique=True, sparse=True)
+
+def encode_cursor(document):
+    """An opaque cursor pointing just after `document` in RESPONSES_ORDER."""
+    position = f"{document['timestamp'].isoformat()}|{document['_id']}"
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+def decode_cursor(cursor):
+    """The query for the documents after `cursor`; raises ValueError for a malformed cursor."""
+    try:
+        timestamp, _id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        timestamp, _id = datetime.fromisoformat(timestamp), ObjectId(_id)
+    except (binascii.Error, UnicodeDecodeError, InvalidId, ValueError):
+        raise ValueError(f'Invalid cursor: {cursor}')
+    return {'$or': [{'timestamp': {'$lt': timestamp}}, {'timestamp': timestamp, '_id': {'$lt': _id}}]}
+
+def listed_response(document):
+    listed = {key: value for key, value in document.items() if key != '_id'}
+    return {'id': str(document['_id']), **listed, 'timestamp': document['timestamp'].isoformat()}
+
+@app.route('/api/grade/responses', methods=['GET'])
+def list_responses():
+    """
+    Graded responses, newest first, one page at a time. The body is a JSON
+    list; when there are more, the X-Next-Cursor header holds the `cursor`
+    parameter of the next page. response_text is left out unless
+    include_text=true. With format=ndjson every response after `cursor`
+    (or the first `limit`) is streamed as one JSON object per line.
+    """
+    stream = request.args.get('format') == 'ndjson'
+    try:
+        limit = int(request.args.get('limit', 0 if stream else DEFAULT_PAGE_SIZE))
+        if limit < 0 or not stream and not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+        query = decode_cursor(request.args['cursor']) if 'cursor' in request.args else {}
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    projection = dict(LISTED_FIELDS)
+    if request.args.get('include_text', 'false').lower() in ('1', 'true', 'yes'):
+        projection['response_text'] = 1
+    cursor = responses_collection.find(query, projection).sort(RESPONSES_ORDER)
+
+    if stream:
+        # limit 0 streams everything; the driver fetches it 1000 documents at a time
+        def lines():
+            for document in cursor.limit(limit).batch_size(1000):
+                yield json.dumps(listed_response(document)) + '\n'
+
+        return Response(stream_with_context(lines()), mimetype='application/x-ndjson')
+
+    # One document past the page tells whether there is a next page
+    documents = list(cursor.limit(limit + 1))
+    response = jsonify([listed_response(document) for document in documents[:limit]])
+    if len(documents) > limit:
+        response.headers['X-Next-Cursor'] = encode_cursor(documents[limit - 1])
+    return response
+
+def response_document(response_text, grading_result, text_hash=None):
+    return {
         'response_text': response_text,
+        'content_hash': text_hash or content_hash(response_text),
+        'rubric_version': RUBRIC_VERSION,
         'score': grading_result['score'],
         'score_color': grading_result['score_color'],
         'matched_criteria': grading_result['matched_criteria'],
         'timestamp': datetime.utcnow()
     }
-    
-    inserted = responses_collection.insert_one(response_doc)
-    
-    return jsonify({
-        'id': str(inserted.inserted_id),
-        **grading_result,
-        'formatted_response': format_response(response_text, grading_result['matched_criteria'])
-    })
+
+LIST_ITEM = re.compile(r'\*\s*(.*?)\n')
+HIGHLIGHT_PHRASES = ['Read:', 'If', 'Result =', 'Beg =', 'End =', 'Mid =']
+HIGHLIGHTER = re.compile('|'.join(re.escape(phrase) for phrase in HIGHLIGHT_PHRASES))
 
 def format_response(response_text, matched_criteria):
     # Basic formatting similar to your frontend - USING PYTHON re.sub() instead of JS regex
-    formatted = re.sub(r'\*\s*(.*?)\n', r'<li>\1</li>', response_text)
+    formatted = LIST_ITEM.sub(r'<li>\1</li>', response_text)
     formatted = f'<ul>{formatted}</ul>'
     
-    # Highlight phrases
-    highlight_phrases = ['Read:', 'If', 'Result =', 'Beg =', 'End =', 'Mid =']
-    for phrase in highlight_phrases:
-        formatted = formatted.replace(phrase, f'<strong>{phrase}</strong>')
-    
-    return formatted
+    # Highlight phrases, all in one pass
+    return HIGHLIGHTER.sub(r'<strong>\g<0></strong>', formatted)
+
+def run_pipeline(image_path, problem_description):
+    """
+    Evaluate a flowchart image with DG_backend's graph_based_g_eval. The
+    pipeline is imported on first use, so grading text needs none of its
+    dependencies.
+    """
+    from g_eval import graph_based_g_eval
+    return graph_based_g_eval(image_path, problem_description)
+
+_job_runner = None
+_job_runner_lock = threading.Lock()
+
+def get_job_runner():
+    """The evaluation job runner of this process, started on first use."""
+    global _job_runner
+    with _job_runner_lock:
+        if _job_runner is None:
+            store = JobStore(os.path.join(JOBS_DIR, 'jobs.sqlite3'))
+            _job_runner = JobRunner(store, run_pipeline, workers=EVALUATE_WORKERS)
+    return _job_runner
+
+def job_timestamp(seconds):
+    return datetime.utcfromtimestamp(seconds).isoformat() if seconds is not None else None
+
+@app.errorhandler(413)
+def request_too_large(error):
+    return jsonify({'error': f'Request bodies are limited to {app.config["MAX_CONTENT_LENGTH"]} bytes'}), 413
+
+@app.route('/api/evaluate', methods=['POST'])
+def evaluate_image():
+    """
+    Queue a flowchart image (multipart field "image", optional form field
+    "problem_description") for evaluation and return the job id at once
+    (202). Poll GET /api/evaluate/<id> for the result.
+    """
+    image = request.files.get('image')
+    if image is None or not image.filename:
+        return jsonify({'error': 'No image provided'}), 400
+    extension = os.path.splitext(image.filename)[1][1:].lower()
+    if extension not in ALLOWED_IMAGE_EXTENSIONS:
+        return jsonify({'error': f'Image must be one of: {", ".join(ALLOWED_IMAGE_EXTENSIONS)}'}), 400
+
+    runner = get_job_runner()
+    if runner.store.count(QUEUED) >= MAX_QUEUED_JOBS:
+        response = jsonify({'error': 'Too many queued evaluations, retry later'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    uploads = os.path.join(JOBS_DIR, 'uploads')
+    os.makedirs(uploads, exist_ok=True)
+    image_path = os.path.join(uploads, f'{uuid.uuid4().hex}.{extension}')
+    image.save(image_path)
+    job_id = runner.store.create(image_path, request.form.get('problem_description', ''))
+    runner.notify()
+
+    response = jsonify({'id': job_id, 'status': QUEUED})
+    response.headers['Location'] = url_for('evaluation_status', job_id=job_id)
+    return response, 202
+
+@app.route('/api/evaluate/<job_id>', methods=['GET'])
+def evaluation_status(job_id):
+    """Status of an evaluation job: queued, running, done or failed, with the result once finished."""
+    job = get_job_runner().store.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown evaluation job'}), 404
+    return jsonify({
+        'id': job['id'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'created_at': job_timestamp(job['created_at']),
+        'started_at': job_timestamp(job['started_at']),
+        'finished_at': job_timestamp(job['finished_at']),
+        'result': job['result'],
+        'error': job['error']
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
+
+# Created at startup, so no request pays for them and a failure (such as old duplicate
+# responses blocking the unique index) stops the app here rather than failing every grade
+if os.getenv('CREATE_INDEXES_ON_STARTUP', 'true').lower() in ('1', 'true', 'yes'):
+    try:
+        ensure_indexes(responses_collection)
+    except PyMongoError as e:
+        raise RuntimeError(f'Could not create the graded_responses indexes: {e}') from e
 
 if __name__ == '__main__':
+    # Start the evaluation workers now, to resume jobs queued before a restart
+    get_job_runner()
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""
+Throughput benchmark for the grading API: per-request /api/grade against /api/grade/batch.
+
+Grades synthetic responses through the Flask app in-process, with
+`graded_responses` swapped for an in-memory mongomock collection (pass
+--configured-db to write to MONGO_URI/DB_NAME instead). It reports:
+- matcher: responses/s of the former five-scan `calculate_score` and the
+  single-scan matcher.
+- per-request: one POST /api/grade per response, from --workers threads.
+- batch: POST /api/grade/batch with --batch-size responses each, from the same
+  threads, for a second set of responses.
+- repeat: the per-request responses posted again, answered from the grade cache.
+With --write-behind both endpoints only queue their documents (see
+write_behind.py); the time to flush what is left is reported separately.
+
+Usage: python bench_grading.py [--responses 2000] [--batch-size 100] [--workers 8]
+"""
+import argparse
+import importlib.util
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+WORDS = (
+    "the algorithm starts by reading the input then we declare a variable to hold the sum and "
+    "initialize it to zero a loop repeats until the counter reaches n and each step adds the value "
+    "the decision checks whether the number is even before the result is displayed at the end "
+    "students often forget the terminator or print the output twice"
+).split()
+
+def load_api_app():
+    """
+    Import API/app.py under its own module name (the repository root has an
+    app.py too), once: its Prometheus metrics can only be registered once.
+    Indexes are not created at import, as callers swap in their own
+    collection; they call `ensure_indexes` on it.
+    """
+    if "api_app" in sys.modules:
+        return sys.modules["api_app"]
+    os.environ.setdefault("DB_NAME", "deepgrade")
+    os.environ.setdefault("CREATE_INDEXES_ON_STARTUP", "false")
+    spec = importlib.util.spec_from_file_location("api_app", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["api_app"] = module
+    try:
+        spec.loader.exec_module(module)
+    except BaseException:
+        del sys.modules["api_app"]
+        raise
+    return module
+
+def legacy_calculate_score(api, response_text):
+    """The former `calculate_score` matching: one `re.search` per criterion."""
+    score = 0
+    matched_criteria = []
+    for criteria in api.GRADING_CRITERIA:
+        if criteria['pattern'].search(response_text):
+            score += criteria['weight']
+            matched_criteria.append(criteria['name'])
+    return score, matched_criteria
+
+def synthetic_responses(count, words=120, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(words)) for _ in range(count)]
+
+def rate(count, seconds):
+    return round(count / seconds, 1) if seconds else None
+
+def bench_matcher(api, responses):
+    started = time.perf_counter()
+    legacy = [legacy_calculate_score(api, text) for text in responses]
+    legacy_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    combined = [api.calculate_score(text) for text in responses]
+    combined_seconds = time.perf_counter() - started
+    assert [(result['score'], result['matched_criteria']) for result in combined] == legacy
+    return {"legacy_per_second": rate(len(responses), legacy_seconds),
+            "combined_per_second": rate(len(responses), combined_seconds)}
+
+def bench_http(api, responses, batch_responses, batch_size, workers):
+    client = api.app.test_client()
+
+    def grade_one(text):
+        assert client.post('/api/grade', json={'response': text}).status_code == 200
+
+    def grade_batch(batch):
+        assert client.post('/api/grade/batch', json={'responses': batch}).status_code == 200
+
+    batches = [batch_responses[i:i + batch_size] for i in range(0, len(batch_responses), batch_size)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        started = time.perf_counter()
+        list(pool.map(grade_one, responses))
+        per_request_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        list(pool.map(grade_batch, batches))
+        batch_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        list(pool.map(grade_one, responses))
+        repeat_seconds = time.perf_counter() - started
+    return {
+        "per_request": {"requests": len(responses), "seconds": round(per_request_seconds, 3),
+                        "responses_per_second": rate(len(responses), per_request_seconds)},
+        "batch": {"requests": len(batches), "seconds": round(batch_seconds, 3),
+                  "responses_per_second": rate(len(batch_responses), batch_seconds)},
+        "repeat": {"requests": len(responses), "seconds": round(repeat_seconds, 3),
+                   "responses_per_second": rate(len(responses), repeat_seconds)}
+    }
+
+def run(count=2000, batch_size=100, workers=8, configured_db=False, write_behind=False):
+    api = load_api_app()
+    if not configured_db:
+        import mongomock
+        api.responses_collection = mongomock.MongoClient().db.graded_responses
+    api.ensure_indexes(api.responses_collection)
+    if write_behind:
+        from write_behind import WriteBehindWriter
+        api.write_behind = WriteBehindWriter(api.responses_collection, max_queue=max(10000, 2 * count))
+    responses = synthetic_responses(count)
+    results = {"matcher": bench_matcher(api, responses),
+               **bench_http(api, responses, synthetic_responses(count, seed=1), batch_size, workers)}
+    if write_behind:
+        started = time.perf_counter()
+        api.write_behind.close()
+        results["write_behind"] = {"flush_seconds": round(time.perf_counter() - started, 3),
+                                   "written": api.write_behind.written, "failed": api.write_behind.failed}
+        api.write_behind = None
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--responses", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--configured-db", action="store_true", help="Write to the configured MongoDB")
+    parser.add_argument("--write-behind", action="store_true", help="Queue writes for the background flusher")
+    args = parser.parse_args(argv)
+
+    results = run(args.responses, args.batch_size, args.workers, args.configured_db, args.write_behind)
+    print(f"matcher: legacy {results['matcher']['legacy_per_second']}/s, "
+          f"combined {results['matcher']['combined_per_second']}/s")
+    for name in ("per_request", "batch", "repeat"):
+        result = results[name]
+        print(f"{name}: {result['requests']} requests, {result['responses_per_second']} responses/s")
+    if "write_behind" in results:
+        result = results["write_behind"]
+        print(f"write-behind: {result['written']} written, {result['failed']} failed, "
+              f"final flush {result['flush_seconds']}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from prometheus_client import Gauge, Histogram
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+EVALUATE_JOBS_RUNNING = Gauge('api_evaluate_jobs_running', 'Evaluation jobs being run by this process')
+EVALUATE_JOB_SECONDS = Histogram('api_evaluate_job_seconds', 'Time to run one evaluation job',
+                                 buckets=(1, 5, 15, 30, 60, 120, 300, 600, float('inf')))
+
+def remove_upload(image_path: str) -> None:
+    if image_path and os.path.exists(image_path):
+        os.remove(image_path)
+
+class JobStore:
+    """
+    Evaluation jobs in a single SQLite file, so queued and finished jobs
+    survive restarts and can be shared by several API processes.
+
+    A worker claims a job by leasing it for `lease_seconds` and renews the
+    lease while it runs. A job whose lease ran out (its worker died mid-run)
+    is claimed again, up to `max_attempts` runs in all, after which it is
+    marked failed and its image deleted. A claim is identified by the job's
+    attempt number: only the latest claim can renew or finish the job.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 900, max_attempts: int = 3):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Autocommit, with explicit transactions where a read and a write must be atomic
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                   id TEXT PRIMARY KEY,
+                   status TEXT NOT NULL,
+                   image_path TEXT NOT NULL,
+                   problem_description TEXT NOT NULL,
+                   attempts INTEGER NOT NULL DEFAULT 0,
+                   lease_until REAL,
+                   result TEXT,
+                   error TEXT,
+                   created_at REAL NOT NULL,
+                   started_at REAL,
+                   finished_at REAL
+               )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+
+    def create(self, image_path: str, problem_description: str) -> str:
+        """Queue a job; returns its id."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, image_path, problem_description, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, QUEUED, image_path, problem_description, time.time()),
+            )
+        return job_id
+
+    def claim(self):
+        """
+        Lease the oldest runnable job (queued, or running with an expired
+        lease) and return it as a dict, or None when there is none.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                abandoned = self._conn.execute(
+                    "SELECT image_path FROM jobs WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                    (RUNNING, now, self.max_attempts),
+                ).fetchall()
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, lease_until = NULL, finished_at = ? "
+                    "WHERE status = ? AND lease_until < ? AND attempts >= ?",
+                    (FAILED, f"Abandoned after {self.max_attempts} attempts", now, RUNNING, now, self.max_attempts),
+                )
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? OR (status = ? AND lease_until < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (QUEUED, RUNNING, now),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_until = ?, started_at = ? WHERE id = ?",
+                        (RUNNING, now + self.lease_seconds, now, row["id"]),
+                    )
+                    row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        for (image_path,) in abandoned:
+            remove_upload(image_path)
+        return dict(row) if row is not None else None
+
+    def renew(self, job_id: str, attempt: int) -> bool:
+        """Extend the lease of claim `attempt`; False when the job is no longer held by it."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND attempts = ? AND status = ?",
+                (time.time() + self.lease_seconds, job_id, attempt, RUNNING),
+            )
+        return cursor.rowcount == 1
+
+    def finish(self, job_id: str, attempt: int, status: str, result: dict = None, error: str = None) -> bool:
+        """Record the outcome of claim `attempt`; False (and nothing recorded) when the job is no longer held by it."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, lease_until = NULL, finished_at = ? "
+                "WHERE id = ? AND attempts = ? AND status = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id, attempt, RUNNING),
+            )
+        return cursor.rowcount == 1
+
+    def get(self, job_id: str):
+        """The job as a dict (its result decoded), or None for an unknown id."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def count(self, status: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class JobRunner:
+    """
+    Runs the jobs of `store` on `workers` background threads, off the request
+    threads. `evaluate(image_path, problem_description)` returns the result
+    dict; a result with an "error" fails the job but is kept. The lease of a
+    running job is renewed every third of the lease time, and the uploaded
+    image is deleted once its job has finished. Workers sleep for up to
+    `poll_interval` seconds between claims and are woken by `notify`, so jobs
+    queued by other processes are picked up too.
+    """
+
+    def __init__(self, store: JobStore, evaluate, workers: int = 2, poll_interval: float = 1.0):
+        self.store = store
+        self.evaluate = evaluate
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._run, name=f'evaluate-worker-{n}', daemon=True) for n in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def notify(self) -> None:
+        """Wake the workers, e.g. after queuing a job."""
+        self._wake.set()
+
+    def close(self) -> None:
+        """Stop the workers once their current jobs are done."""
+        self._stopping.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            job = self.store.claim()
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self.run_job(job)
+
+    def _heartbeat(self, job: dict, done: threading.Event) -> None:
+        interval = max(self.store.lease_seconds / 3, 0.01)
+        while not done.wait(interval):
+            if not self.store.renew(job["id"], job["attempts"]):
+                return
+
+    def run_job(self, job: dict) -> None:
+        EVALUATE_JOBS_RUNNING.inc()
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(job, done), daemon=True)
+        heartbeat.start()
+        try:
+            with EVALUATE_JOB_SECONDS.time():
+                result = self.evaluate(job["image_path"], job["problem_description"])
+            if result.get("error"):
+                outcome = (FAILED, result, result["error"])
+            else:
+                outcome = (DONE, result, None)
+        except Exception as e:
+            outcome = (FAILED, None, str(e))
+        finally:
+            done.set()
+            heartbeat.join()
+            EVALUATE_JOBS_RUNNING.dec()
+        # A job that was claimed again meanwhile belongs to the new claim, image included
+        if self.store.finish(job["id"], job["attempts"], *outcome):
+            remove_upload(job["image_path"])
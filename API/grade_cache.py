@@ -0,0 +1,58 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+def normalize_response(response_text: str) -> str:
+    """
+    The text a grade depends on: line endings unified, outer and trailing
+    whitespace removed. The criteria match words, so this never changes a
+    grade, but it does change format_response's output.
+    """
+    return '\n'.join(line.rstrip() for line in response_text.strip().splitlines())
+
+def content_hash(response_text: str) -> str:
+    return hashlib.sha256(normalize_response(response_text).encode('utf-8')).hexdigest()
+
+def rubric_version(criteria: list) -> str:
+    """
+    Fingerprint of the grading criteria (name, pattern and weight of each),
+    so any change to them gives stored grades a different version.
+    """
+    rubric = [[criterion['name'], criterion['pattern'].pattern, criterion['weight']] for criterion in criteria]
+    return hashlib.sha256(json.dumps(rubric).encode('utf-8')).hexdigest()[:16]
+
+class GradeCache:
+    """
+    In-process LRU of graded responses keyed by (content hash, rubric
+    version), holding the (id, grading result) each repeat submission gets
+    back.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def remember(self, key: tuple, entry: dict) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,198 @@
+import sys
+import os
+
+# Add the API directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import io
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from bench_grading import load_api_app
+from evaluate_jobs import DONE, FAILED, QUEUED, RUNNING, JobRunner, JobStore
+
+api = load_api_app()
+sys.path.append(api.DG_BACKEND)
+import g_eval
+from bench_pipeline import ollama_host
+from fake_ollama import FakeOllama
+
+IMAGE = os.path.join(api.DG_BACKEND, '2.jpg')
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError('timed out')
+        time.sleep(0.01)
+
+class TestJobStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, 'jobs.sqlite3')
+
+    def store(self, **kwargs):
+        store = JobStore(self.path, **kwargs)
+        self.addCleanup(store.close)
+        return store
+
+    def test_jobs_are_claimed_oldest_first_and_survive_a_restart(self):
+        store = self.store()
+        first = store.create('a.png', 'first')
+        second = store.create('b.png', 'second')
+        self.assertEqual(store.claim()['id'], first)
+        store.finish(first, 1, DONE, {'score': 7})
+        store.close()
+
+        reopened = self.store()
+        self.assertEqual(reopened.get(first)['result'], {'score': 7})
+        self.assertEqual(reopened.get(second)['status'], QUEUED)
+        self.assertEqual(reopened.claim()['id'], second)
+        self.assertIsNone(reopened.claim())
+        self.assertIsNone(reopened.get('missing'))
+
+    def test_expired_leases_are_reclaimed_until_attempts_run_out(self):
+        store = self.store(lease_seconds=-1, max_attempts=2)
+        image = os.path.join(self.tmp.name, 'a.png')
+        open(image, 'wb').close()
+        job_id = store.create(image, '')
+        self.assertEqual(store.claim()['attempts'], 1)
+        # The first worker died: its lease has expired, so the job is run again
+        self.assertEqual(store.claim()['id'], job_id)
+        self.assertEqual(store.get(job_id)['attempts'], 2)
+        # The first claim no longer holds the job
+        self.assertFalse(store.renew(job_id, 1))
+        self.assertFalse(store.finish(job_id, 1, DONE, {'score': 1}))
+        self.assertIsNone(store.claim())
+        self.assertEqual(store.get(job_id)['status'], FAILED)
+        self.assertFalse(os.path.exists(image))
+
+class TestJobRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = JobStore(os.path.join(self.tmp.name, 'jobs.sqlite3'))
+        self.addCleanup(self.store.close)
+
+    def image(self, name):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'wb') as f:
+            f.write(b'image')
+        return path
+
+    def test_results_and_failures_are_recorded(self):
+        def evaluate(image_path, problem_description):
+            if problem_description == 'raise':
+                raise RuntimeError('model unavailable')
+            return {'score': 5, 'error': 'no nodes' if problem_description == 'error' else None}
+
+        jobs = {problem: self.store.create(self.image(f'{problem}.png'), problem) for problem in ('ok', 'error', 'raise')}
+        runner = JobRunner(self.store, evaluate, workers=2, poll_interval=0.01)
+        self.addCleanup(runner.close)
+        wait_for(lambda: all(self.store.get(job_id)['status'] in (DONE, FAILED) for job_id in jobs.values()))
+        self.assertEqual(self.store.get(jobs['ok'])['status'], DONE)
+        self.assertEqual(self.store.get(jobs['ok'])['result'], {'score': 5, 'error': None})
+        self.assertEqual((self.store.get(jobs['error'])['status'], self.store.get(jobs['error'])['error']), (FAILED, 'no nodes'))
+        self.assertEqual(self.store.get(jobs['raise'])['error'], 'model unavailable')
+        self.assertFalse(any(name.endswith('.png') for name in os.listdir(self.tmp.name)))
+
+    def test_leases_are_renewed_while_a_job_runs(self):
+        store = JobStore(os.path.join(self.tmp.name, 'leased.sqlite3'), lease_seconds=0.1)
+        self.addCleanup(store.close)
+        image = self.image('slow.png')
+        job_id = store.create(image, '')
+        seen = []
+
+        def evaluate(image_path, problem_description):
+            # Runs for several lease periods while a second worker keeps claiming
+            time.sleep(0.5)
+            seen.append(os.path.exists(image_path))
+            return {'score': 1, 'error': None}
+
+        runner = JobRunner(store, evaluate, workers=2, poll_interval=0.01)
+        self.addCleanup(runner.close)
+        wait_for(lambda: store.get(job_id)['status'] == DONE)
+        self.assertEqual(store.get(job_id)['attempts'], 1)
+        self.assertEqual(seen, [True])
+        self.assertFalse(os.path.exists(image))
+
+class TestEvaluateEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.store = JobStore(os.path.join(self.tmp.name, 'jobs.sqlite3'))
+        self.addCleanup(self.store.close)
+        patcher = patch.object(api, 'JOBS_DIR', self.tmp.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = api.app.test_client()
+
+    def runner(self, evaluate):
+        runner = JobRunner(self.store, evaluate, workers=1, poll_interval=0.01)
+        self.addCleanup(runner.close)
+        patcher = patch.object(api, '_job_runner', runner)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return runner
+
+    def post_image(self, name='flowchart.jpg', data=b'image', **form):
+        return self.client.post('/api/evaluate', data={'image': (io.BytesIO(data), name), **form},
+                                content_type='multipart/form-data')
+
+    def status(self, job_id):
+        return self.client.get(f'/api/evaluate/{job_id}').get_json()
+
+    def test_evaluation_is_queued_and_polled_to_completion(self):
+        release = threading.Event()
+
+        def evaluate(image_path, problem_description):
+            release.wait(10)
+            return {'score': 80, 'problem': problem_description, 'error': None}
+
+        self.runner(evaluate)
+        response = self.post_image(problem_description='swap two numbers')
+        self.assertEqual(response.status_code, 202)
+        job_id = response.get_json()['id']
+        self.assertEqual(response.headers['Location'], f'/api/evaluate/{job_id}')
+        wait_for(lambda: self.status(job_id)['status'] == RUNNING)
+        release.set()
+        wait_for(lambda: self.status(job_id)['status'] == DONE)
+        self.assertEqual(self.status(job_id)['result']['problem'], 'swap two numbers')
+
+    def test_invalid_requests_are_rejected(self):
+        self.runner(lambda image_path, problem_description: {})
+        self.assertEqual(self.client.post('/api/evaluate', data={}).status_code, 400)
+        self.assertEqual(self.post_image('flowchart.gif').status_code, 400)
+        with patch.dict(api.app.config, {'MAX_CONTENT_LENGTH': 10}):
+            response = self.post_image(data=b'x' * 100)
+        self.assertEqual(response.status_code, 413)
+        self.assertIn('error', response.get_json())
+        self.assertEqual(self.store.count(QUEUED), 0)
+        with patch.object(api, 'MAX_QUEUED_JOBS', 0):
+            self.assertEqual(self.post_image().status_code, 503)
+        self.assertEqual(self.client.get('/api/evaluate/missing').status_code, 404)
+
+    def test_metrics_include_the_pipeline_stages(self):
+        body = self.client.get('/metrics').get_data(as_text=True)
+        for name in ('g_eval_stage_seconds', 'api_evaluate_job_seconds', 'api_grade_seconds'):
+            self.assertIn(f'# TYPE {name} histogram', body)
+
+    def test_the_pipeline_runs_against_a_fake_model_server(self):
+        self.runner(api.run_pipeline)
+        with open(IMAGE, 'rb') as f:
+            data = f.read()
+        with FakeOllama() as fake, ollama_host(fake.url), patch.object(g_eval.Config, 'CACHE_ENABLED', False):
+            job_id = self.post_image(data=data, problem_description='Swap A and B').get_json()['id']
+            wait_for(lambda: self.status(job_id)['status'] in (DONE, FAILED), timeout=30)
+        job = self.status(job_id)
+        self.assertEqual(job['status'], DONE, job['error'])
+        self.assertEqual(len(job['result']['flowchart_json']['nodes']), 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import sys
+import os
+
+# Add the API directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import json
+import re
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+import mongomock
+from bench_grading import legacy_calculate_score, load_api_app, synthetic_responses
+from grade_cache import GradeCache, content_hash
+
+api = load_api_app()
+
+def legacy_format_response(response_text):
+    formatted = re.sub(r'\*\s*(.*?)\n', r'<li>\1</li>', response_text)
+    formatted = f'<ul>{formatted}</ul>'
+    for phrase in ['Read:', 'If', 'Result =', 'Beg =', 'End =', 'Mid =']:
+        formatted = formatted.replace(phrase, f'<strong>{phrase}</strong>')
+    return formatted
+
+class TestCriteriaMatcher(unittest.TestCase):
+
+    def test_matches_the_per_criterion_search(self):
+        texts = synthetic_responses(200, words=15, seed=1) + [
+            "", "START with a Loop", "PRINT the Result", "nothing relevant here",
+            "Correct Algorithm: declare, repeat, display", "forend", "endwhile output"
+        ]
+        for text in texts:
+            score, matched = legacy_calculate_score(api, text)
+            result = api.calculate_score(text)
+            self.assertEqual((result['score'], result['matched_criteria']), (score, matched), text)
+
+    def test_criteria_the_combined_pattern_cannot_match_are_rejected(self):
+        api.check_criteria([{'name': 'escapes', 'pattern': re.compile(r'\S+\s(end|stop)\b', re.IGNORECASE), 'weight': 1}])
+        for pattern in (re.compile(r'(Print|display)', re.IGNORECASE), re.compile(r'begin.*end', re.DOTALL)):
+            with self.assertRaises(ValueError):
+                api.check_criteria([{'name': 'bad', 'pattern': pattern, 'weight': 1}])
+
+    def test_format_response_matches_the_replace_passes(self):
+        text = "* Read: A\n* If A > B\n* Result = A\nEnd = done, Beg = 0, Mid = 1\n"
+        self.assertEqual(api.format_response(text, []), legacy_format_response(text))
+
+class TestBatchEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = mongomock.MongoClient().db.graded_responses
+        patcher = patch.object(api, 'responses_collection', self.collection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        api.ensure_indexes(self.collection)
+        api.grade_cache.clear()
+        self.client = api.app.test_client()
+
+    def test_batch_is_graded_and_stored_with_one_write(self):
+        texts = ["start, loop until done, print the result", "declare a variable"]
+        with patch.object(self.collection, 'insert_many', wraps=self.collection.insert_many) as insert_many:
+            response = self.client.post('/api/grade/batch', json={'responses': texts})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(insert_many.call_count, 1)
+        body = response.get_json()
+        self.assertEqual(body['count'], 2)
+        self.assertEqual([result['score'] for result in body['results']],
+                         [api.calculate_score(text)['score'] for text in texts])
+        stored = {str(doc['_id']): doc['response_text'] for doc in self.collection.find()}
+        self.assertEqual([stored[result['id']] for result in body['results']], texts)
+
+    def test_invalid_batches_are_rejected(self):
+        self.assertEqual(self.client.post('/api/grade/batch', json={'responses': []}).status_code, 400)
+        response = self.client.post('/api/grade/batch', json={'responses': ["ok", "", 3]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()['invalid_indexes'], [1, 2])
+        with patch.object(api, 'MAX_BATCH_SIZE', 2):
+            self.assertEqual(self.client.post('/api/grade/batch', json={'responses': ["a", "b", "c"]}).status_code, 413)
+        self.assertEqual(self.collection.count_documents({}), 0)
+
+class TestRepeatSubmissions(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = mongomock.MongoClient().db.graded_responses
+        patcher = patch.object(api, 'responses_collection', self.collection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        api.ensure_indexes(self.collection)
+        api.grade_cache.clear()
+        self.client = api.app.test_client()
+
+    def grade(self, text):
+        return self.client.post('/api/grade', json={'response': text}).get_json()
+
+    def test_repeats_return_the_stored_grade_without_regrading(self):
+        with patch.object(api, 'calculate_score', wraps=api.calculate_score) as calculate_score:
+            first = self.grade("start the loop\nprint the result")
+            repeat = self.grade("  start the loop  \r\nprint the result\n")
+            self.assertEqual((repeat['id'], repeat['score'], repeat['matched_criteria']),
+                             (first['id'], first['score'], first['matched_criteria']))
+            api.grade_cache.clear()
+            self.assertEqual(self.grade("start the loop\nprint the result"), first)
+        self.assertEqual(calculate_score.call_count, 1)
+        self.assertEqual(self.collection.count_documents({}), 1)
+
+    def test_repeats_are_formatted_from_the_submitted_text(self):
+        # Same content hash, but only the first ends its list item with the newline LIST_ITEM needs
+        texts = ["* Read: A\n", "* Read: A"]
+        expected = [api.format_response(text, []) for text in texts]
+        self.assertNotEqual(expected[0], expected[1])
+        results = self.client.post('/api/grade/batch', json={'responses': texts}).get_json()['results']
+        self.assertEqual(results[0]['id'], results[1]['id'])
+        self.assertEqual([result['formatted_response'] for result in results], expected)
+        self.assertEqual([self.grade(text)['formatted_response'] for text in reversed(texts)], expected[::-1])
+        api.grade_cache.clear()
+        self.assertEqual([self.grade(text)['formatted_response'] for text in reversed(texts)], expected[::-1])
+
+    def test_requests_do_not_create_indexes(self):
+        with patch.object(self.collection, 'create_index') as create_index:
+            self.grade("declare a variable")
+            self.client.get('/api/grade/responses')
+        create_index.assert_not_called()
+        self.assertIn('content_hash_rubric', self.collection.index_information())
+
+    def test_rubric_change_regrades(self):
+        first = self.grade("declare a variable")
+        with patch.object(api, 'RUBRIC_VERSION', 'next'):
+            second = self.grade("declare a variable")
+        self.assertNotEqual(second['id'], first['id'])
+        self.assertEqual(sorted(doc['rubric_version'] for doc in self.collection.find()), sorted(['next', api.RUBRIC_VERSION]))
+
+    def test_batch_stores_only_new_texts_once(self):
+        stored = self.grade("print it")
+        with patch.object(self.collection, 'insert_many', wraps=self.collection.insert_many) as insert_many:
+            body = self.client.post('/api/grade/batch', json={'responses': ["loop", "print it", "loop", "end"]}).get_json()
+        self.assertEqual(len(insert_many.call_args.args[0]), 2)
+        ids = [result['id'] for result in body['results']]
+        self.assertEqual(ids[1], stored['id'])
+        self.assertEqual(ids[0], ids[2])
+        self.assertEqual(self.collection.count_documents({}), 3)
+
+    def test_concurrently_stored_duplicate_returns_the_stored_id(self):
+        existing = self.collection.insert_one(api.response_document("end", api.calculate_score("end"))).inserted_id
+        document = api.response_document("end", api.calculate_score("end"))
+        self.assertEqual(api.store_responses([document]), [existing])
+        self.assertEqual(api.store_responses([api.response_document("begin", api.calculate_score("begin")),
+                                              api.response_document("end", api.calculate_score("end"))])[1], existing)
+
+    def test_cache_evicts_the_least_recently_used(self):
+        cache = GradeCache(max_entries=2)
+        cache.remember('a', {'id': 'a'})
+        cache.remember('b', {'id': 'b'})
+        cache.get('a')
+        cache.remember('c', {'id': 'c'})
+        self.assertEqual([cache.get(key) for key in 'abc'], [{'id': 'a'}, None, {'id': 'c'}])
+        self.assertEqual(content_hash("x \r\ny\n"), content_hash("x\ny"))
+
+class TestListResponses(unittest.TestCase):
+
+    def setUp(self):
+        self.collection = mongomock.MongoClient().db.graded_responses
+        patcher = patch.object(api, 'responses_collection', self.collection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        api.ensure_indexes(self.collection)
+        self.client = api.app.test_client()
+        # Pairs of responses share a timestamp, so pages must break ties on _id
+        start = datetime(2025, 1, 1)
+        self.collection.insert_many([
+            {**api.response_document(f'response {n}', api.calculate_score('')), 'timestamp': start + timedelta(seconds=n // 2)}
+            for n in range(25)
+        ])
+        self.newest_first = [str(doc['_id']) for doc in self.collection.find().sort([('timestamp', -1), ('_id', -1)])]
+
+    def test_pages_walk_every_response_once_newest_first(self):
+        ids, cursor, pages = [], None, 0
+        while True:
+            response = self.client.get('/api/grade/responses', query_string={'limit': 7, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            page = response.get_json()
+            self.assertTrue(all('response_text' not in item for item in page))
+            ids += [item['id'] for item in page]
+            pages += 1
+            cursor = response.headers.get('X-Next-Cursor')
+            if cursor is None:
+                break
+        self.assertEqual(pages, 4)
+        self.assertEqual(ids, self.newest_first)
+        self.assertIn('timestamp_id', self.collection.index_information())
+
+    def test_text_is_included_on_request(self):
+        page = self.client.get('/api/grade/responses?limit=1&include_text=true').get_json()
+        self.assertEqual(page[0]['response_text'], 'response 24')
+
+    def test_ndjson_streams_everything_after_the_cursor(self):
+        cursor = self.client.get('/api/grade/responses?limit=5').headers['X-Next-Cursor']
+        response = self.client.get('/api/grade/responses', query_string={'format': 'ndjson', 'cursor': cursor})
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([line['id'] for line in lines], self.newest_first[5:])
+
+    def test_invalid_parameters_are_rejected(self):
+        for query in ('limit=0', 'limit=100000', 'limit=ten', 'cursor=not-a-cursor'):
+            self.assertEqual(self.client.get(f'/api/grade/responses?{query}').status_code, 400, query)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+import sys
+import os
+
+# Add the API directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import threading
+import time
+import unittest
+from unittest.mock import patch
+import mongomock
+from pymongo.errors import BulkWriteError
+from bench_grading import load_api_app
+from write_behind import WriteBehindFull, WriteBehindWriter
+
+api = load_api_app()
+
+class RecordingCollection:
+    """Wraps a mongomock collection, recording insert_many batch sizes and optionally blocking or failing."""
+
+    def __init__(self, fail_first=False):
+        self.collection = mongomock.MongoClient().db.graded_responses
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+        self.fail_first = fail_first
+
+    def insert_many(self, documents, ordered=True):
+        self.release.wait()
+        if self.fail_first:
+            # The first document is inserted, the second fails with a transient error
+            self.fail_first = False
+            self.collection.insert_one(documents[0])
+            raise BulkWriteError({'writeErrors': [{'index': 1, 'code': 91, 'errmsg': 'shutting down'}]})
+        self.batches.append(len(documents))
+        return self.collection.insert_many(documents, ordered=ordered)
+
+    def find(self, *args, **kwargs):
+        return self.collection.find(*args, **kwargs)
+
+    def find_one(self, *args, **kwargs):
+        return self.collection.find_one(*args, **kwargs)
+
+class TestWriteBehindWriter(unittest.TestCase):
+
+    def writer(self, collection, **kwargs):
+        writer = WriteBehindWriter(collection, **kwargs)
+        self.addCleanup(writer.close)
+        return writer
+
+    def test_batches_flush_by_size_and_by_time(self):
+        collection = RecordingCollection()
+        writer = self.writer(collection, batch_size=3, flush_interval=0.05)
+        ids = writer.submit_many([{'n': n} for n in range(3)]) + [writer.submit({'n': 3})]
+        writer.flush()
+        self.assertEqual(collection.batches, [3, 1])
+        self.assertEqual([doc['_id'] for doc in collection.collection.find().sort('n')], ids)
+
+    def test_full_queue_applies_backpressure_all_or_nothing(self):
+        collection = RecordingCollection()
+        collection.release.clear()
+        writer = self.writer(collection, max_queue=3, batch_size=1, flush_interval=0.01, put_timeout=0.05)
+        writer.submit_many([{'n': 0}, {'n': 1}])
+        with self.assertRaises(WriteBehindFull):
+            writer.submit_many([{'n': 2}, {'n': 3}])
+        writer.submit({'n': 4})
+        started = time.monotonic()
+        with self.assertRaises(WriteBehindFull):
+            writer.submit({'n': 5})
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+        collection.release.set()
+        writer.flush()
+        self.assertEqual(sorted(doc['n'] for doc in collection.collection.find()), [0, 1, 4])
+
+    def test_close_flushes_pending_documents(self):
+        collection = RecordingCollection()
+        writer = WriteBehindWriter(collection, batch_size=100, flush_interval=10)
+        writer.submit_many([{'n': n} for n in range(5)])
+        started = time.monotonic()
+        writer.close()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(collection.collection.count_documents({}), 5)
+        with self.assertRaises(RuntimeError):
+            writer.submit({'n': 5})
+
+    def test_partially_failed_batch_retries_only_the_failed_documents(self):
+        collection = RecordingCollection(fail_first=True)
+        writer = self.writer(collection, batch_size=2, flush_interval=0.01)
+        writer.submit_many([{'n': 0}, {'n': 1}])
+        writer.flush()
+        self.assertEqual(collection.batches, [1])
+        self.assertEqual(writer.written, 2)
+        self.assertEqual(collection.collection.count_documents({}), 2)
+
+class TestWriteBehindEndpoints(unittest.TestCase):
+
+    def setUp(self):
+        api.grade_cache.clear()
+        self.collection = mongomock.MongoClient().db.graded_responses
+        patcher = patch.object(api, 'responses_collection', self.collection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        api.ensure_indexes(self.collection)
+
+    def test_grade_returns_the_pre_generated_id(self):
+        collection = self.collection
+        writer = WriteBehindWriter(collection, flush_interval=0.01)
+        self.addCleanup(writer.close)
+        client = api.app.test_client()
+        with patch.object(api, 'write_behind', writer):
+            single = client.post('/api/grade', json={'response': 'start the loop'}).get_json()
+            batch = client.post('/api/grade/batch', json={'responses': ['print it', 'declare x']}).get_json()
+        writer.flush()
+        stored = {str(doc['_id']) for doc in collection.find()}
+        self.assertEqual(stored, {single['id'], *(result['id'] for result in batch['results'])})
+
+    def test_full_queue_returns_503(self):
+        collection = RecordingCollection()
+        collection.release.clear()
+        writer = WriteBehindWriter(collection, max_queue=1, put_timeout=0.01)
+        with patch.object(api, 'write_behind', writer):
+            response = api.app.test_client().post('/api/grade/batch', json={'responses': ['a', 'b']})
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        collection.release.set()
+        writer.close()
+
+class TestWriteBehindWithGradeCache(unittest.TestCase):
+
+    def setUp(self):
+        api.grade_cache.clear()
+        self.recording = RecordingCollection()
+        self.collection = self.recording.collection
+        patcher = patch.object(api, 'responses_collection', self.collection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        api.ensure_indexes(self.collection)
+        self.writer = WriteBehindWriter(self.recording, flush_interval=0.01, unique_fields=api.DEDUP_FIELDS,
+                                        on_duplicate=api.remember_stored_grade)
+        self.addCleanup(self.writer.close)
+        patcher = patch.object(api, 'write_behind', self.writer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = api.app.test_client()
+
+    def grade(self, text):
+        return self.client.post('/api/grade', json={'response': text}).get_json()['id']
+
+    def test_repeat_of_a_queued_response_gets_the_queued_id(self):
+        self.recording.release.clear()
+        first = self.grade("start the loop")
+        # Evicted from the LRU before the first copy is written
+        api.grade_cache.clear()
+        self.assertEqual(self.grade("start the loop"), first)
+        self.recording.release.set()
+        self.writer.flush()
+        self.assertEqual([str(doc['_id']) for doc in self.collection.find()], [first])
+
+    def test_response_stored_first_by_another_writer_is_not_stored_again(self):
+        self.recording.release.clear()
+        self.grade("print the result")
+        # Another worker stores the same response before this one flushes
+        other = self.collection.insert_one(api.response_document("print the result", api.calculate_score("print the result")))
+        self.recording.release.set()
+        self.writer.flush()
+        self.assertEqual([doc['_id'] for doc in self.collection.find()], [other.inserted_id])
+        self.assertEqual((self.writer.written, self.writer.duplicates, self.writer.failed), (0, 1, 0))
+        # Repeats now get the stored copy's id
+        self.assertEqual(self.grade("print the result"), str(other.inserted_id))
+
+if __name__ == '__main__':
+    unittest.main()
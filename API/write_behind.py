@@ -0,0 +1,225 @@
+import atexit
+import queue
+import threading
+import time
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+from prometheus_client import Counter, Gauge, Histogram
+
+DUPLICATE_KEY = 11000
+# Queued by close() to wake the flusher for its last batch
+_STOP = object()
+
+WRITE_BEHIND_QUEUED = Gauge('api_write_behind_queued', 'Documents waiting to be written')
+WRITE_BEHIND_FLUSH_SECONDS = Histogram('api_write_behind_flush_seconds', 'Time of each insert_many flush')
+WRITE_BEHIND_WRITTEN = Counter('api_write_behind_written_total', 'Documents written by the flusher')
+WRITE_BEHIND_FAILED = Counter('api_write_behind_failed_total', 'Documents dropped after every insert attempt failed')
+WRITE_BEHIND_DUPLICATES = Counter('api_write_behind_duplicates_total',
+                                  'Documents whose unique fields another writer stored first')
+
+class WriteBehindFull(Exception):
+    """The write-behind queue stayed full for the whole put timeout."""
+
+class WriteBehindWriter:
+    """
+    Buffers documents in a bounded queue and writes them to `collection` from
+    a background thread with insert_many. A batch is flushed once it holds
+    `batch_size` documents or `flush_interval` seconds after its first
+    document arrived. Document ids are generated here, so callers can return
+    them before the write happens. At most `max_queue` documents wait at once;
+    when there is no room, `submit` blocks for up to `put_timeout` seconds
+    and then raises WriteBehindFull. A failed batch is retried `retries`
+    times before its documents are dropped and counted. Pending documents are
+    flushed by `close`, which also runs at interpreter exit.
+
+    `unique_fields` are the fields of a unique index on the collection. A
+    document with the same values as one still queued is not queued again:
+    it gets the queued document's id. One whose values another writer stored
+    first is not written at all; `on_duplicate(document, stored_id)` is
+    called with the id of the stored one, so later lookups can be pointed at
+    it (the id the document was queued with is never stored).
+    """
+
+    def __init__(self, collection, max_queue: int = 10000, batch_size: int = 500, flush_interval: float = 0.5,
+                 put_timeout: float = 2.0, retries: int = 3, unique_fields: tuple = (), on_duplicate=None):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self.unique_fields = tuple(unique_fields)
+        self.on_duplicate = on_duplicate
+        self.written = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.max_queue = max_queue
+        self._queue = queue.Queue()
+        self._pending = 0
+        # Unique field values of the queued documents, to the id they were queued with
+        self._queued_ids = {}
+        self._space = threading.Condition()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, document: dict) -> ObjectId:
+        """Queue one document for writing; returns its id."""
+        return self.submit_many([document])[0]
+
+    def submit_many(self, documents: list) -> list:
+        """
+        Queue documents for writing, in order; returns their ids. All of them
+        are queued or, when there is no room for all of them, none are.
+        """
+        if self._stopping.is_set():
+            raise RuntimeError('Write-behind writer is closed')
+        ids = []
+        with self._space:
+            if not self._space.wait_for(lambda: self._pending + len(documents) <= self.max_queue, self.put_timeout):
+                raise WriteBehindFull(f'no room for {len(documents)} documents ({self._pending} queued)')
+            queued = 0
+            for document in documents:
+                key = self._unique_key(document)
+                if key in self._queued_ids:
+                    ids.append(self._queued_ids[key])
+                    continue
+                document.setdefault('_id', ObjectId())
+                if key is not None:
+                    self._queued_ids[key] = document['_id']
+                self._queue.put(document)
+                ids.append(document['_id'])
+                queued += 1
+            self._pending += queued
+        WRITE_BEHIND_QUEUED.inc(queued)
+        return ids
+
+    def flush(self) -> None:
+        """Block until every document queued so far has been written (or dropped)."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Flush what is queued and stop the background thread."""
+        if self._stopping.is_set():
+            return
+        self._stopping.set()
+        self._queue.put(_STOP)
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _next_batch(self) -> tuple:
+        """The next batch to write and whether the writer is stopping."""
+        try:
+            item = self._queue.get(timeout=self.flush_interval)
+        except queue.Empty:
+            return [], False
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while item is not _STOP:
+            batch.append(item)
+            if len(batch) >= self.batch_size:
+                return batch, False
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return batch, False
+        self._queue.task_done()
+        # Stopping: take whatever is still queued with this last batch
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return batch, True
+            if item is _STOP:
+                self._queue.task_done()
+            else:
+                batch.append(item)
+
+    def _unique_key(self, document: dict):
+        if not self.unique_fields or any(field not in document for field in self.unique_fields):
+            return None
+        return tuple(document[field] for field in self.unique_fields)
+
+    def _written(self, count: int) -> None:
+        self.written += count
+        WRITE_BEHIND_WRITTEN.inc(count)
+
+    def _unwritten(self, batch: list, error: BulkWriteError) -> list:
+        """
+        The documents of a partially failed unordered insert_many that still
+        need writing. A duplicate key on an `_id` that is stored means an
+        earlier attempt inserted the document; any other duplicate key is on
+        `unique_fields`, and the document is dropped in favour of the stored
+        one.
+        """
+        failed = [(batch[write_error['index']], write_error.get('code')) for write_error in error.details.get('writeErrors', [])]
+        duplicates = [document['_id'] for document, code in failed if code == DUPLICATE_KEY]
+        stored = set()
+        if duplicates:
+            stored = {document['_id'] for document in self.collection.find({'_id': {'$in': duplicates}}, {'_id': 1})}
+        retry = []
+        dropped = 0
+        for document, code in failed:
+            if code == DUPLICATE_KEY and document['_id'] not in stored:
+                key = self._unique_key(document)
+                existing = None
+                if key is not None:
+                    existing = self.collection.find_one(dict(zip(self.unique_fields, key)), {'_id': 1})
+                if existing is None:
+                    # The stored copy is gone again; write this one after all
+                    retry.append(document)
+                    continue
+                dropped += 1
+                self.duplicates += 1
+                WRITE_BEHIND_DUPLICATES.inc()
+                if self.on_duplicate is not None:
+                    self.on_duplicate(document, existing['_id'])
+            elif code != DUPLICATE_KEY:
+                retry.append(document)
+        self._written(len(batch) - len(retry) - dropped)
+        return retry
+
+    def _write(self, batch: list) -> None:
+        for attempt in range(self.retries + 1):
+            try:
+                with WRITE_BEHIND_FLUSH_SECONDS.time():
+                    self.collection.insert_many(batch, ordered=False)
+                self._written(len(batch))
+                return
+            except Exception as e:
+                error = e
+            if isinstance(error, BulkWriteError):
+                try:
+                    batch = self._unwritten(batch, error)
+                except Exception as e:
+                    # The whole batch is retried; what was inserted shows up as stored duplicates
+                    error = e
+                else:
+                    if not batch:
+                        return
+            if attempt == self.retries:
+                print(f'Write-behind dropped {len(batch)} documents: {error}')
+                self.failed += len(batch)
+                WRITE_BEHIND_FAILED.inc(len(batch))
+                return
+            time.sleep(min(2.0, 0.1 * 2 ** attempt))
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch, stopping = self._next_batch()
+            if not batch:
+                continue
+            keys = [self._unique_key(document) for document in batch]
+            try:
+                self._write(batch)
+            finally:
+                WRITE_BEHIND_QUEUED.dec(len(batch))
+                with self._space:
+                    self._pending -= len(batch)
+                    for key in keys:
+                        self._queued_ids.pop(key, None)
+                    self._space.notify_all()
+                for _ in batch:
+                    self._queue.task_done()
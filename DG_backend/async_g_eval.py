@@ -0,0 +1,443 @@
+import asyncio
+import atexit
+import threading
+import time
+import ollama
+from json_stream import IncrementalJSONScanner, INVALID, PENDING
+from node_rules import merge_llm_classification, split_nodes
+from metrics import Timings, record_evaluation, record_llm_call, record_retry, stage, track_timings
+from prompt_templates import CLASSIFICATION_TEMPLATE, prompt_token_estimate
+from packed_classification import pack_groups, packed_nodes, split_packed_response
+from g_eval import (
+    Config,
+    CLASSIFICATION_OPTIONS,
+    CLASSIFICATION_SCHEMA,
+    CLASSIFICATION_SHAPE,
+    EXTRACTION_SCHEMA,
+    EXTRACTION_SHAPE,
+    VALID_NODE_TYPES,
+    apply_classification,
+    apply_logic_tests,
+    classification_cache_key,
+    extraction_attempts,
+    extraction_cache_key,
+    extraction_messages,
+    extract_flowchart_json_with_attempt,
+    get_stage_cache,
+    is_extraction_valid,
+    new_result,
+    node_type_memo,
+    parse_classification_response,
+    parse_extraction_response,
+    prepare_image_for_eval,
+    response_format,
+    validate_image_path,
+)
+
+class AsyncLLM:
+    """
+    Asyncio Ollama client with a per-model concurrency limit.
+
+    `concurrency` maps a model name to the number of requests that may be in
+    flight for it at once; models without an entry use `default_concurrency`.
+    `keep_alive` (e.g. "30m") is sent with every request so Ollama keeps the
+    model resident between calls. `calls` counts requests per model and
+    `model_switches` counts calls that went to a different model than the call
+    before them, each a potential unload/load.
+    """
+
+    def __init__(self, concurrency: dict = None, default_concurrency: int = 1, host: str = None, client=None,
+                 keep_alive=None):
+        self.client = client or ollama.AsyncClient(host=host)
+        self.concurrency = dict(concurrency or {})
+        self.default_concurrency = default_concurrency
+        self.keep_alive = keep_alive
+        self.calls = {}
+        self.model_switches = 0
+        self._last_model = None
+        self._semaphores = {}
+
+    def limit_for(self, model: str) -> int:
+        return max(1, int(self.concurrency.get(model, self.default_concurrency)))
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._semaphores:
+            self._semaphores[model] = asyncio.Semaphore(self.limit_for(model))
+        return self._semaphores[model]
+
+    def _start_call(self, model: str, kwargs: dict) -> dict:
+        self.calls[model] = self.calls.get(model, 0) + 1
+        if self._last_model is not None and self._last_model != model:
+            self.model_switches += 1
+        self._last_model = model
+        if self.keep_alive is not None:
+            kwargs.setdefault("keep_alive", self.keep_alive)
+        return kwargs
+
+    async def aclose(self) -> None:
+        """Close the HTTP connection pool of the Ollama client."""
+        http_client = getattr(self.client, "_client", None)
+        if http_client is not None:
+            await http_client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def preload(self, model: str) -> None:
+        """Load `model` without generating anything, so the first real request does not pay the load time."""
+        kwargs = {"keep_alive": self.keep_alive} if self.keep_alive is not None else {}
+        async with self._semaphore(model):
+            await self.client.generate(model=model, **kwargs)
+        self._last_model = model
+
+    async def chat(self, model: str, messages: list, **kwargs):
+        async with self._semaphore(model):
+            return await self.client.chat(model=model, messages=messages, **self._start_call(model, kwargs))
+
+    async def chat_content(self, model: str, messages: list, options: dict, shape: dict, schema: dict = None) -> tuple:
+        """
+        Async counterpart of `g_eval.chat_content`; the model slot is held until the stream is closed.
+        The recorded call time starts once the slot is acquired, so it excludes queueing.
+        """
+        output_format = response_format(schema)
+        if not Config.STREAM_RESPONSES:
+            async with self._semaphore(model):
+                started = time.perf_counter()
+                kwargs = self._start_call(model, {"options": options, "format": output_format})
+                response = await self.client.chat(model=model, messages=messages, **kwargs)
+            record_llm_call(model, time.perf_counter() - started, response, prompt_token_estimate(messages))
+            return response['message']['content'], response
+        scanner = IncrementalJSONScanner(**shape)
+        last = None
+        async with self._semaphore(model):
+            started = time.perf_counter()
+            kwargs = self._start_call(model, {"options": options, "format": output_format, "stream": True})
+            stream = await self.client.chat(model=model, messages=messages, **kwargs)
+            try:
+                async for chunk in stream:
+                    last = chunk
+                    if scanner.feed(chunk['message']['content']) != PENDING:
+                        break
+            finally:
+                await stream.aclose()
+        record_llm_call(model, time.perf_counter() - started, last, prompt_token_estimate(messages))
+        if scanner.state == INVALID:
+            print(f"Stopped streamed response from {model} early: {scanner.reason}")
+            return scanner.text, last
+        return scanner.json_text, last
+
+# -------------------------
+# Async Pipeline Stages
+# -------------------------
+async def extract_flowchart_json_with_attempt_async(llm: AsyncLLM, image, max_attempts: int = 3) -> tuple:
+    """Async counterpart of `extract_flowchart_json_with_attempt`."""
+    extracted = None
+    for attempt, (current_temp, current_seed) in enumerate(extraction_attempts(max_attempts)):
+        if attempt > 0:
+            record_retry()
+        content, _ = await llm.chat_content(
+            Config.EXTRACTION_MODEL,
+            extraction_messages(image),
+            {'temperature': current_temp, 'seed': current_seed},
+            EXTRACTION_SHAPE,
+            EXTRACTION_SCHEMA
+        )
+        extracted = parse_extraction_response(content)
+        if extracted and is_extraction_valid(extracted):
+            print(f"Extraction succeeded on attempt {attempt+1} with temperature {current_temp}")
+            return extracted, attempt + 1
+        print(f"Extraction attempt {attempt+1} failed validation. Retrying with increased temperature.")
+    return extracted, None
+
+async def extract_flowchart_json_speculative(llm: AsyncLLM, image, max_attempts: int = 3) -> tuple:
+    """
+    Send every retry configuration at once and accept the first response that
+    passes `is_extraction_valid`. The remaining requests are cancelled, which
+    closes their connections so Ollama stops generating for them.
+    Returns the extraction and the 1-based attempt that won; when no attempt is
+    valid it falls back like the sequential path, to the last attempt's output.
+    Attempts still queue behind the extraction model's concurrency limit, so
+    with a limit of one this degrades to the sequential order.
+    """
+    async def run_attempt(index, temperature, seed):
+        content, _ = await llm.chat_content(
+            Config.EXTRACTION_MODEL,
+            extraction_messages(image),
+            {'temperature': temperature, 'seed': seed},
+            EXTRACTION_SHAPE,
+            EXTRACTION_SCHEMA
+        )
+        return index, parse_extraction_response(content)
+
+    tasks = [
+        asyncio.create_task(run_attempt(index, temperature, seed))
+        for index, (temperature, seed) in enumerate(extraction_attempts(max_attempts))
+    ]
+    extractions = {}
+    errors = []
+    try:
+        for finished in asyncio.as_completed(tasks):
+            try:
+                index, extracted = await finished
+            except Exception as e:
+                errors.append(e)
+                continue
+            if extracted and is_extraction_valid(extracted):
+                print(f"Speculative extraction accepted attempt {index+1} of {len(tasks)}")
+                return extracted, index + 1
+            extractions[index] = extracted
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if not extractions and errors:
+        raise errors[0]
+    print(f"Speculative extraction: none of {len(tasks)} attempts passed validation.")
+    return extractions.get(len(tasks) - 1), None
+
+_speculative_loop = None
+_speculative_llm = None
+_speculative_lock = threading.Lock()
+
+def _speculative_runner() -> tuple:
+    """
+    The event loop thread and AsyncLLM shared by every blocking speculative
+    extraction, started on first use, so the client's connection pool is
+    reused across images and threads instead of being built for each one.
+    """
+    global _speculative_loop, _speculative_llm
+    with _speculative_lock:
+        if _speculative_loop is None:
+            _speculative_loop = asyncio.new_event_loop()
+            threading.Thread(target=_speculative_loop.run_forever, name="speculative-extraction", daemon=True).start()
+            _speculative_llm = AsyncLLM({Config.EXTRACTION_MODEL: Config.SPECULATIVE_CONCURRENCY})
+            atexit.register(close_speculative_extraction)
+        return _speculative_loop, _speculative_llm
+
+def close_speculative_extraction() -> None:
+    """Close the shared client and stop its event loop (also run at interpreter exit)."""
+    global _speculative_loop, _speculative_llm
+    with _speculative_lock:
+        loop, llm = _speculative_loop, _speculative_llm
+        _speculative_loop = _speculative_llm = None
+    if loop is None:
+        return
+    atexit.unregister(close_speculative_extraction)
+    try:
+        asyncio.run_coroutine_threadsafe(llm.aclose(), loop).result(timeout=5)
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+
+def run_speculative_extraction(image, max_attempts: int = 3) -> tuple:
+    """
+    Blocking wrapper around `extract_flowchart_json_speculative` for the
+    synchronous pipeline, run on the shared extraction loop. Called from a
+    thread whose event loop is running, where blocking on another loop could
+    stall or deadlock it, it falls back to the sequential retries.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        return extract_flowchart_json_with_attempt(image, max_attempts=max_attempts)
+    loop, llm = _speculative_runner()
+    return asyncio.run_coroutine_threadsafe(
+        extract_flowchart_json_speculative(llm, image, max_attempts=max_attempts), loop
+    ).result()
+
+async def classify_node_types_async(llm: AsyncLLM, nodes: list) -> list:
+    """Async counterpart of `classify_node_types_with_llm`. Also used for packed prompts of many flowcharts."""
+    prompt = CLASSIFICATION_TEMPLATE.render(nodes)
+    content, _ = await llm.chat_content(
+        Config.CLASSIFICATION_MODEL,
+        [{'role': 'user', 'content': prompt}],
+        CLASSIFICATION_OPTIONS,
+        CLASSIFICATION_SHAPE,
+        CLASSIFICATION_SCHEMA
+    )
+    return parse_classification_response(content)
+
+async def cached_extract_async(llm: AsyncLLM, image, image_hash: str, cache=None, max_attempts: int = 3, speculative: bool = False):
+    key = extraction_cache_key(image_hash, max_attempts, speculative)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, True, None
+    if speculative:
+        flowchart_json, attempt = await extract_flowchart_json_speculative(llm, image, max_attempts=max_attempts)
+    else:
+        flowchart_json, attempt = await extract_flowchart_json_with_attempt_async(llm, image, max_attempts=max_attempts)
+    if cache is not None and flowchart_json and is_extraction_valid(flowchart_json):
+        cache.set(key, "extraction", flowchart_json)
+    return flowchart_json, False, attempt
+
+async def cached_classify_async(llm: AsyncLLM, nodes: list, cache=None):
+    key = classification_cache_key(nodes)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, True
+    classified_nodes = await classify_node_types_async(llm, nodes)
+    if cache is not None and classified_nodes:
+        cache.set(key, "classification", classified_nodes)
+    return classified_nodes, False
+
+async def classify_nodes_async(llm: AsyncLLM, nodes: list, cache=None) -> tuple:
+    """Async counterpart of `classify_nodes`."""
+    classified, unresolved = split_nodes(nodes, node_type_memo)
+    if not unresolved:
+        return classified, "skipped"
+    llm_classified, hit = await cached_classify_async(llm, unresolved, cache)
+    status = ("hit" if hit else "miss") if cache is not None else "called"
+    return merge_llm_classification(nodes, classified, llm_classified, node_type_memo, VALID_NODE_TYPES), status
+
+async def classify_nodes_packed_async(llm: AsyncLLM, node_lists: list, cache=None, token_budget: int = None,
+                                      timings: list = None) -> list:
+    """
+    Classify the nodes of many flowcharts with as few LLM calls as possible.
+    Rules, the memo and the stage cache are applied per flowchart as in
+    `classify_nodes_async`; the nodes still unresolved are packed, with ids
+    namespaced per flowchart, into prompts of up to `token_budget` estimated
+    tokens (default Config.CLASSIFICATION_PACK_TOKENS). Each packed answer is
+    split back per flowchart; nodes missing from a partially malformed answer
+    (or every node of a pack whose call failed) are retried with one
+    per-flowchart call. Each flowchart's answer is stored in the cache under
+    its own key, so later runs hit regardless of how it was packed.
+    `timings`, aligned with `node_lists`, receives a copy of each packed call
+    (marked with `shared_by`) for every flowchart in the pack.
+    Returns one (classified, status) pair per node list.
+    """
+    token_budget = Config.CLASSIFICATION_PACK_TOKENS if token_budget is None else token_budget
+    timings = timings or [None] * len(node_lists)
+    results = [None] * len(node_lists)
+    pending = {}
+    keys = {}
+    resolved = {}
+    for index, nodes in enumerate(node_lists):
+        classified, unresolved = split_nodes(nodes, node_type_memo)
+        resolved[index] = classified
+        if not unresolved:
+            results[index] = (classified, "skipped")
+            continue
+        keys[index] = classification_cache_key(unresolved)
+        cached = cache.get(keys[index]) if cache is not None else None
+        if cached is not None:
+            merged = merge_llm_classification(nodes, classified, cached, node_type_memo, VALID_NODE_TYPES)
+            results[index] = (merged, "hit")
+            continue
+        pending[index] = unresolved
+
+    answers = {index: [] for index in pending}
+    retry = {}
+
+    async def run_pack(pack):
+        shared = Timings()
+        with track_timings(shared), stage("classification"):
+            try:
+                llm_classified = await classify_node_types_async(llm, packed_nodes(pack, pending))
+            except Exception as e:
+                print(f"Packed classification of {len(pack)} flowcharts failed: {e}")
+                llm_classified = []
+        for index in pack:
+            if timings[index] is not None:
+                timings[index].llm_calls.extend(dict(call, shared_by=len(pack)) for call in shared.llm_calls)
+                timings[index].add_stage("classification", shared.stages.get("classification", 0.0))
+        per_group, missing = split_packed_response(pack, pending, llm_classified)
+        for index, entries in per_group.items():
+            answers[index].extend(entries)
+        retry.update(missing)
+
+    async def run_fallback(index, nodes):
+        with track_timings(timings[index] or Timings()), stage("classification"):
+            try:
+                answers[index].extend(await classify_node_types_async(llm, nodes))
+            except Exception as e:
+                print(f"Classification fallback failed: {e}")
+
+    await asyncio.gather(*(run_pack(pack) for pack in pack_groups(pending, token_budget)))
+    if retry:
+        print(f"Packed classification: retrying {len(retry)} flowcharts individually.")
+        await asyncio.gather(*(run_fallback(index, nodes) for index, nodes in retry.items()))
+
+    for index in pending:
+        if cache is not None and answers[index]:
+            cache.set(keys[index], "classification", answers[index])
+        merged = merge_llm_classification(node_lists[index], resolved[index], answers[index], node_type_memo,
+                                          VALID_NODE_TYPES)
+        results[index] = (merged, "miss" if cache is not None else "called")
+    return results
+
+# -------------------------
+# High-Level Async Evaluation
+# -------------------------
+async def graph_based_g_eval_async(image_path: str, problem_description: str, llm: AsyncLLM,
+                                   use_cache: bool = True, speculative: bool = None) -> dict:
+    """
+    Async counterpart of `graph_based_g_eval`. The LLM calls go through `llm`,
+    so many evaluations can share one event loop and one set of model limits.
+    """
+    with track_timings() as timings:
+        result = await _graph_based_g_eval_async(image_path, problem_description, llm, use_cache, speculative)
+    return record_evaluation(result, timings)
+
+def new_async_result(speculative: bool) -> dict:
+    result = new_result()
+    result["config"]["extraction_mode"] = "speculative" if speculative else "sequential"
+    return result
+
+async def extraction_phase_async(result: dict, image_path: str, llm: AsyncLLM, cache=None,
+                                 speculative: bool = False) -> dict:
+    """Phase 1: validate, prepare and extract the image; records the outcome on `result` and raises on failure."""
+    if not validate_image_path(image_path):
+        raise ValueError(f"Invalid image file: {image_path}")
+    with stage("image"):
+        prepared = await asyncio.to_thread(prepare_image_for_eval, result, image_path)
+    with stage("extraction"):
+        flowchart_json, hit, attempt = await cached_extract_async(
+            llm, prepared.data, result["image_hash"], cache, max_attempts=3, speculative=speculative
+        )
+    result["details"]["extraction_attempt"] = attempt
+    if cache is not None:
+        result["cache"]["extraction"] = "hit" if hit else "miss"
+    if not flowchart_json:
+        raise ValueError("Failed to extract valid JSON from extraction response.")
+    result["flowchart_json"] = flowchart_json
+    return flowchart_json
+
+async def classification_phase_async(result: dict, flowchart_json: dict, llm: AsyncLLM, cache=None) -> dict:
+    """Phase 2: classify node types (rules first, LLM for the rest) and apply them to the flowchart."""
+    nodes_raw = flowchart_json.get("nodes", [])
+    if nodes_raw:
+        with stage("classification"):
+            classified_nodes, status = await classify_nodes_async(llm, nodes_raw, cache)
+        flowchart_json = record_classification(result, flowchart_json, classified_nodes, status, cache)
+    return flowchart_json
+
+def record_classification(result: dict, flowchart_json: dict, classified_nodes: list, status: str, cache=None) -> dict:
+    """Record the classification stage status and apply the classified types to the flowchart."""
+    if cache is not None or status == "skipped":
+        result["cache"]["classification"] = status
+    return apply_classification(result, flowchart_json, classified_nodes)
+
+async def _graph_based_g_eval_async(image_path: str, problem_description: str, llm: AsyncLLM,
+                                    use_cache: bool, speculative: bool) -> dict:
+    cache = get_stage_cache() if use_cache else None
+    speculative = Config.SPECULATIVE_EXTRACTION if speculative is None else speculative
+    result = new_async_result(speculative)
+    try:
+        # --- Phase 1: Extraction (with retry) ---
+        flowchart_json = await extraction_phase_async(result, image_path, llm, cache, speculative)
+        # --- Phase 2: Node Type Classification ---
+        flowchart_json = await classification_phase_async(result, flowchart_json, llm, cache)
+        # --- Phase 3: Graph-Based Logic Evaluation ---
+        apply_logic_tests(result, flowchart_json, problem_description)
+
+    except Exception as e:
+        result["error"] = str(e)
+        return result
+
+    return result
@@ -0,0 +1,242 @@
+import argparse
+import asyncio
+import contextlib
+import csv
+import json
+import os
+import sys
+from pathlib import Path
+from async_g_eval import (
+    AsyncLLM,
+    classification_phase_async,
+    classify_nodes_packed_async,
+    extraction_phase_async,
+    graph_based_g_eval_async,
+    new_async_result,
+    record_classification,
+)
+from g_eval import Config, apply_logic_tests, get_stage_cache
+from metrics import Timings, record_evaluation, track_timings
+
+DEFAULT_PROBLEM = "Check the logic of the flowchart."
+
+def parse_concurrency(spec: str) -> dict:
+    """Parse a "model=limit,model=limit" string into a per-model concurrency map."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        model, _, limit = item.rpartition("=")
+        if not model:
+            raise ValueError(f"Invalid concurrency entry '{item}', expected model=limit")
+        limits[model] = int(limit)
+    return limits
+
+def load_jobs(source: str, problem_description: str = DEFAULT_PROBLEM) -> list:
+    """
+    Build the list of grading jobs from a directory of images or a grade.csv-style
+    manifest (image_id, question, image_path). Manifest image paths are resolved
+    relative to the manifest's directory.
+    """
+    path = Path(source)
+    jobs = []
+    if path.is_dir():
+        for image in sorted(path.iterdir()):
+            if image.suffix[1:].lower() in Config.ALLOWED_EXTENSIONS:
+                jobs.append({
+                    "id": image.stem,
+                    "image_path": str(image),
+                    "problem_description": problem_description
+                })
+        return jobs
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            image_path = Path(row["image_path"])
+            if not image_path.is_absolute():
+                image_path = path.parent / image_path
+            jobs.append({
+                "id": row.get("image_id") or image_path.stem,
+                "image_path": str(image_path),
+                "problem_description": row.get("question") or problem_description
+            })
+    return jobs
+
+def in_flight_limit(llm: AsyncLLM, *models: str) -> int:
+    """Images worth having in flight at once: enough to fill every slot of `models` (default: both vision models)."""
+    return sum(llm.limit_for(model) for model in models or (Config.EXTRACTION_MODEL, Config.CLASSIFICATION_MODEL))
+
+async def grade_batch(jobs: list, llm: AsyncLLM, output, use_cache: bool = True, speculative: bool = None,
+                      max_in_flight: int = None) -> int:
+    """
+    Grade the jobs concurrently and write one NDJSON line per image as soon as
+    it finishes. At most `max_in_flight` images (default: `in_flight_limit`)
+    are being graded at once, so a large batch does not load and encode every
+    image while they wait for a model slot. Returns the number of results
+    written.
+    """
+    slots = asyncio.Semaphore(max_in_flight or in_flight_limit(llm))
+
+    async def grade(job):
+        async with slots:
+            result = await graph_based_g_eval_async(job["image_path"], job["problem_description"], llm,
+                                                    use_cache=use_cache, speculative=speculative)
+        return {"id": job["id"], "image_path": job["image_path"], **result}
+
+    written = 0
+    for finished in asyncio.as_completed([grade(job) for job in jobs]):
+        record = await finished
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+        written += 1
+    return written
+
+def count_model_switches(models: list) -> int:
+    return sum(1 for previous, current in zip(models, models[1:]) if previous != current)
+
+def interleaved_model_switches(results: list) -> int:
+    """
+    Model switches the same calls would need in per-image order, i.e. each image
+    extracted and then classified before the next image starts.
+    """
+    models = [
+        call["model"]
+        for result in results
+        for call in result.get("config", {}).get("timings", {}).get("llm_calls", [])
+    ]
+    return count_model_switches(models)
+
+async def grade_batch_by_model(jobs: list, llm: AsyncLLM, output, use_cache: bool = True, speculative: bool = None,
+                               preload: bool = True, pack_tokens: int = None, max_in_flight: int = None) -> dict:
+    """
+    Grade the batch one stage at a time: extraction for every image, then
+    classification for every image, then the logic tests. Each vision model is
+    used for a whole phase instead of alternating per image, which on a host
+    that can only hold one of them avoids an unload/load for every image.
+    With `preload` both models are loaded up front (the extraction model last,
+    so it is resident when the batch starts). With `pack_tokens` the nodes of
+    many flowcharts share each classification call (see
+    `classify_nodes_packed_async`). At most `max_in_flight` images (default:
+    the extraction model's limit) are loaded for extraction at once. Results are written as NDJSON in
+    job order once the batch is done. Returns the number of results written,
+    the calls made per model, the model switches made, the switches per-image order would have made and
+    the difference.
+    """
+    cache = get_stage_cache() if use_cache else None
+    speculative = Config.SPECULATIVE_EXTRACTION if speculative is None else speculative
+    if preload:
+        for model in (Config.CLASSIFICATION_MODEL, Config.EXTRACTION_MODEL):
+            await llm.preload(model)
+    states = [
+        {"job": job, "result": new_async_result(speculative), "timings": Timings(), "flowchart_json": None}
+        for job in jobs
+    ]
+
+    slots = asyncio.Semaphore(max_in_flight or in_flight_limit(llm, Config.EXTRACTION_MODEL))
+
+    async def extract(state):
+        async with slots:
+            state["flowchart_json"] = await extraction_phase_async(
+                state["result"], state["job"]["image_path"], llm, cache, speculative
+            )
+
+    async def classify(state):
+        state["flowchart_json"] = await classification_phase_async(state["result"], state["flowchart_json"], llm, cache)
+
+    async def logic_tests(state):
+        apply_logic_tests(state["result"], state["flowchart_json"], state["job"]["problem_description"])
+
+    async def run_phase(phase, state):
+        if state["result"]["error"]:
+            return
+        with track_timings(state["timings"]):
+            try:
+                await phase(state)
+            except Exception as e:
+                state["result"]["error"] = str(e)
+
+    async def classify_packed():
+        live = [state for state in states if not state["result"]["error"] and state["flowchart_json"].get("nodes")]
+        classified = await classify_nodes_packed_async(
+            llm, [state["flowchart_json"]["nodes"] for state in live], cache, pack_tokens,
+            [state["timings"] for state in live]
+        )
+        for state, (classified_nodes, status) in zip(live, classified):
+            state["flowchart_json"] = record_classification(
+                state["result"], state["flowchart_json"], classified_nodes, status, cache
+            )
+
+    await asyncio.gather(*(run_phase(extract, state) for state in states))
+    if pack_tokens:
+        await classify_packed()
+    else:
+        await asyncio.gather(*(run_phase(classify, state) for state in states))
+    await asyncio.gather(*(run_phase(logic_tests, state) for state in states))
+
+    results = []
+    for state in states:
+        result = record_evaluation(state["result"], state["timings"])
+        results.append(result)
+        job = state["job"]
+        output.write(json.dumps({"id": job["id"], "image_path": job["image_path"], **result}) + "\n")
+    output.flush()
+    interleaved = interleaved_model_switches(results)
+    return {
+        "written": len(results),
+        "llm_calls": dict(llm.calls),
+        "model_switches": llm.model_switches,
+        "interleaved_switches": interleaved,
+        "switches_avoided": max(0, interleaved - llm.model_switches)
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Grade a batch of flowchart images and stream results as NDJSON.")
+    parser.add_argument("source", help="Directory of images or a grade.csv-style manifest")
+    parser.add_argument("--problem", default=DEFAULT_PROBLEM, help="Problem description for directory sources")
+    parser.add_argument("--output", "-o", help="NDJSON output file (defaults to stdout)")
+    parser.add_argument("--concurrency", default=os.getenv("BATCH_CONCURRENCY", ""),
+                        help="Per-model limits, e.g. 'llama3.2-vision=2,granite3.2-vision=4'")
+    parser.add_argument("--default-concurrency", type=int, default=int(os.getenv("BATCH_DEFAULT_CONCURRENCY", 1)),
+                        help="Limit for models not listed in --concurrency")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the stage cache")
+    parser.add_argument("--speculative", action="store_true", default=None,
+                        help="Send all extraction retries at once and keep the first valid response")
+    parser.add_argument("--group-by-model", action="store_true",
+                        help="Run extraction for the whole batch, then classification, to avoid model swaps")
+    parser.add_argument("--keep-alive", default=os.getenv("BATCH_KEEP_ALIVE", "30m"),
+                        help="How long Ollama keeps each model loaded after a request")
+    parser.add_argument("--no-preload", action="store_true", help="Do not load the models before --group-by-model runs")
+    parser.add_argument("--pack-classification", action="store_true",
+                        help="Classify the nodes of many flowcharts per call (implies --group-by-model)")
+    parser.add_argument("--max-in-flight", type=int, default=None,
+                        help="Images graded at once (defaults to the total concurrency of the models used)")
+    parser.add_argument("--pack-tokens", type=int, default=Config.CLASSIFICATION_PACK_TOKENS,
+                        help="Estimated node tokens per packed classification call")
+    args = parser.parse_args(argv)
+
+    jobs = load_jobs(args.source, args.problem)
+    llm = AsyncLLM(parse_concurrency(args.concurrency), args.default_concurrency, keep_alive=args.keep_alive or None)
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    stats = None
+    try:
+        # Progress messages from the pipeline go to stderr so stdout stays valid NDJSON
+        with contextlib.redirect_stdout(sys.stderr):
+            if args.group_by_model or args.pack_classification:
+                pack_tokens = args.pack_tokens if args.pack_classification else None
+                stats = asyncio.run(grade_batch_by_model(jobs, llm, output, use_cache=not args.no_cache,
+                                                         speculative=args.speculative, preload=not args.no_preload,
+                                                         pack_tokens=pack_tokens, max_in_flight=args.max_in_flight))
+                written = stats["written"]
+            else:
+                written = asyncio.run(grade_batch(jobs, llm, output, use_cache=not args.no_cache,
+                                                  speculative=args.speculative, max_in_flight=args.max_in_flight))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    print(f"Graded {written} of {len(jobs)} images.", file=sys.stderr)
+    if stats:
+        print(f"Model calls: {stats['llm_calls']}.", file=sys.stderr)
+        print(f"Model switches: {stats['model_switches']} "
+              f"(per-image order: {stats['interleaved_switches']}, avoided: {stats['switches_avoided']}).",
+              file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Throughput and success-rate benchmark for LLM JSON response parsing.
+
+Runs every response in the regression corpus (json_corpus/responses.jsonl)
+through the former extraction/classification parsers (first-to-last bracket
+slice, blanket str.replace cleanup, regex retries) and through
+`lenient_json.parse_lenient_json`, and reports how many responses each parser
+recovers exactly and how many responses per second it handles. The corpus is
+synthetic: hand-written responses in the failure modes seen from the models,
+not recorded model output.
+
+Usage: python bench_json_repair.py [--corpus json_corpus/responses.jsonl] [--repeat 200]
+"""
+import argparse
+import json
+import os
+import re
+import time
+from lenient_json import parse_lenient_json
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "json_corpus", "responses.jsonl")
+
+def load_corpus(path: str = DEFAULT_CORPUS) -> list:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def legacy_fix_quotes_in_values(json_str: str) -> str:
+    def replacer(match):
+        fixed_content = re.sub(r'(?<!\\)"', r'\\"', match.group(2))
+        return f"{match.group(1)}{fixed_content}{match.group(3)}"
+    return re.sub(r'(:\s*")([^"]*?)(")', replacer, json_str)
+
+def legacy_extract_object(raw_response: str):
+    """The original `extract_json_from_response` cleanup, without its debug prints."""
+    start_idx = raw_response.find('{')
+    end_idx = raw_response.rfind('}')
+    if start_idx == -1 or end_idx == -1:
+        return None
+    json_str = raw_response[start_idx:end_idx+1]
+    json_str = (
+        json_str.strip()
+        .replace('\\\n', '')
+        .replace('```', '')
+        .replace('...', '')
+        .replace("'", '"')
+    )
+    json_str = re.sub(r',\s*}', '}', json_str)
+    json_str = re.sub(r',\s*]', ']', json_str)
+    try:
+        return json.loads(json_str)
+    except json.JSONDecodeError:
+        try:
+            return json.loads(legacy_fix_quotes_in_values(json_str))
+        except json.JSONDecodeError:
+            return None
+
+def legacy_extract_array(content: str):
+    """The original classification parsing: first '[' to last ']' and a plain json.loads."""
+    start_idx = content.find('[')
+    end_idx = content.rfind(']')
+    if start_idx == -1 or end_idx == -1:
+        return None
+    try:
+        return json.loads(content[start_idx:end_idx+1])
+    except json.JSONDecodeError:
+        return None
+
+def legacy_parse(raw: str, expect: str):
+    return legacy_extract_object(raw) if expect == "object" else legacy_extract_array(raw)
+
+def run(parser, corpus: list, repeat: int) -> tuple:
+    """Return (number of exact recoveries, responses parsed per second)."""
+    correct = sum(parser(case["raw"], case["expect"]) == case["expected"] for case in corpus)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for case in corpus:
+            parser(case["raw"], case["expect"])
+    elapsed = time.perf_counter() - started
+    return correct, repeat * len(corpus) / elapsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--verbose", action="store_true", help="List the cases each parser gets wrong")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus)
+    parsers = {"legacy": legacy_parse, "lenient": parse_lenient_json}
+    print(f"{len(corpus)} responses")
+    print(f"{'parser':>8} {'recovered':>10} {'responses/s':>12}")
+    for name, func in parsers.items():
+        correct, rate = run(func, corpus, args.repeat)
+        print(f"{name:>8} {correct:>5d}/{len(corpus):<4d} {rate:12.0f}")
+        if args.verbose:
+            for case in corpus:
+                if func(case["raw"], case["expect"]) != case["expected"]:
+                    print(f"{'':>8}   wrong: {case['name']}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Synthetic large-graph benchmark for the graph-based logic tests.
+
+Builds flowcharts of increasing size (a start node, repeated "while" blocks of a
+decision, its loop body and a fan-out of process nodes, and an end node), then
+times `run_logic_tests` over all LOGIC_TESTS. The time per node should stay flat
+as the graph grows. LT_5 is also timed on a wide graph (start fanning out to
+every node, all joining at end) against the former `list.pop(0)` BFS, whose
+cost grows quadratically with the width of the search frontier.
+
+Usage: python bench_logic_tests.py [--sizes 1000,10000,100000] [--repeat 3]
+"""
+import argparse
+import time
+from g_eval import LOGIC_TESTS, run_logic_tests, test_path_existence
+
+def synthetic_flowchart(target_nodes: int, fan_out: int = 8) -> dict:
+    nodes = [{"id": 1, "type": "start", "text": "Start"}]
+    edges = []
+    next_id = 2
+    previous = 1
+    while next_id < target_nodes:
+        decision, body = next_id, next_id + 1
+        nodes.append({"id": decision, "type": "decision", "text": f"i{decision} < n"})
+        nodes.append({"id": body, "type": "process", "text": f"i{decision} = i{decision} + 1"})
+        edges.append({"from": previous, "to": decision, "label": ""})
+        edges.append({"from": decision, "to": body, "label": "Yes"})
+        edges.append({"from": body, "to": decision, "label": ""})
+        join = body + fan_out + 1
+        for k in range(fan_out):
+            branch = body + 1 + k
+            nodes.append({"id": branch, "type": "process", "text": f"x{branch} = {k}"})
+            edges.append({"from": decision if k == 0 else branch - 1, "to": branch, "label": "No" if k == 0 else ""})
+        nodes.append({"id": join, "type": "process", "text": f"join {join}"})
+        edges.append({"from": join - 1, "to": join, "label": ""})
+        previous = join
+        next_id = join + 1
+    nodes.append({"id": next_id, "type": "end", "text": "End"})
+    edges.append({"from": previous, "to": next_id, "label": ""})
+    return {"nodes": nodes, "edges": edges}
+
+def wide_flowchart(target_nodes: int) -> dict:
+    middle = range(2, target_nodes)
+    nodes = [{"id": 1, "type": "start", "text": "Start"}]
+    nodes += [{"id": i, "type": "process", "text": f"x{i} = {i}"} for i in middle]
+    nodes.append({"id": target_nodes, "type": "end", "text": "End"})
+    edges = [{"from": 1, "to": i, "label": ""} for i in middle]
+    edges += [{"from": i, "to": target_nodes, "label": ""} for i in middle]
+    return {"nodes": nodes, "edges": edges}
+
+def legacy_path_existence(flowchart_json: dict) -> bool:
+    """The original LT_5 implementation (list.pop(0) queue, list membership for end ids)."""
+    nodes = flowchart_json.get("nodes", [])
+    edges = flowchart_json.get("edges", [])
+    start_ids = [n.get("id") for n in nodes if n.get("type") == "start"]
+    end_ids = [n.get("id") for n in nodes if n.get("type") == "end"]
+    adj = {}
+    for edge in edges:
+        adj.setdefault(edge.get("from"), []).append(edge.get("to"))
+    visited = set()
+    queue = start_ids.copy()
+    while queue:
+        current = queue.pop(0)
+        if current in end_ids:
+            return True
+        if current in visited:
+            continue
+        visited.add(current)
+        queue.extend(adj.get(current, []))
+    return False
+
+def best_of(repeat: int, func, *args) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="1000,10000,100000,300000")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--legacy-limit", type=int, default=100000,
+                        help="Skip the legacy BFS above this many nodes")
+    args = parser.parse_args(argv)
+
+    logic_ids = list(LOGIC_TESTS)
+    sizes = [int(s) for s in args.sizes.split(",")]
+    print("All logic tests on looped flowcharts")
+    print(f"{'nodes':>8} {'edges':>8} {'seconds':>10} {'us/node':>8}")
+    for size in sizes:
+        flowchart = synthetic_flowchart(size)
+        n_nodes, n_edges = len(flowchart["nodes"]), len(flowchart["edges"])
+        elapsed = best_of(args.repeat, run_logic_tests, flowchart, logic_ids)
+        print(f"{n_nodes:8d} {n_edges:8d} {elapsed:10.4f} {elapsed / n_nodes * 1e6:8.2f}")
+
+    print("\nLT_5 path existence on wide flowcharts")
+    print(f"{'nodes':>8} {'graph (s)':>10} {'legacy (s)':>11}")
+    for size in sizes:
+        flowchart = wide_flowchart(size)
+        elapsed = best_of(args.repeat, test_path_existence, flowchart)
+        legacy = best_of(1, legacy_path_existence, flowchart) if size <= args.legacy_limit else None
+        legacy_text = f"{legacy:11.4f}" if legacy is not None else f"{'skipped':>11}"
+        print(f"{size:8d} {elapsed:10.4f} {legacy_text}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+End-to-end grading benchmark against the local fake Ollama server (fake_ollama.py).
+
+Grades a set of images through the real pipeline (image preparation, extraction,
+classification, logic tests), with model calls answered by the fake server
+after its configured latency. The scenarios are:
+- single: one image at a time through `graph_based_g_eval`.
+- concurrent: `batch_grade.grade_batch`, with every image in flight at once.
+- batch: `batch_grade.grade_batch_by_model`, one model phase at a time (packed
+  classification with --pack-tokens).
+For each scenario it reports throughput, p50/p95 latency per image, retries,
+repairs, errors and the model requests the server received. The stage cache is
+bypassed so every scenario makes its model calls. Results are written as JSON.
+
+Usage: python bench_pipeline.py [--images ../Dataset] [--latency 0.2] [--failure-rate 0.05] [--output bench.json]
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+import ollama
+import g_eval
+from async_g_eval import AsyncLLM
+from batch_grade import DEFAULT_PROBLEM, grade_batch, grade_batch_by_model, load_jobs
+from fake_ollama import FakeOllama, image_hash, load_responses
+from g_eval import Config, graph_based_g_eval
+from image_preprocess import prepare_image
+
+DEFAULT_IMAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Dataset")
+SCENARIOS = ("single", "concurrent", "batch")
+
+@contextmanager
+def ollama_host(url: str):
+    """Send the synchronous pipeline's model calls (and any new client's) to `url` inside the block."""
+    previous_chat = ollama.chat
+    previous_host = os.environ.get("OLLAMA_HOST")
+    ollama.chat = ollama.Client(host=url).chat
+    os.environ["OLLAMA_HOST"] = url
+    try:
+        yield
+    finally:
+        ollama.chat = previous_chat
+        if previous_host is None:
+            os.environ.pop("OLLAMA_HOST", None)
+        else:
+            os.environ["OLLAMA_HOST"] = previous_host
+
+def register_recorded_responses(fake: FakeOllama, jobs: list, recorded: dict) -> int:
+    """
+    Serve recorded extraction responses, keyed by the SHA-256 of each image file
+    (the pipeline's `image_hash`), for the image payload the pipeline will send.
+    Returns the number of jobs with a recorded response.
+    """
+    registered = 0
+    for job in jobs:
+        prepared = prepare_image(job["image_path"], max_side=Config.IMAGE_MAX_SIDE, crop=Config.IMAGE_CROP)
+        if prepared.sha256 in recorded:
+            fake.responses[image_hash(prepared.data)] = recorded[prepared.sha256]
+            registered += 1
+    return registered
+
+def percentile(values: list, fraction: float):
+    """Nearest-rank percentile of `values`, or None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * fraction // 1))
+    return ordered[int(rank) - 1]
+
+def summarize(name: str, results: list, wall_seconds: float, requests: list, loads: int) -> dict:
+    timings = [result.get("config", {}).get("timings", {}) for result in results]
+    latencies = [timing["total_seconds"] for timing in timings if "total_seconds" in timing]
+    return {
+        "scenario": name,
+        "images": len(results),
+        "wall_seconds": round(wall_seconds, 3),
+        "images_per_second": round(len(results) / wall_seconds, 3) if wall_seconds else None,
+        "p50_seconds": percentile(latencies, 0.5),
+        "p95_seconds": percentile(latencies, 0.95),
+        "retries": sum(timing.get("retries", 0) for timing in timings),
+        "json_repairs": sum(timing.get("json_repairs", 0) for timing in timings),
+        "parse_failures": sum(timing.get("parse_failures", 0) for timing in timings),
+        "errors": sum(1 for result in results if result.get("error")),
+        "model_requests": len(requests),
+        "model_requests_by_model": {
+            model: sum(1 for request in requests if request["model"] == model)
+            for model in sorted({request["model"] for request in requests})
+        },
+        "model_loads": loads
+    }
+
+def run_single(jobs: list, url: str) -> list:
+    with ollama_host(url):
+        return [graph_based_g_eval(job["image_path"], job["problem_description"], use_cache=False) for job in jobs]
+
+def run_concurrent(jobs: list, url: str, concurrency: int) -> list:
+    output = io.StringIO()
+    llm = AsyncLLM(default_concurrency=concurrency, host=url)
+    asyncio.run(grade_batch(jobs, llm, output, use_cache=False))
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+def run_batch(jobs: list, url: str, concurrency: int, pack_tokens: int = None) -> list:
+    output = io.StringIO()
+    llm = AsyncLLM(default_concurrency=concurrency, host=url, keep_alive="30m")
+    asyncio.run(grade_batch_by_model(jobs, llm, output, use_cache=False, pack_tokens=pack_tokens))
+    return [json.loads(line) for line in output.getvalue().splitlines()]
+
+def run_scenario(name: str, jobs: list, fake: FakeOllama, concurrency: int = 4, pack_tokens: int = None) -> dict:
+    """Run one scenario against the started `fake` server and summarize it."""
+    # Start every scenario with an empty node memo so each makes the same classification calls
+    g_eval.node_type_memo.clear()
+    first_request = len(fake.requests)
+    first_load = fake.loads
+    started = time.perf_counter()
+    if name == "single":
+        results = run_single(jobs, fake.url)
+    elif name == "concurrent":
+        results = run_concurrent(jobs, fake.url, concurrency)
+    elif name == "batch":
+        results = run_batch(jobs, fake.url, concurrency, pack_tokens)
+    else:
+        raise ValueError(f"Unknown scenario '{name}', expected one of {', '.join(SCENARIOS)}")
+    wall_seconds = time.perf_counter() - started
+    return summarize(name, results, wall_seconds, fake.requests[first_request:], fake.loads - first_load)
+
+def run(jobs: list, fake: FakeOllama, scenarios=SCENARIOS, concurrency: int = 4, pack_tokens: int = None) -> list:
+    with fake:
+        return [run_scenario(name, jobs, fake, concurrency, pack_tokens) for name in scenarios]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", default=DEFAULT_IMAGES, help="Directory of images or a grade.csv-style manifest")
+    parser.add_argument("--limit", type=int, help="Grade only the first N images")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios to run")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight per model (async scenarios)")
+    parser.add_argument("--pack-tokens", type=int, help="Pack classification in the batch scenario")
+    parser.add_argument("--responses", help="JSON file mapping image file SHA-256 to recorded extraction responses")
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--seconds-per-token", type=float, default=0.0)
+    parser.add_argument("--load-seconds", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", "-o", default="bench_pipeline.json", help="Results JSON file")
+    args = parser.parse_args(argv)
+
+    jobs = load_jobs(args.images, DEFAULT_PROBLEM)[:args.limit]
+    server_config = {
+        "latency": args.latency, "jitter": args.jitter, "seconds_per_token": args.seconds_per_token,
+        "load_seconds": args.load_seconds, "failure_rate": args.failure_rate,
+        "malformed_rate": args.malformed_rate, "seed": args.seed
+    }
+    fake = FakeOllama(**server_config)
+    recorded = register_recorded_responses(fake, jobs, load_responses(args.responses)) if args.responses else 0
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    summaries = run(jobs, fake, scenarios, args.concurrency, args.pack_tokens)
+
+    print(f"{len(jobs)} images, {recorded} with recorded responses")
+    print(f"{'scenario':>10} {'img/s':>7} {'p50 s':>7} {'p95 s':>7} {'retries':>8} {'errors':>7} {'requests':>9}")
+    for summary in summaries:
+        print(f"{summary['scenario']:>10} {summary['images_per_second'] or 0:7.2f} {summary['p50_seconds'] or 0:7.3f} "
+              f"{summary['p95_seconds'] or 0:7.3f} {summary['retries']:8d} {summary['errors']:7d} "
+              f"{summary['model_requests']:9d}")
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "images": args.images,
+        "image_count": len(jobs),
+        "recorded_responses": recorded,
+        "server": server_config,
+        "pipeline": {
+            "concurrency": args.concurrency,
+            "pack_tokens": args.pack_tokens,
+            "extraction_model": Config.EXTRACTION_MODEL,
+            "classification_model": Config.CLASSIFICATION_MODEL,
+            "stream_responses": Config.STREAM_RESPONSES,
+            "structured_output": Config.STRUCTURED_OUTPUT
+        },
+        "scenarios": summaries
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
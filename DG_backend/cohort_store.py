@@ -0,0 +1,200 @@
+import argparse
+import json
+import sys
+import numpy as np
+from flowchart_graph import FlowchartGraph
+from g_eval import Config, LOGIC_TESTS
+
+class CohortStore:
+    """
+    Columnar store of logic-test outcomes for a whole cohort of submissions.
+
+    Rows are submissions, columns are LOGIC_TESTS ids, and each cell is the
+    pass/fail outcome of that test on the submission's extracted flowchart.
+    Re-scoring the cohort under new weights, a new test subset or a new
+    maximum score is a single matrix-vector product, with no model calls.
+    The flowcharts are kept alongside the matrix so that new logic tests can be
+    appended as columns computed in bulk.
+    """
+
+    def __init__(self, test_ids: list = None):
+        self.test_ids = list(test_ids if test_ids is not None else LOGIC_TESTS)
+        self.weights = np.zeros(len(self.test_ids), dtype=np.float64)
+        self.submission_ids = []
+        self.flowcharts = []
+        self._row_of = {}
+        self._matrix = np.zeros((0, len(self.test_ids)), dtype=bool)
+        self._rows = 0
+
+    @property
+    def matrix(self) -> np.ndarray:
+        return self._matrix[:self._rows]
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _evaluate(self, flowchart_json: dict, test_ids: list) -> tuple:
+        graph = FlowchartGraph.of(flowchart_json)
+        outcomes = np.zeros(len(test_ids), dtype=bool)
+        weights = np.zeros(len(test_ids), dtype=np.float64)
+        for k, lid in enumerate(test_ids):
+            passed, weight, _ = LOGIC_TESTS[lid](graph)
+            outcomes[k] = bool(passed)
+            weights[k] = weight
+        return outcomes, weights
+
+    def _reserve(self, rows: int) -> None:
+        capacity = self._matrix.shape[0]
+        if rows <= capacity:
+            return
+        grown = np.zeros((max(rows, 2 * capacity, 64), self._matrix.shape[1]), dtype=bool)
+        grown[:self._rows] = self.matrix
+        self._matrix = grown
+
+    def add(self, submission_id: str, flowchart_json: dict) -> None:
+        """Add (or replace) one submission's outcome vector."""
+        outcomes, weights = self._evaluate(flowchart_json, self.test_ids)
+        self.weights = weights
+        row = self._row_of.get(submission_id)
+        if row is None:
+            self._reserve(self._rows + 1)
+            row = self._rows
+            self._rows += 1
+            self._row_of[submission_id] = row
+            self.submission_ids.append(submission_id)
+            self.flowcharts.append(flowchart_json)
+        else:
+            self.flowcharts[row] = flowchart_json
+        self._matrix[row] = outcomes
+
+    def add_result(self, result: dict, submission_id: str = None) -> bool:
+        """Add a `graph_based_g_eval` result; failed evaluations are skipped."""
+        if result.get("error") or not result.get("flowchart_json"):
+            return False
+        self.add(str(submission_id or result.get("id") or result["image_hash"]), result["flowchart_json"])
+        return True
+
+    def add_tests(self, test_ids: list) -> list:
+        """Append new logic tests as columns, computed in bulk over every stored flowchart."""
+        new_ids = [lid for lid in test_ids if lid not in self.test_ids]
+        unknown = [lid for lid in new_ids if lid not in LOGIC_TESTS]
+        if unknown:
+            raise KeyError(f"Unknown logic tests: {unknown}")
+        if not new_ids:
+            return []
+        columns = np.zeros((self._matrix.shape[0], len(new_ids)), dtype=bool)
+        new_weights = np.zeros(len(new_ids), dtype=np.float64)
+        for row, flowchart_json in enumerate(self.flowcharts):
+            columns[row], new_weights = self._evaluate(flowchart_json, new_ids)
+        if not self.flowcharts:
+            _, new_weights = self._evaluate({}, new_ids)
+        self._matrix = np.hstack([self._matrix, columns])
+        self.weights = np.concatenate([self.weights, new_weights])
+        self.test_ids.extend(new_ids)
+        return new_ids
+
+    def weight_vector(self, weights: dict = None, test_ids: list = None) -> np.ndarray:
+        """Weights aligned with the columns; unselected tests get weight 0."""
+        vector = self.weights.copy()
+        for lid, weight in (weights or {}).items():
+            if lid not in self.test_ids:
+                raise KeyError(f"Unknown logic test column: {lid}")
+            vector[self.test_ids.index(lid)] = weight
+        if test_ids is not None:
+            selected = np.isin(np.array(self.test_ids), list(test_ids))
+            vector = np.where(selected, vector, 0.0)
+        return vector
+
+    def rescore(self, weights: dict = None, test_ids: list = None, max_score: float = None) -> np.ndarray:
+        """
+        Score every submission like `run_logic_tests` does:
+        (passed weight / total weight) * max_score, as one matrix-vector product.
+        """
+        max_score = Config.MAX_SCORE if max_score is None else max_score
+        vector = self.weight_vector(weights, test_ids)
+        total = vector.sum()
+        if total <= 0:
+            return np.zeros(self._rows)
+        return (self.matrix @ vector) / total * max_score
+
+    def to_frame(self):
+        import pandas as pd
+        return pd.DataFrame(self.matrix, index=pd.Index(self.submission_ids, name="submission_id"), columns=self.test_ids)
+
+    # -------------------------
+    # Persistence
+    # -------------------------
+    def save(self, path: str) -> None:
+        """Save to a NumPy .npz file (matrix, ids, weights and the flowcharts as JSON)."""
+        np.savez_compressed(
+            path,
+            matrix=self.matrix,
+            test_ids=np.array(self.test_ids),
+            weights=self.weights,
+            submission_ids=np.array(self.submission_ids, dtype=str),
+            flowcharts=np.array(json.dumps(self.flowcharts))
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "CohortStore":
+        with np.load(path, allow_pickle=False) as data:
+            store = cls(list(data["test_ids"]))
+            store.weights = data["weights"].astype(np.float64)
+            store._matrix = data["matrix"].astype(bool)
+            store._rows = store._matrix.shape[0]
+            store.submission_ids = [str(s) for s in data["submission_ids"]]
+            store.flowcharts = json.loads(str(data["flowcharts"]))
+        store.test_ids = [str(t) for t in store.test_ids]
+        store._row_of = {sid: row for row, sid in enumerate(store.submission_ids)}
+        return store
+
+    def to_parquet(self, path: str) -> None:
+        """Export the pass/fail matrix as Parquet (requires pyarrow or fastparquet)."""
+        self.to_frame().reset_index().to_parquet(path, index=False)
+
+def parse_weights(spec: str) -> dict:
+    weights = {}
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        lid, _, weight = item.partition("=")
+        weights[lid] = float(weight)
+    return weights
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Build and re-score a cohort of logic-test outcomes.")
+    parser.add_argument("--store", required=True, help="Cohort store (.npz)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ingest = sub.add_parser("ingest", help="Add graph_based_g_eval results from an NDJSON file")
+    ingest.add_argument("results")
+    add_tests = sub.add_parser("add-tests", help="Append logic tests as new columns")
+    add_tests.add_argument("test_ids", help="Comma-separated logic test ids")
+    rescore = sub.add_parser("rescore", help="Print submission_id,score as CSV")
+    rescore.add_argument("--weights", default="", help="e.g. LT_1=10,LT_2=40")
+    rescore.add_argument("--tests", default="", help="Comma-separated subset of logic test ids")
+    rescore.add_argument("--max-score", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "ingest":
+        try:
+            store = CohortStore.load(args.store)
+        except FileNotFoundError:
+            store = CohortStore()
+        with open(args.results, encoding="utf-8") as f:
+            added = sum(store.add_result(json.loads(line)) for line in f if line.strip())
+        store.save(args.store)
+        print(f"Added {added} submissions; cohort has {len(store)}.", file=sys.stderr)
+    elif args.command == "add-tests":
+        store = CohortStore.load(args.store)
+        added = store.add_tests([t.strip() for t in args.test_ids.split(",") if t.strip()])
+        store.save(args.store)
+        print(f"Added columns: {added}", file=sys.stderr)
+    else:
+        store = CohortStore.load(args.store)
+        tests = [t.strip() for t in args.tests.split(",") if t.strip()] or None
+        scores = store.rescore(parse_weights(args.weights), tests, args.max_score)
+        print("submission_id,score")
+        for sid, score in zip(store.submission_ids, scores):
+            print(f"{sid},{score:.4f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
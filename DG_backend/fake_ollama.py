@@ -0,0 +1,315 @@
+"""
+Local stand-in for an Ollama server, for benchmarking and testing the pipeline without a GPU.
+
+Serves /api/chat (streamed and not), /api/generate (model preloads) and
+/api/tags. Classification prompts are answered for exactly the nodes they
+contain, and the Dataset grading and question analysis prompts get canned
+answers. Other requests carrying an image are extraction requests, answered
+with the response registered for the SHA-256 of the image bytes, or a canned
+flowchart. Each response sleeps for a configurable latency with jitter, plus
+a model load when the requested model is not the one resident. It reports the
+duration and token fields Ollama does. Failure and malformed-output rates
+inject HTTP 500s and unparseable content.
+
+Usage: python fake_ollama.py [--port 11434] [--latency 0.2] [--jitter 0.05] [--responses recorded.json]
+Then point any script at it with OLLAMA_HOST=http://127.0.0.1:11434.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from node_rules import preclassify_node
+from prompt_templates import (
+    CHECKLIST_GRADING_TEMPLATE,
+    CLASSIFICATION_TEMPLATE,
+    QUESTION_ANALYSIS_TEMPLATE,
+    RULE_GRADING_TEMPLATE,
+    estimate_tokens,
+)
+
+CANNED_FLOWCHART = {
+    "nodes": [
+        {"id": 1, "type": "start", "text": "Start"},
+        {"id": 2, "type": "input", "text": "Read A, B"},
+        {"id": 3, "type": "process", "text": "Swap A and B"},
+        {"id": 4, "type": "output", "text": "Print A, B"},
+        {"id": 5, "type": "end", "text": "End"}
+    ],
+    "edges": [{"from": i, "to": i + 1, "label": ""} for i in range(1, 5)]
+}
+CANNED_RULES = {f"rule_{i}": True for i in range(1, 10)}
+CANNED_CHECKS = {
+    "checks": {**{f"LT_{i}": True for i in range(1, 10)}, **{f"PT_{i}": True for i in range(1, 5)}},
+    "practical_questions": {}
+}
+CANNED_QUESTION_ANALYSIS = {
+    "question_intent": "Descriptive",
+    "question_difficulty_level": "L1",
+    "question_evaluation_type": "Application",
+    "evaluation_report": "The flowchart must read the inputs, process them and output the result.",
+    "reasoning": "The question asks for a direct flowchart of a basic procedure."
+}
+MALFORMED_OUTPUTS = (
+    "I'm sorry, I cannot make out the flowchart in this image.",
+    '{"nodes": [{"id": 1, "type": "start", "text": "Sta',
+    "The flowchart starts, reads two numbers and prints them."
+)
+NS_PER_SECOND = 1_000_000_000
+
+def image_hash(image: str) -> str:
+    """SHA-256 of an image as sent in a chat request (base64 in the JSON body)."""
+    return hashlib.sha256(base64.b64decode(image)).hexdigest()
+
+class FakeOllama:
+    """
+    The fake server's behaviour and state. `responses` maps image hashes to a
+    response (a string, or JSON-serializable data). Latency is
+    `latency` ± `jitter` seconds per call plus `seconds_per_token` per generated
+    token, and `load_seconds` whenever the model changes. `failure_rate` and
+    `malformed_rate` are probabilities per call. A fixed `seed` makes the
+    injected latency, failures and malformed outputs reproducible.
+    """
+
+    def __init__(self, responses: dict = None, latency: float = 0.0, jitter: float = 0.0,
+                 seconds_per_token: float = 0.0, load_seconds: float = 0.0,
+                 failure_rate: float = 0.0, malformed_rate: float = 0.0, seed: int = 0):
+        self.responses = dict(responses or {})
+        self.latency = latency
+        self.jitter = jitter
+        self.seconds_per_token = seconds_per_token
+        self.load_seconds = load_seconds
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.requests = []
+        self.loads = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._resident = None
+        self._server = None
+        self._thread = None
+
+    # -------------------------
+    # Responses
+    # -------------------------
+    def answer(self, body: dict) -> str:
+        messages = body.get("messages") or []
+        message = messages[-1] if messages else {}
+        content = message.get("content") or ""
+        images = message.get("images") or []
+        if content.startswith(CLASSIFICATION_TEMPLATE.prefix):
+            try:
+                nodes = json.loads(content[len(CLASSIFICATION_TEMPLATE.prefix):])
+            except json.JSONDecodeError:
+                nodes = []
+            return json.dumps([
+                {
+                    "id": node.get("id"),
+                    "original_type": node.get("type"),
+                    "text": node.get("text"),
+                    "classified_type": preclassify_node(node) or "process"
+                }
+                for node in nodes if isinstance(node, dict)
+            ])
+        if content.startswith(RULE_GRADING_TEMPLATE.prefix):
+            return json.dumps(CANNED_RULES)
+        if content.startswith(CHECKLIST_GRADING_TEMPLATE.prefix):
+            return json.dumps(CANNED_CHECKS)
+        if content.startswith(QUESTION_ANALYSIS_TEMPLATE.prefix):
+            return json.dumps(CANNED_QUESTION_ANALYSIS)
+        if images:
+            canned = self.responses.get(image_hash(images[0]), CANNED_FLOWCHART)
+            return canned if isinstance(canned, str) else json.dumps(canned)
+        return json.dumps({})
+
+    def plan(self, body: dict) -> dict:
+        """Decide the outcome of one request: its content (or failure), delay and reported stats."""
+        model = body.get("model", "")
+        prompt = "".join(message.get("content") or "" for message in body.get("messages") or [])
+        with self._lock:
+            self.requests.append({"model": model, "stream": bool(body.get("stream")), "format": body.get("format")})
+            failed = self._random.random() < self.failure_rate
+            malformed = self._random.random() < self.malformed_rate
+            malformed_output = self._random.choice(MALFORMED_OUTPUTS)
+            jitter = self._random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+            load = self._resident != model
+            if load:
+                self.loads += 1
+                self._resident = model
+        content = malformed_output if malformed else self.answer(body)
+        prompt_tokens = estimate_tokens(prompt)
+        eval_tokens = estimate_tokens(content)
+        load_seconds = self.load_seconds if load else 0.0
+        base_seconds = max(0.0, self.latency + jitter)
+        delay = base_seconds + eval_tokens * self.seconds_per_token + load_seconds
+        # The base latency is reported as one fifth prompt evaluation, the rest generation
+        prompt_seconds = base_seconds / 5
+        eval_seconds = delay - load_seconds - prompt_seconds
+        return {
+            "model": model,
+            "failed": failed,
+            "content": content,
+            "delay": delay,
+            "stats": {
+                "total_duration": int(delay * NS_PER_SECOND),
+                "load_duration": int(load_seconds * NS_PER_SECOND),
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(prompt_seconds * NS_PER_SECOND),
+                "eval_count": eval_tokens,
+                "eval_duration": max(1, int(eval_seconds * NS_PER_SECOND))
+            }
+        }
+
+    # -------------------------
+    # Server
+    # -------------------------
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Serve in a background thread; returns the base URL (port 0 picks a free port)."""
+        self._server = ThreadingHTTPServer((host, port), _handler_for(self))
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        if self._server is None:
+            self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def _handler_for(fake: FakeOllama):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, payload: dict) -> None:
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/api/tags":
+                self._send_json(200, {"models": []})
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except json.JSONDecodeError:
+                self._send_json(400, {"error": "invalid JSON body"})
+                return
+            if self.path == "/api/generate":
+                self._generate(body)
+            elif self.path == "/api/chat":
+                self._chat(body)
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def _generate(self, body: dict):
+            # Only model preloads (an empty prompt) are supported
+            plan = fake.plan({"model": body.get("model"), "messages": []})
+            time.sleep(plan["delay"])
+            self._send_json(200, {"model": plan["model"], "response": "", "done": True, **plan["stats"]})
+
+        def _chat(self, body: dict):
+            plan = fake.plan(body)
+            if plan["failed"]:
+                time.sleep(plan["delay"] / 2)
+                self._send_json(500, {"error": "simulated model failure"})
+                return
+            created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            if not body.get("stream"):
+                time.sleep(plan["delay"])
+                self._send_json(200, {
+                    "model": plan["model"],
+                    "created_at": created,
+                    "message": {"role": "assistant", "content": plan["content"]},
+                    "done": True,
+                    "done_reason": "stop",
+                    **plan["stats"]
+                })
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            content = plan["content"]
+            pieces = [content[i:i + 16] for i in range(0, len(content), 16)] or [""]
+            pause = plan["delay"] / (len(pieces) + 1)
+            chunks = [
+                {"model": plan["model"], "created_at": created,
+                 "message": {"role": "assistant", "content": piece}, "done": False}
+                for piece in pieces
+            ]
+            chunks.append({"model": plan["model"], "created_at": created,
+                           "message": {"role": "assistant", "content": ""},
+                           "done": True, "done_reason": "stop", **plan["stats"]})
+            try:
+                for chunk in chunks:
+                    time.sleep(pause)
+                    line = (json.dumps(chunk) + "\n").encode("utf-8")
+                    self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client stopped the stream early
+
+    return Handler
+
+def load_responses(path: str) -> dict:
+    """Load recorded responses: a JSON object mapping image hashes to response text or JSON."""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--responses", help="JSON file mapping image SHA-256 to recorded responses")
+    parser.add_argument("--latency", type=float, default=0.2, help="Base seconds per call")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Uniform ± jitter in seconds")
+    parser.add_argument("--seconds-per-token", type=float, default=0.0)
+    parser.add_argument("--load-seconds", type=float, default=0.0, help="Added when the requested model changes")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    fake = FakeOllama(
+        load_responses(args.responses) if args.responses else None,
+        latency=args.latency, jitter=args.jitter, seconds_per_token=args.seconds_per_token,
+        load_seconds=args.load_seconds, failure_rate=args.failure_rate, malformed_rate=args.malformed_rate,
+        seed=args.seed
+    )
+    url = fake.start(args.host, args.port)
+    print(f"Fake Ollama listening on {url}")
+    try:
+        fake._thread.join()
+    except KeyboardInterrupt:
+        fake.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+from collections import deque
+
+DECISION_TYPES = {"if", "decision"}
+
+class FlowchartGraph:
+    """
+    Compact, integer-indexed view of a flowchart JSON built once per flowchart.
+
+    Nodes are numbered 0..n-1 in document order. Node ids map to the index of
+    their first occurrence, edges between known ids become adjacency lists, and
+    in/out degrees, per-type indices and label presence are computed in the same
+    single pass, so every logic test reads precomputed arrays instead of
+    rescanning the JSON.
+    """
+
+    __slots__ = (
+        "ids", "types", "texts", "index", "out_adj", "in_degree", "out_degree",
+        "edge_endpoint_ids", "type_counts", "type_indices", "unlabeled", "edge_count"
+    )
+
+    def __init__(self, flowchart_json: dict):
+        nodes = flowchart_json.get("nodes", []) or []
+        edges = flowchart_json.get("edges", []) or []
+        n = len(nodes)
+        self.ids = [None] * n
+        self.types = [None] * n
+        self.texts = [""] * n
+        self.index = {}
+        self.type_counts = {}
+        self.type_indices = {}
+        self.unlabeled = []
+        for i, node in enumerate(nodes):
+            node_id = node.get("id")
+            node_type = node.get("type")
+            text = node.get("text")
+            text = text.strip() if isinstance(text, str) else ("" if text is None else str(text))
+            self.ids[i] = node_id
+            self.types[i] = node_type
+            self.texts[i] = text
+            try:
+                self.index.setdefault(node_id, i)
+            except TypeError:  # unhashable id, e.g. a list; the node stays unreachable
+                pass
+            self.type_counts[node_type] = self.type_counts.get(node_type, 0) + 1
+            self.type_indices.setdefault(node_type, []).append(i)
+            if not text:
+                self.unlabeled.append(i)
+
+        self.out_adj = [[] for _ in range(n)]
+        self.in_degree = [0] * n
+        self.out_degree = [0] * n
+        self.edge_endpoint_ids = set()
+        self.edge_count = 0
+        for edge in edges:
+            frm = edge.get("from")
+            to = edge.get("to")
+            for endpoint in (frm, to):
+                try:
+                    self.edge_endpoint_ids.add(endpoint)
+                except TypeError:
+                    pass
+            i = self._lookup(frm)
+            j = self._lookup(to)
+            if i is None or j is None:
+                continue
+            self.out_adj[i].append(j)
+            self.out_degree[i] += 1
+            self.in_degree[j] += 1
+            self.edge_count += 1
+
+    def _lookup(self, node_id):
+        try:
+            return self.index.get(node_id)
+        except TypeError:
+            return None
+
+    @classmethod
+    def of(cls, flowchart) -> "FlowchartGraph":
+        """Return `flowchart` if it is already compiled, otherwise compile it."""
+        return flowchart if isinstance(flowchart, cls) else cls(flowchart)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def indices_of_type(self, *node_types) -> list:
+        found = []
+        for node_type in node_types:
+            found.extend(self.type_indices.get(node_type, ()))
+        return sorted(found)
+
+    def canonical_indices_of_type(self, *node_types) -> set:
+        """Indices that edges actually attach to (the first node for each id) for nodes of these types."""
+        found = set()
+        for i in self.indices_of_type(*node_types):
+            canonical = self._lookup(self.ids[i])
+            if canonical is not None:
+                found.add(canonical)
+        return found
+
+    def reachable_any(self, sources, targets) -> bool:
+        """Breadth-first search from `sources`; True as soon as any index in `targets` is reached."""
+        targets = set(targets)
+        seen = [False] * len(self.ids)
+        queue = deque()
+        for s in sources:
+            if not seen[s]:
+                seen[s] = True
+                queue.append(s)
+        while queue:
+            current = queue.popleft()
+            if current in targets:
+                return True
+            for nxt in self.out_adj[current]:
+                if not seen[nxt]:
+                    seen[nxt] = True
+                    queue.append(nxt)
+        return False
+
+    def strongly_connected_components(self) -> list:
+        """Iterative Tarjan's algorithm; returns a list of components (lists of node indices)."""
+        n = len(self.ids)
+        index_of = [-1] * n
+        lowlink = [0] * n
+        on_stack = [False] * n
+        stack = []
+        components = []
+        counter = 0
+        for root in range(n):
+            if index_of[root] != -1:
+                continue
+            work = [(root, 0)]
+            index_of[root] = lowlink[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            while work:
+                v, pos = work[-1]
+                adj = self.out_adj[v]
+                if pos < len(adj):
+                    work[-1] = (v, pos + 1)
+                    w = adj[pos]
+                    if index_of[w] == -1:
+                        index_of[w] = lowlink[w] = counter
+                        counter += 1
+                        stack.append(w)
+                        on_stack[w] = True
+                        work.append((w, 0))
+                    elif on_stack[w] and index_of[w] < lowlink[v]:
+                        lowlink[v] = index_of[w]
+                    continue
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if lowlink[v] < lowlink[parent]:
+                        lowlink[parent] = lowlink[v]
+                if lowlink[v] == index_of[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        component.append(w)
+                        if w == v:
+                            break
+                    components.append(component)
+        return components
+
+    def cycles(self) -> list:
+        """Strongly connected components that contain a cycle (more than one node, or a self-loop)."""
+        return [
+            component for component in self.strongly_connected_components()
+            if len(component) > 1 or component[0] in self.out_adj[component[0]]
+        ]
+
+    def has_exit(self, component: list, from_types: set = DECISION_TYPES) -> bool:
+        """True if a node of `from_types` inside the component has an edge leaving it."""
+        members = set(component)
+        for v in component:
+            if self.types[v] in from_types and any(w not in members for w in self.out_adj[v]):
+                return True
+        return False
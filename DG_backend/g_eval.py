@@ -1,10 +1,19 @@
 import ollama
-import hashlib
 import json
-import re
 import os
+import time
 from pathlib import Path
 from dotenv import load_dotenv
+from stage_cache import StageCache, make_cache_key
+from image_preprocess import prepare_image
+from node_rules import NodeTypeMemo, merge_llm_classification, split_nodes
+from json_stream import IncrementalJSONScanner, INVALID, PENDING
+from flowchart_graph import FlowchartGraph
+from lenient_json import FAILED, REPAIRED, parse_lenient_json_status
+from prompt_templates import CLASSIFICATION_TEMPLATE, EXTRACTION_TEMPLATE, prompt_token_estimate
+from metrics import (
+    record_evaluation, record_json_repair, record_llm_call, record_parse_failure, record_retry, stage, track_timings
+)
 
 # Load environment variables from a .env file
 load_dotenv()
@@ -21,60 +30,101 @@ class Config:
     ALLOWED_EXTENSIONS = json.loads(os.getenv("ALLOWED_EXTENSIONS", '["jpg", "jpeg", "png"]'))
     MAX_SCORE = int(os.getenv("MAX_SCORE", 100))
     MIN_SCORE = int(os.getenv("MIN_SCORE", 0))
+    # On-disk cache for the extraction and classification stages
+    CACHE_ENABLED = os.getenv("STAGE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+    CACHE_PATH = os.getenv("STAGE_CACHE_PATH", str(Path(__file__).parent / ".cache" / "stage_cache.sqlite3"))
+    CACHE_MAX_BYTES = int(os.getenv("STAGE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    # Image preprocessing: longest side sent to the vision model and optional crop to the diagram
+    IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", 1120))
+    IMAGE_CROP = os.getenv("IMAGE_CROP", "false").lower() in ("1", "true", "yes")
+    # Send all extraction attempts at once and keep the first valid one
+    SPECULATIVE_EXTRACTION = os.getenv("SPECULATIVE_EXTRACTION", "false").lower() in ("1", "true", "yes")
+    # Extraction requests in flight at once for speculative extraction in the synchronous pipeline, across threads
+    SPECULATIVE_CONCURRENCY = int(os.getenv("SPECULATIVE_CONCURRENCY", 3))
+    # Stream responses and stop generation as soon as the JSON closes (or cannot be valid)
+    STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "false").lower() in ("1", "true", "yes")
+    # Constrain extraction and classification output with a JSON Schema (Ollama `format`)
+    STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "false").lower() in ("1", "true", "yes")
+    # Also run the graph checks LT_7-LT_9 (loop termination, labels, decision branches).
+    # They add 50 to the total weight, so turning them on changes every grade.
+    EXTENDED_LOGIC_TESTS = os.getenv("EXTENDED_LOGIC_TESTS", "false").lower() in ("1", "true", "yes")
+    # Estimated prompt tokens of node data per packed (cross-flowchart) classification call
+    CLASSIFICATION_PACK_TOKENS = int(os.getenv("CLASSIFICATION_PACK_TOKENS", 800))
+
+_stage_cache = None
+
+def get_stage_cache():
+    """Return the shared stage cache, or None when caching is disabled."""
+    global _stage_cache
+    if not Config.CACHE_ENABLED:
+        return None
+    if _stage_cache is None:
+        _stage_cache = StageCache(Config.CACHE_PATH, Config.CACHE_MAX_BYTES)
+    return _stage_cache
 
 def validate_image_path(image_path: str) -> bool:
     """Ensure the image file exists and has an allowed extension."""
     path = Path(image_path)
     return path.exists() and path.suffix[1:].lower() in Config.ALLOWED_EXTENSIONS
 
-def fix_quotes_in_values(json_str: str) -> str:
+def extract_json_from_response(raw_response: str) -> dict:
     """
-    Heuristically fix unescaped double quotes within JSON string values.
+    Extract the JSON object from an LLM response.
+    Valid JSON is decoded directly (surrounding prose is ignored); anything else
+    goes through the single-pass repair in `lenient_json` (fences, comments,
+    trailing commas, single quotes, unescaped inner quotes, truncated output).
+    Responses that needed the repair are counted with `record_json_repair`.
     """
-    def replacer(match):
-        prefix = match.group(1)
-        content = match.group(2)
-        suffix = match.group(3)
-        fixed_content = re.sub(r'(?<!\\)"', r'\\"', content)
-        return f"{prefix}{fixed_content}{suffix}"
-    pattern = re.compile(r'(:\s*")([^"]*?)(")')
-    fixed_str = pattern.sub(replacer, json_str)
-    return fixed_str
+    with stage("json_parse"):
+        value, status = parse_lenient_json_status(raw_response, expect="object")
+    if status == REPAIRED:
+        record_json_repair()
+    elif status == FAILED:
+        record_parse_failure()
+        print("Failed to recover JSON object from response.")
+    return value if isinstance(value, dict) else None
 
-def extract_json_from_response(raw_response: str) -> dict:
+# Expected top-level shapes, used to stop streamed responses early
+EXTRACTION_SHAPE = {"container": "{", "array_keys": ("nodes", "edges")}
+CLASSIFICATION_SHAPE = {"container": "["}
+
+def response_format(schema: dict):
+    """The Ollama `format` argument for a call: the JSON Schema with Config.STRUCTURED_OUTPUT, else None."""
+    return schema if Config.STRUCTURED_OUTPUT and schema else None
+
+def chat_content(model: str, messages: list, options: dict, shape: dict, schema: dict = None) -> tuple:
     """
-    Extract and clean the JSON portion from an LLM response.
-    This function grabs text from the first '{' to the last '}' and
-    attempts to load it. If that fails, it applies heuristic fixes.
+    Call the model and return the response content together with the response.
+    With Config.STRUCTURED_OUTPUT, `schema` is passed as the `format` option so
+    the model's output is constrained to it.
+    With Config.STREAM_RESPONSES the response is streamed through an
+    IncrementalJSONScanner: generation stops as soon as the top-level JSON value
+    closes (the content is then just that value) or as soon as the partial output
+    cannot take the expected `shape`. The returned response is then the last chunk.
+    Every call is timed and recorded with the durations and token counts Ollama reports.
     """
-    # Grab content between the first '{' and the last '}'
-    start_idx = raw_response.find('{')
-    end_idx = raw_response.rfind('}')
-    if start_idx == -1 or end_idx == -1:
-        return None
-    json_str = raw_response[start_idx:end_idx+1]
-    json_str = (
-        json_str.strip()
-        .replace('\\\n', '')
-        .replace('```', '')
-        .replace('...', '')
-        .replace("'", '"')
-    )
-    # Remove trailing commas
-    json_str = re.sub(r',\s*}', '}', json_str)
-    json_str = re.sub(r',\s*]', ']', json_str)
+    started = time.perf_counter()
+    output_format = response_format(schema)
+    if not Config.STREAM_RESPONSES:
+        response = ollama.chat(model=model, messages=messages, options=options, format=output_format)
+        record_llm_call(model, time.perf_counter() - started, response, prompt_token_estimate(messages))
+        return response['message']['content'], response
+    scanner = IncrementalJSONScanner(**shape)
+    stream = ollama.chat(model=model, messages=messages, options=options, format=output_format, stream=True)
+    last = None
     try:
-        return json.loads(json_str)
-    except json.JSONDecodeError as e:
-        print(f"JSON Decode Error: {e}")
-        print("Problematic JSON:", json_str)
-        fixed_json_str = fix_quotes_in_values(json_str)
-        try:
-            return json.loads(fixed_json_str)
-        except json.JSONDecodeError as e2:
-            print(f"Fixed JSON still fails: {e2}")
-            print("Fixed JSON:", fixed_json_str)
-            return None
+        for chunk in stream:
+            last = chunk
+            if scanner.feed(chunk['message']['content']) != PENDING:
+                break
+    finally:
+        # Closing the stream drops the connection, which stops generation on the server
+        stream.close()
+    record_llm_call(model, time.perf_counter() - started, last, prompt_token_estimate(messages))
+    if scanner.state == INVALID:
+        print(f"Stopped streamed response from {model} early: {scanner.reason}")
+        return scanner.text, last
+    return scanner.json_text, last
 
 def normalize_flowchart_json(flowchart_json: dict) -> dict:
     """
@@ -91,6 +141,23 @@ def normalize_flowchart_json(flowchart_json: dict) -> dict:
 # Allowed node types for our application
 VALID_NODE_TYPES = {"start", "end", "input", "output", "if", "decision", "print", "process", "stack", "loop"}
 
+CLASSIFICATION_OPTIONS = {'temperature': 0, 'seed': Config.SEED}
+
+# JSON Schema for the classification answer. Ids may be namespaced strings in packed prompts.
+CLASSIFICATION_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "id": {"anyOf": [{"type": "integer"}, {"type": "string"}]},
+            "original_type": {"type": "string"},
+            "text": {"type": "string"},
+            "classified_type": {"type": "string", "enum": sorted(VALID_NODE_TYPES)}
+        },
+        "required": ["id", "original_type", "text", "classified_type"]
+    }
+}
+
 def classify_node_types_with_llm(nodes: list) -> list:
     """
     Use the LLM to classify node types.
@@ -99,38 +166,36 @@ def classify_node_types_with_llm(nodes: list) -> list:
     and asks the LLM to assign one of the allowed types. The response should be
     a JSON array with entries like:
     {"id": <node id>, "original_type": "<raw type>", "text": "<node text>", "classified_type": "<classified type>"}
+    The nodes are appended as compact JSON after the fixed instructions of CLASSIFICATION_TEMPLATE.
     """
-    prompt = f"""
-You are a flowchart expert. Classify each node in the following list into one of these types:
-["start", "end", "input", "output", "if", "decision", "print", "process", "stack", "loop"].
-If unsure, choose the closest type.
-Return only valid JSON in the following format:
-[
-  {{"id": <node id>, "original_type": "<raw type>", "text": "<node text>", "classified_type": "<classified type>"}},
-  ...
-]
-Nodes:
-{json.dumps(nodes, indent=2)}
-"""
-    response = ollama.chat(
-        model=Config.CLASSIFICATION_MODEL,
-        messages=[{'role': 'user', 'content': prompt}],
-        options={'temperature': 0, 'seed': Config.SEED}
+    prompt = CLASSIFICATION_TEMPLATE.render(nodes)
+    content, _ = chat_content(
+        Config.CLASSIFICATION_MODEL,
+        [{'role': 'user', 'content': prompt}],
+        CLASSIFICATION_OPTIONS,
+        CLASSIFICATION_SHAPE,
+        CLASSIFICATION_SCHEMA
     )
-    # Extract the JSON array from the response. We assume that the response
-    # contains a JSON array starting at the first '['.
-    start_idx = response['message']['content'].find('[')
-    end_idx = response['message']['content'].rfind(']')
-    if start_idx == -1 or end_idx == -1:
+    return parse_classification_response(content)
+
+def parse_classification_response(content: str) -> list:
+    """Parse the JSON array of classified nodes out of a classification response."""
+    # Extract the JSON array from the response, starting at the first '['.
+    if content.find('[') == -1:
         raise ValueError("Failed to find JSON array in classification response.")
-    json_str = response['message']['content'][start_idx:end_idx+1]
-    try:
-        classified_nodes = json.loads(json_str)
-    except json.JSONDecodeError as e:
-        print("Error decoding classified nodes:", e)
+    with stage("json_parse"):
+        classified_nodes, status = parse_lenient_json_status(content, expect="array")
+    if status == REPAIRED:
+        record_json_repair()
+    if not isinstance(classified_nodes, list):
+        record_parse_failure()
+        print("Error decoding classified nodes from classification response.")
         classified_nodes = []
     return classified_nodes
 
+# Corpus-wide memo of LLM answers, keyed by normalized node text
+node_type_memo = NodeTypeMemo()
+
 def update_node_types(flowchart_json: dict, classified_nodes: list) -> dict:
     """
     Update the node types in the flowchart JSON using the classified results.
@@ -147,19 +212,18 @@ def update_node_types(flowchart_json: dict, classified_nodes: list) -> dict:
 # -------------------------
 def test_start_end(flowchart_json: dict):
     """LT_1: Check that there is exactly one start and one end node. Weight = 30"""
-    nodes = flowchart_json.get("nodes", [])
-    start_count = sum(1 for n in nodes if n.get("type") == "start")
-    end_count = sum(1 for n in nodes if n.get("type") == "end")
+    graph = FlowchartGraph.of(flowchart_json)
+    start_count = graph.type_counts.get("start", 0)
+    end_count = graph.type_counts.get("end", 0)
     passed = (start_count == 1 and end_count == 1)
     return passed, 30, ("Start/End nodes are correct." if passed else "There must be exactly one start and one end node.")
 
 def test_decision_condition(flowchart_json: dict):
     """LT_2: Check that decision (if/decision) nodes have a clear condition. Weight = 40"""
-    nodes = flowchart_json.get("nodes", [])
-    decision_nodes = [n for n in nodes if n.get("type") in {"if", "decision"}]
+    graph = FlowchartGraph.of(flowchart_json)
     passed = True
-    for node in decision_nodes:
-        cond = node.get("text", "").strip()
+    for i in graph.indices_of_type("if", "decision"):
+        cond = graph.texts[i]
         if not cond or not any(op in cond for op in ["==", ">=", "<=", ">", "<"]):
             passed = False
             break
@@ -167,61 +231,71 @@ def test_decision_condition(flowchart_json: dict):
 
 def test_connectivity(flowchart_json: dict):
     """LT_3: Check that all nodes are connected (no orphan nodes). Weight = 30"""
-    nodes = flowchart_json.get("nodes", [])
-    edges = flowchart_json.get("edges", [])
-    connected_ids = set()
-    for edge in edges:
-        connected_ids.add(edge.get("from"))
-        connected_ids.add(edge.get("to"))
-    all_ids = {n.get("id") for n in nodes}
-    passed = all_ids and all_ids.issubset(connected_ids)
+    graph = FlowchartGraph.of(flowchart_json)
+    all_ids = set(graph.index)
+    passed = bool(all_ids) and all_ids.issubset(graph.edge_endpoint_ids)
     return passed, 30, ("All nodes are connected." if passed else "There are orphan nodes (nodes that are not connected).")
 
 def test_sequence_order(flowchart_json: dict):
     """LT_4: Check that node IDs are unique and in ascending order. Weight = 20"""
-    nodes = flowchart_json.get("nodes", [])
-    ids = [n.get("id") for n in nodes]
-    unique_ids = set(ids)
-    if len(unique_ids) != len(ids):
+    graph = FlowchartGraph.of(flowchart_json)
+    ids = graph.ids
+    if len(graph.index) != len(ids):
         return False, 20, "Node IDs are not unique."
-    if ids != sorted(ids):
+    try:
+        ascending = all(a < b for a, b in zip(ids, ids[1:]))
+    except TypeError:
+        ascending = False
+    if not ascending:
         return False, 20, "Node IDs are not in ascending order."
     return True, 20, "Node IDs are unique and in ascending order."
 
 def test_path_existence(flowchart_json: dict):
     """LT_5: Check that there is at least one valid path from the start node to the end node. Weight = 20"""
-    nodes = flowchart_json.get("nodes", [])
-    edges = flowchart_json.get("edges", [])
-    start_ids = [n.get("id") for n in nodes if n.get("type") == "start"]
-    end_ids = [n.get("id") for n in nodes if n.get("type") == "end"]
-    if not start_ids or not end_ids:
+    graph = FlowchartGraph.of(flowchart_json)
+    start_nodes = graph.canonical_indices_of_type("start")
+    end_nodes = graph.canonical_indices_of_type("end")
+    if not start_nodes or not end_nodes:
         return False, 20, "Start or end node is missing."
-    adj = {}
-    for edge in edges:
-        frm = edge.get("from")
-        to = edge.get("to")
-        if frm is not None and to is not None:
-            adj.setdefault(frm, []).append(to)
-    visited = set()
-    queue = start_ids.copy()
-    found = False
-    while queue:
-        current = queue.pop(0)
-        if current in end_ids:
-            found = True
-            break
-        if current in visited:
-            continue
-        visited.add(current)
-        queue.extend(adj.get(current, []))
+    found = graph.reachable_any(start_nodes, end_nodes)
     return found, 20, ("A valid path exists from start to end." if found else "No valid path found from start to end.")
 
 def test_node_type_consistency(flowchart_json: dict):
     """LT_6: Check that every node's type is within the allowed set. Weight = 20"""
-    nodes = flowchart_json.get("nodes", [])
-    invalid_nodes = [n for n in nodes if n.get("type") not in VALID_NODE_TYPES]
-    passed = (len(invalid_nodes) == 0)
-    return passed, 20, ("All node types are valid." if passed else f"Invalid node types found: {[n.get('type') for n in invalid_nodes]}")
+    graph = FlowchartGraph.of(flowchart_json)
+    invalid_types = [t for t in graph.types if t not in VALID_NODE_TYPES]
+    passed = (len(invalid_types) == 0)
+    return passed, 20, ("All node types are valid." if passed else f"Invalid node types found: {invalid_types}")
+
+def test_loop_termination(flowchart_json: dict):
+    """LT_7: Check that every loop (cycle) can terminate through a decision with an exit edge. Weight = 20"""
+    graph = FlowchartGraph.of(flowchart_json)
+    endless = [c for c in graph.cycles() if not graph.has_exit(c, LOOP_EXIT_TYPES)]
+    passed = (len(endless) == 0)
+    if passed:
+        return True, 20, "All loops have a termination condition."
+    stuck_ids = sorted((graph.ids[i] for c in endless for i in c), key=str)
+    return False, 20, f"Loops without a termination condition found at nodes: {stuck_ids}"
+
+def test_labels_present(flowchart_json: dict):
+    """LT_8: Check that every node has a label. Weight = 10"""
+    graph = FlowchartGraph.of(flowchart_json)
+    passed = len(graph) > 0 and not graph.unlabeled
+    if passed:
+        return True, 10, "All nodes have labels."
+    return False, 10, f"Nodes without labels: {[graph.ids[i] for i in graph.unlabeled]}"
+
+def test_decision_branches(flowchart_json: dict):
+    """LT_9: Check that each decision (if/decision) node has exactly two outgoing edges. Weight = 20"""
+    graph = FlowchartGraph.of(flowchart_json)
+    decisions = sorted(graph.canonical_indices_of_type("if", "decision"))
+    bad = [graph.ids[i] for i in decisions if graph.out_degree[i] != 2]
+    passed = (len(bad) == 0)
+    return passed, 20, ("Every decision node has exactly two outgoing edges." if passed
+                        else f"Decision nodes without exactly two outgoing edges: {bad}")
+
+# Node types that may carry the exit edge out of a loop
+LOOP_EXIT_TYPES = {"if", "decision", "loop"}
 
 LOGIC_TESTS = {
     "LT_1": test_start_end,
@@ -229,21 +303,29 @@ LOGIC_TESTS = {
     "LT_3": test_connectivity,
     "LT_4": test_sequence_order,
     "LT_5": test_path_existence,
-    "LT_6": test_node_type_consistency
+    "LT_6": test_node_type_consistency,
+    "LT_7": test_loop_termination,
+    "LT_8": test_labels_present,
+    "LT_9": test_decision_branches
 }
 
+# Graph checks left out of the default rubric, so grades stay comparable (see Config.EXTENDED_LOGIC_TESTS)
+EXTENDED_LOGIC_IDS = ("LT_7", "LT_8", "LT_9")
+
 def run_logic_tests(flowchart_json: dict, selected_logic_ids: list) -> (int, list):
     """
     Run the selected logic tests on the flowchart JSON.
+    The flowchart is compiled into a FlowchartGraph once and shared by every test.
     Return a normalized score (based on Config.MAX_SCORE) and test details.
     """
+    graph = FlowchartGraph.of(flowchart_json)
     total_score = 0
     total_weight = 0
     details = []
     for lid in selected_logic_ids:
         test_func = LOGIC_TESTS.get(lid)
         if test_func:
-            passed, weight, message = test_func(flowchart_json)
+            passed, weight, message = test_func(graph)
             details.append({
                 "logic_id": lid,
                 "passed": passed,
@@ -269,99 +351,279 @@ def is_extraction_valid(flowchart_json: dict) -> bool:
     valid, _, _ = test_node_type_consistency(flowchart_json)
     return valid
 
-def extract_flowchart_json_with_retry(image_path: str, max_attempts: int = 3) -> dict:
+# JSON Schema for the extraction answer; node types are limited to the ones is_extraction_valid accepts
+EXTRACTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "nodes": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer"},
+                    "type": {"type": "string", "enum": sorted(VALID_NODE_TYPES)},
+                    "text": {"type": "string"}
+                },
+                "required": ["id", "type", "text"]
+            }
+        },
+        "edges": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "from": {"type": "integer"},
+                    "to": {"type": "integer"},
+                    "label": {"type": "string"}
+                },
+                "required": ["from", "to", "label"]
+            }
+        }
+    },
+    "required": ["nodes", "edges"]
+}
+
+def extraction_attempts(max_attempts: int = 3) -> list:
     """
-    Attempt to extract and normalize the flowchart JSON.
-    If the extraction is not valid (e.g. missing keys or invalid node types),
-    retry with modified parameters (incrementing temperature and seed) up to max_attempts.
+    Return the (temperature, seed) pair used for each extraction attempt.
+    Every retry raises the temperature by 0.2 (capped at 1.0) and bumps the seed.
     """
+    attempts = []
     current_temp = Config.TEMPERATURE
     current_seed = Config.SEED
-    attempt = 0
-    extraction_prompt = """Convert this flowchart image to JSON with:
-- "nodes": [{"id": int, "type": str, "text": str}]
-- "edges": [{"from": int, "to": int, "label": str}]
-Return only JSON."""
+    for _ in range(max_attempts):
+        attempts.append((current_temp, current_seed))
+        current_temp = min(current_temp + 0.2, 1.0)
+        current_seed += 1
+    return attempts
+
+def extraction_messages(image) -> list:
+    """Build the chat messages for the extraction call. `image` is a path or encoded image data."""
+    return [{
+        'role': 'user',
+        'content': EXTRACTION_TEMPLATE.render(),
+        'images': [image]
+    }]
+
+def parse_extraction_response(content: str) -> dict:
+    """Parse and normalize the flowchart JSON out of an extraction response."""
+    extracted = extract_json_from_response(content)
+    if extracted:
+        extracted = normalize_flowchart_json(extracted)
+    return extracted
+
+def extract_flowchart_json_with_attempt(image, max_attempts: int = 3) -> tuple:
+    """
+    Attempt to extract and normalize the flowchart JSON, one attempt at a time.
+    Returns the extraction and the 1-based attempt that produced a valid result,
+    or the last extraction and None when every attempt failed validation.
+    """
     extracted = None
-    while attempt < max_attempts:
-        response = ollama.chat(
-            model=Config.EXTRACTION_MODEL,
-            messages=[{
-                'role': 'user',
-                'content': extraction_prompt,
-                'images': [image_path]
-            }],
-            options={'temperature': current_temp, 'seed': current_seed}
+    for attempt, (current_temp, current_seed) in enumerate(extraction_attempts(max_attempts)):
+        if attempt > 0:
+            record_retry()
+        content, _ = chat_content(
+            Config.EXTRACTION_MODEL,
+            extraction_messages(image),
+            {'temperature': current_temp, 'seed': current_seed},
+            EXTRACTION_SHAPE,
+            EXTRACTION_SCHEMA
         )
-        extracted = extract_json_from_response(response['message']['content'])
-        if extracted:
-            extracted = normalize_flowchart_json(extracted)
+        extracted = parse_extraction_response(content)
         if extracted and is_extraction_valid(extracted):
             print(f"Extraction succeeded on attempt {attempt+1} with temperature {current_temp}")
-            return extracted
-        else:
-            print(f"Extraction attempt {attempt+1} failed validation. Retrying with increased temperature.")
-            current_temp = min(current_temp + 0.2, 1.0)
-            current_seed += 1
-            attempt += 1
+            return extracted, attempt + 1
+        print(f"Extraction attempt {attempt+1} failed validation. Retrying with increased temperature.")
+    return extracted, None
+
+def extract_flowchart_json_with_retry(image_path: str, max_attempts: int = 3) -> dict:
+    """
+    Attempt to extract and normalize the flowchart JSON.
+    `image_path` may also be a base64 payload from `prepare_image`, which is
+    then reused as-is by every attempt instead of re-reading the file.
+    If the extraction is not valid (e.g. missing keys or invalid node types),
+    retry with modified parameters (incrementing temperature and seed) up to max_attempts.
+    """
+    extracted, _ = extract_flowchart_json_with_attempt(image_path, max_attempts)
     return extracted
 
 # -------------------------
 # LLM-Assisted Logic Selection (Optional)
 # -------------------------
 def choose_logic_ids(problem_description: str) -> list:
-    """Return all available logic test IDs. (This could be refined via an LLM call.)"""
-    return list(LOGIC_TESTS.keys())
+    """
+    Return the logic test IDs of the rubric: LT_1-LT_6, plus EXTENDED_LOGIC_IDS
+    when Config.EXTENDED_LOGIC_TESTS is set. (This could be refined via an LLM call.)
+    """
+    return [lid for lid in LOGIC_TESTS if Config.EXTENDED_LOGIC_TESTS or lid not in EXTENDED_LOGIC_IDS]
 
 # -------------------------
-# High-Level Evaluation Function
+# Cached Pipeline Stages
 # -------------------------
-def graph_based_g_eval(image_path: str, problem_description: str) -> dict:
+def extraction_cache_key(image_hash: str, max_attempts: int, speculative: bool = False) -> str:
+    """Key the extraction stage on the image content plus everything that shapes the model's answer."""
+    options = {
+        "mode": "speculative" if speculative else "sequential",
+        "temperature": Config.TEMPERATURE,
+        "seed": Config.SEED,
+        "max_attempts": max_attempts,
+        "image_max_side": Config.IMAGE_MAX_SIDE,
+        "image_crop": Config.IMAGE_CROP,
+        "structured_output": Config.STRUCTURED_OUTPUT
+    }
+    return make_cache_key("extraction", image_hash, Config.EXTRACTION_MODEL, EXTRACTION_TEMPLATE.prefix, options)
+
+def classification_cache_key(nodes: list) -> str:
+    """Key the classification stage on the node list and the classification model."""
+    return make_cache_key("classification", nodes, Config.CLASSIFICATION_MODEL, CLASSIFICATION_TEMPLATE.prefix,
+                          CLASSIFICATION_OPTIONS, response_format(CLASSIFICATION_SCHEMA))
+
+def cached_extract_flowchart_json(image, image_hash: str, cache=None, max_attempts: int = 3, speculative: bool = False):
     """
-    Evaluate a flowchart image by first extracting its JSON (with retry if needed),
-    then classifying node types via an LLM, updating the JSON, and finally running
-    graph-based logic tests on the updated JSON.
+    Run the extraction stage through the stage cache.
+    `image` is an image path or a pre-encoded payload.
+    Returns the flowchart JSON, whether it was served from the cache and the
+    attempt that produced it (None for cache hits and failed extractions).
+    Only extractions that pass validation are stored, so a bad sample is retried next time.
+    """
+    key = extraction_cache_key(image_hash, max_attempts, speculative)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, True, None
+    if speculative:
+        # Imported here because async_g_eval builds on this module
+        from async_g_eval import run_speculative_extraction
+        flowchart_json, attempt = run_speculative_extraction(image, max_attempts=max_attempts)
+    else:
+        flowchart_json, attempt = extract_flowchart_json_with_attempt(image, max_attempts=max_attempts)
+    if cache is not None and flowchart_json and is_extraction_valid(flowchart_json):
+        cache.set(key, "extraction", flowchart_json)
+    return flowchart_json, False, attempt
+
+def cached_classify_node_types(nodes: list, cache=None):
+    """
+    Run the classification stage through the stage cache.
+    Returns the classified nodes and whether they were served from the cache.
+    """
+    key = classification_cache_key(nodes)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, True
+    classified_nodes = classify_node_types_with_llm(nodes)
+    if cache is not None and classified_nodes:
+        cache.set(key, "classification", classified_nodes)
+    return classified_nodes, False
+
+def classify_nodes(nodes: list, cache=None) -> tuple:
     """
-    result = {
+    Classify node types with the deterministic rules and the node memo first,
+    sending only the unresolved nodes to the LLM. Returns the classified nodes
+    and the LLM stage status: "skipped" when no node needed the LLM, otherwise
+    "hit"/"miss" from the stage cache (or "called" without a cache).
+    """
+    classified, unresolved = split_nodes(nodes, node_type_memo)
+    if not unresolved:
+        return classified, "skipped"
+    llm_classified, hit = cached_classify_node_types(unresolved, cache)
+    status = ("hit" if hit else "miss") if cache is not None else "called"
+    return merge_llm_classification(nodes, classified, llm_classified, node_type_memo, VALID_NODE_TYPES), status
+
+# -------------------------
+# High-Level Evaluation Function
+# -------------------------
+def new_result() -> dict:
+    """Return an empty evaluation result carrying the current configuration."""
+    return {
         "image_hash": "",
         "score": 0,
-        "details": {"logic_results": [], "classification": []},
+        "details": {"logic_results": [], "classification": [], "extraction_attempt": None},
         "flowchart_json": {},
         "error": None,
+        "cache": {"extraction": "disabled", "classification": "disabled"},
         "config": {
             "extraction_model": Config.EXTRACTION_MODEL,
             "classification_model": Config.CLASSIFICATION_MODEL,
             "grading_logic": "Graph Analysis",
+            "extraction_mode": "sequential",
+            "structured_output": Config.STRUCTURED_OUTPUT,
             "temperature": Config.TEMPERATURE,
             "seed": Config.SEED
         }
     }
+
+def prepare_image_for_eval(result: dict, image_path: str):
+    """Read, hash and encode the image once, recording its hash and size on the result."""
+    prepared = prepare_image(image_path, max_side=Config.IMAGE_MAX_SIDE, crop=Config.IMAGE_CROP)
+    result["image_hash"] = prepared.sha256
+    result["details"]["image"] = prepared.describe()
+    return prepared
+
+def apply_classification(result: dict, flowchart_json: dict, classified_nodes: list) -> dict:
+    """Record the classified nodes on the result and update the JSON with the classified node types."""
+    result["details"]["classification"] = classified_nodes
+    flowchart_json = update_node_types(flowchart_json, classified_nodes)
+    result["flowchart_json"] = flowchart_json
+    return flowchart_json
+
+def apply_logic_tests(result: dict, flowchart_json: dict, problem_description: str) -> dict:
+    """Run the graph-based logic tests and record the score and details on the result."""
+    selected_logic_ids = choose_logic_ids(problem_description)
+    with stage("logic_tests"):
+        score, logic_details = run_logic_tests(flowchart_json, selected_logic_ids)
+    result["score"] = score
+    result["details"]["logic_results"] = logic_details
+    return result
+
+def graph_based_g_eval(image_path: str, problem_description: str, use_cache: bool = True, speculative: bool = None) -> dict:
+    """
+    Evaluate a flowchart image by first extracting its JSON (with retry if needed),
+    then classifying node types via an LLM, updating the JSON, and finally running
+    graph-based logic tests on the updated JSON.
+    Extraction and classification results are reused from the stage cache when
+    the same image, model and options have been seen before.
+    With `speculative` (default: Config.SPECULATIVE_EXTRACTION) all extraction
+    attempts are sent at once and the first valid response wins.
+    Per-stage and per-call timings are attached as `result["config"]["timings"]`.
+    """
+    with track_timings() as timings:
+        result = _graph_based_g_eval(image_path, problem_description, use_cache, speculative)
+    return record_evaluation(result, timings)
+
+def _graph_based_g_eval(image_path: str, problem_description: str, use_cache: bool, speculative: bool) -> dict:
+    cache = get_stage_cache() if use_cache else None
+    speculative = Config.SPECULATIVE_EXTRACTION if speculative is None else speculative
+    result = new_result()
+    result["config"]["extraction_mode"] = "speculative" if speculative else "sequential"
     try:
         if not validate_image_path(image_path):
             raise ValueError(f"Invalid image file: {image_path}")
-        with open(image_path, "rb") as f:
-            image_bytes = f.read()
-            result["image_hash"] = hashlib.sha256(image_bytes).hexdigest()
+        with stage("image"):
+            prepared = prepare_image_for_eval(result, image_path)
         # --- Phase 1: Extraction (with retry) ---
-        flowchart_json = extract_flowchart_json_with_retry(image_path, max_attempts=3)
+        with stage("extraction"):
+            flowchart_json, hit, attempt = cached_extract_flowchart_json(
+                prepared.data, result["image_hash"], cache, max_attempts=3, speculative=speculative
+            )
+        result["details"]["extraction_attempt"] = attempt
+        if cache is not None:
+            result["cache"]["extraction"] = "hit" if hit else "miss"
         if not flowchart_json:
             raise ValueError("Failed to extract valid JSON from extraction response.")
         result["flowchart_json"] = flowchart_json
 
-        # --- Phase 2: Node Type Classification via LLM ---
+        # --- Phase 2: Node Type Classification (rules first, LLM for the rest) ---
         nodes_raw = flowchart_json.get("nodes", [])
         if nodes_raw:
-            classified_nodes = classify_node_types_with_llm(nodes_raw)
-            result["details"]["classification"] = classified_nodes
-            # Update the JSON with the classified node types.
-            flowchart_json = update_node_types(flowchart_json, classified_nodes)
-            result["flowchart_json"] = flowchart_json
+            with stage("classification"):
+                classified_nodes, status = classify_nodes(nodes_raw, cache)
+            if cache is not None or status == "skipped":
+                result["cache"]["classification"] = status
+            flowchart_json = apply_classification(result, flowchart_json, classified_nodes)
 
         # --- Phase 3: Graph-Based Logic Evaluation ---
-        selected_logic_ids = choose_logic_ids(problem_description)
-        score, logic_details = run_logic_tests(flowchart_json, selected_logic_ids)
-        result["score"] = score
-        result["details"]["logic_results"] = logic_details
+        apply_logic_tests(result, flowchart_json, problem_description)
 
     except Exception as e:
         result["error"] = str(e)
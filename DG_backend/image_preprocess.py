@@ -0,0 +1,113 @@
+import base64
+import hashlib
+import io
+from typing import NamedTuple, Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it images are sent as-is
+    Image = None
+    ImageOps = None
+
+# llama3.2-vision splits images into 560x560 tiles and uses at most 2x2 of them,
+# so anything larger than 1120px on a side is downscaled by Ollama anyway.
+DEFAULT_MAX_SIDE = 1120
+# Pixels darker than this (after autocontrast) count as ink when cropping.
+INK_THRESHOLD = 128
+CROP_MARGIN = 0.02
+
+class PreparedImage(NamedTuple):
+    """An image read, hashed and encoded once, ready to be reused by every LLM call."""
+    sha256: str
+    data: str
+    width: int
+    height: int
+    original_bytes: int
+    encoded_bytes: int
+    resized: bool
+    cropped: bool
+
+    def describe(self) -> dict:
+        return {
+            "width": self.width,
+            "height": self.height,
+            "original_bytes": self.original_bytes,
+            "encoded_bytes": self.encoded_bytes,
+            "resized": self.resized,
+            "cropped": self.cropped
+        }
+
+def read_and_hash(image_path: str, chunk_size: int = 1 << 20) -> tuple:
+    """Read an image file once, hashing it while streaming. Returns (sha256 hex digest, raw bytes)."""
+    hasher = hashlib.sha256()
+    buffer = bytearray()
+    with open(image_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+            buffer.extend(chunk)
+    return hasher.hexdigest(), bytes(buffer)
+
+def diagram_bounding_box(image) -> Optional[tuple]:
+    """Return the padded bounding box of the dark strokes in the image, or None if nothing is drawn."""
+    gray = ImageOps.autocontrast(image.convert("L"))
+    ink = gray.point(lambda p: 255 if p < INK_THRESHOLD else 0)
+    bbox = ink.getbbox()
+    if bbox is None:
+        return None
+    margin_x = int(image.width * CROP_MARGIN)
+    margin_y = int(image.height * CROP_MARGIN)
+    left, top, right, bottom = bbox
+    return (
+        max(0, left - margin_x),
+        max(0, top - margin_y),
+        min(image.width, right + margin_x),
+        min(image.height, bottom + margin_y)
+    )
+
+def prepare_image(image_path: str, max_side: int = DEFAULT_MAX_SIDE, crop: bool = False) -> PreparedImage:
+    """
+    Read the image once, hash the original bytes, then downscale it to the vision
+    model's native resolution (optionally cropping to the diagram first) and
+    base64-encode the result. The hash always refers to the original file so it
+    stays stable across preprocessing settings.
+    """
+    sha256, raw = read_and_hash(image_path)
+    unprocessed = PreparedImage(sha256, base64.b64encode(raw).decode(), 0, 0, len(raw), len(raw), False, False)
+    if Image is None:
+        return unprocessed
+    try:
+        image = Image.open(io.BytesIO(raw))
+    except OSError:
+        # Not something Pillow can decode; let the model see the original bytes
+        return unprocessed
+    source_format = image.format
+    image = ImageOps.exif_transpose(image)
+    cropped = False
+    if crop:
+        bbox = diagram_bounding_box(image)
+        if bbox and bbox != (0, 0, image.width, image.height):
+            image = image.crop(bbox)
+            cropped = True
+    resized = max(image.size) > max_side
+    if resized:
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    if not (resized or cropped) and source_format in ("JPEG", "PNG"):
+        payload = raw
+    else:
+        out = io.BytesIO()
+        if image.mode in ("RGBA", "LA", "P"):
+            image.save(out, format="PNG", optimize=True)
+        else:
+            image.convert("RGB").save(out, format="JPEG", quality=90)
+        payload = out.getvalue()
+    return PreparedImage(
+        sha256,
+        base64.b64encode(payload).decode(),
+        image.width,
+        image.height,
+        len(raw),
+        len(payload),
+        resized,
+        cropped
+    )
@@ -0,0 +1,114 @@
+PENDING = "pending"
+COMPLETE = "complete"
+INVALID = "invalid"
+
+class IncrementalJSONScanner:
+    """
+    Incrementally scan streamed model output for one top-level JSON value.
+
+    `feed` returns COMPLETE as soon as the top-level object or array closes, so
+    generation can be stopped instead of waiting for trailing prose, and INVALID
+    as soon as the partial output can no longer have the required shape:
+    - no opening `container` within `max_preamble` characters,
+    - a top-level key listed in `array_keys` whose value does not start with '[',
+    - a top-level array whose first element is not an object (for `container="["`).
+    """
+
+    def __init__(self, container: str = "{", array_keys: tuple = (), max_preamble: int = 2000):
+        self.container = container
+        self.closer = "}" if container == "{" else "]"
+        self.array_keys = set(array_keys)
+        self.max_preamble = max_preamble
+        self.state = PENDING
+        self.reason = None
+        self._chunks = []
+        self._length = 0
+        self._start = None
+        self._end = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_chars = []
+        self._expect_key = False
+        self._last_key = None
+        self._pending_value_key = None
+        self._expect_first_element = False
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    @property
+    def json_text(self) -> str:
+        """The top-level JSON value when complete, otherwise everything received so far."""
+        text = self.text
+        if self._start is None:
+            return text
+        return text[self._start:self._end] if self._end is not None else text[self._start:]
+
+    def _fail(self, reason: str) -> str:
+        self.state = INVALID
+        self.reason = reason
+        return self.state
+
+    def feed(self, chunk: str) -> str:
+        if self.state != PENDING or not chunk:
+            return self.state
+        offset = self._length
+        self._chunks.append(chunk)
+        self._length += len(chunk)
+        for i, ch in enumerate(chunk):
+            if self._start is None:
+                if ch == self.container:
+                    self._start = offset + i
+                    self._depth = 1
+                    self._expect_key = self.container == "{"
+                    self._expect_first_element = self.container == "["
+                elif offset + i >= self.max_preamble:
+                    return self._fail(f"no '{self.container}' within {self.max_preamble} characters")
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._expect_key:
+                        self._last_key = "".join(self._string_chars)
+                        self._expect_key = False
+                elif self._depth == 1 and self._expect_key:
+                    self._string_chars.append(ch)
+                continue
+
+            if ch.isspace():
+                continue
+            if self._pending_value_key is not None:
+                if self._pending_value_key in self.array_keys and ch != "[":
+                    return self._fail(f"'{self._pending_value_key}' is not an array")
+                self._pending_value_key = None
+            if self._expect_first_element:
+                self._expect_first_element = False
+                if ch not in "{]":
+                    return self._fail("top-level array does not contain objects")
+
+            if ch == '"':
+                self._in_string = True
+                self._string_chars = []
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    if ch != self.closer:
+                        return self._fail("mismatched closing bracket")
+                    self._end = offset + i + 1
+                    self.state = COMPLETE
+                    return self.state
+            elif self._depth == 1 and self.container == "{":
+                if ch == ":":
+                    self._pending_value_key = self._last_key
+                elif ch == ",":
+                    self._expect_key = True
+        return self.state
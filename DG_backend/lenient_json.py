@@ -0,0 +1,273 @@
+"""
+Single-pass tolerant JSON parser for LLM responses.
+
+`parse_lenient_json` first tries a strict decode starting at the first bracket
+(trailing prose is ignored). If that fails it repairs the text in one left-to-right
+scan and decodes the result once. When that gives an empty value (a bracket in
+prose such as "use {braces}"), the next brackets are tried the same way. The
+repair pass handles:
+- markdown fences, // and /* */ comments, `...` placeholders and stray prose
+- trailing and missing commas (after any value, strings included), missing colons
+- single-quoted strings and unquoted keys; True/False/None literals
+- unescaped double quotes inside strings (a quote only closes a string when
+  what follows it can continue the JSON), while apostrophes are left alone
+- truncated output: open strings, dangling keys and open containers are closed
+"""
+import json
+import re
+
+STRICT = "strict"
+REPAIRED = "repaired"
+FAILED = "failed"
+
+_decoder = json.JSONDecoder()
+_NUMBER = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?$")
+_BAREWORD = re.compile(r"[A-Za-z0-9_$+\-.]+")
+_LITERALS = {"true": "true", "false": "false", "null": "null",
+             "True": "true", "False": "false", "None": "null"}
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+# Brackets tried as the start of the value before giving up on an empty result
+_MAX_STARTS = 8
+
+# Container frame expectations
+_KEY, _COLON, _VALUE, _COMMA = range(4)
+
+def _find_start(text: str, expect: str = None, begin: int = 0) -> int:
+    if expect == "object":
+        return text.find("{", begin)
+    if expect == "array":
+        return text.find("[", begin)
+    starts = [i for i in (text.find("{", begin), text.find("[", begin)) if i != -1]
+    return min(starts) if starts else -1
+
+def _starts(text: str, expect: str = None):
+    """Positions of the brackets the value may start at, in order."""
+    start = _find_start(text, expect)
+    while start != -1:
+        yield start
+        start = _find_start(text, expect, start + 1)
+
+def _next_significant(text: str, j: int) -> int:
+    n = len(text)
+    while j < n and text[j] in " \t\r\n":
+        j += 1
+    return j
+
+def _closes_string(text: str, j: int, is_key: bool) -> bool:
+    """Decide whether a quote at text[j-1] ends the string, by looking at what follows it."""
+    k = _next_significant(text, j)
+    if k >= len(text):
+        return True
+    ch = text[k]
+    if ch in "}]":
+        return True
+    if ch == ":":
+        return is_key
+    if ch in "\"'" and not is_key:
+        # A quoted key right after it (`"y" "c": 1`): the comma before it is missing
+        end = text.find(ch, k + 1)
+        if end != -1:
+            k = _next_significant(text, end + 1)
+            return k < len(text) and text[k] == ":"
+    if ch == ",":
+        k = _next_significant(text, k + 1)
+        if k >= len(text):
+            return True
+        nxt = text[k]
+        if nxt in "\"'{[]}-0123456789`":
+            return True
+        if any(text.startswith(word, k) for word in _LITERALS):
+            return True
+        # An unquoted key such as `, text: "..."` also continues the JSON
+        match = _BAREWORD.match(text, k)
+        if match:
+            k = _next_significant(text, match.end())
+            return k < len(text) and text[k] == ":"
+    return False
+
+def repair_json(text: str, expect: str = None, start: int = None):
+    """
+    Repair the first JSON object/array in `text` (or the one opening at
+    `start`) in a single pass. Returns the repaired JSON text, or None when
+    there is no opening bracket.
+    """
+    if start is None:
+        start = _find_start(text, expect)
+    if start == -1:
+        return None
+    out = []
+    stack = []        # list of [container, expectation]
+    pending_comma = False
+    i = start
+    n = len(text)
+
+    def begin_value():
+        """Emit the separator a new value needs in the current frame, and return whether it is a key."""
+        nonlocal pending_comma
+        if not stack:
+            return False
+        frame = stack[-1]
+        if frame[1] == _COMMA:
+            out.append(",")
+            frame[1] = _KEY if frame[0] == "{" else _VALUE
+        elif pending_comma:
+            out.append(",")
+        pending_comma = False
+        if frame[0] == "{":
+            if frame[1] == _COLON:
+                out.append(":")
+                frame[1] = _VALUE
+            return frame[1] == _KEY
+        return False
+
+    def end_value(was_key: bool):
+        if stack:
+            stack[-1][1] = _COLON if was_key else _COMMA
+
+    while i < n and (stack or not out):
+        ch = text[i]
+        if ch in " \t\r\n":
+            i += 1
+        elif ch in "\"'":
+            is_key = begin_value()
+            quote = ch
+            chars = []
+            i += 1
+            closed = False
+            while i < n:
+                c = text[i]
+                if c == "\\" and i + 1 < n:
+                    e = text[i + 1]
+                    if e == "u" and i + 5 < n and re.fullmatch(r"[0-9a-fA-F]{4}", text[i + 2:i + 6]):
+                        chars.append(chr(int(text[i + 2:i + 6], 16)))
+                        i += 6
+                        continue
+                    if e == "\n":
+                        i += 2
+                        continue
+                    chars.append(_ESCAPES.get(e, e if e == "'" else "\\" + e))
+                    i += 2
+                    continue
+                if c == quote and _closes_string(text, i + 1, is_key):
+                    i += 1
+                    closed = True
+                    break
+                chars.append(c)
+                i += 1
+            out.append(json.dumps("".join(chars), ensure_ascii=False))
+            end_value(is_key)
+            if not closed:
+                break
+        elif ch in "{[":
+            begin_value()
+            out.append(ch)
+            stack.append([ch, _KEY if ch == "{" else _VALUE])
+            i += 1
+        elif ch in "}]":
+            opener = "{" if ch == "}" else "["
+            i += 1
+            if not any(frame[0] == opener for frame in stack):
+                continue  # stray closer
+            pending_comma = False
+            while stack:
+                frame = stack.pop()
+                if frame[0] == "{" and frame[1] == _VALUE:
+                    out.append("null")
+                elif frame[0] == "{" and frame[1] == _COLON:
+                    out.append(":null")
+                out.append("}" if frame[0] == "{" else "]")
+                if frame[0] == opener:
+                    break
+            end_value(False)
+        elif ch == ",":
+            if stack and stack[-1][1] == _COMMA:
+                stack[-1][1] = _KEY if stack[-1][0] == "{" else _VALUE
+                pending_comma = True
+            i += 1
+        elif ch == ":":
+            if stack and stack[-1][0] == "{" and stack[-1][1] == _COLON:
+                out.append(":")
+                stack[-1][1] = _VALUE
+            i += 1
+        elif ch == "/" and text.startswith("//", i):
+            end = text.find("\n", i)
+            i = n if end == -1 else end
+        elif ch == "/" and text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+        elif ch == "#":
+            end = text.find("\n", i)
+            i = n if end == -1 else end
+        elif ch == "." and text.startswith("...", i):
+            i += 3
+        else:
+            match = _BAREWORD.match(text, i)
+            if not match:
+                i += 1  # stray character (fence backtick, ellipsis glyph, prose punctuation)
+                continue
+            word = match.group(0)
+            i = match.end()
+            if stack and stack[-1][0] == "{" and stack[-1][1] in (_KEY, _COMMA):
+                # An unquoted key is only accepted when a colon follows it
+                k = _next_significant(text, i)
+                if k < n and text[k] == ":":
+                    is_key = begin_value()
+                    out.append(json.dumps(word))
+                    end_value(is_key)
+                continue
+            if word in _LITERALS:
+                token = _LITERALS[word]
+            elif _NUMBER.match(word):
+                token = word
+            elif stack and stack[-1][1] in (_VALUE, _COLON):
+                token = json.dumps(word)
+            else:
+                continue  # prose between values
+            is_key = begin_value()
+            out.append(token)
+            end_value(is_key)
+
+    # Truncated output: finish dangling keys and close every open container
+    while stack:
+        frame = stack.pop()
+        if frame[0] == "{" and frame[1] == _VALUE:
+            out.append("null")
+        elif frame[0] == "{" and frame[1] == _COLON:
+            out.append(":null")
+        out.append("}" if frame[0] == "{" else "]")
+        end_value(False)
+    return "".join(out)
+
+def parse_lenient_json_status(text: str, expect: str = None) -> tuple:
+    """
+    Parse the first JSON value in `text`. Returns (value, status) where status is
+    STRICT when the text was valid JSON, REPAIRED when the repair pass was needed
+    and FAILED (with value None) when nothing could be recovered.
+    `expect` ("object" or "array") picks which bracket the value starts at; an
+    empty value is only returned when none of the next brackets gives another.
+    """
+    if not text:
+        return None, FAILED
+    first = None
+    for attempt, start in enumerate(_starts(text, expect)):
+        if attempt == _MAX_STARTS:
+            break
+        try:
+            value, _ = _decoder.raw_decode(text, start)
+            status = STRICT
+        except json.JSONDecodeError:
+            try:
+                value = json.loads(repair_json(text, expect, start))
+            except json.JSONDecodeError:
+                continue
+            status = REPAIRED
+        if value:
+            return value, status
+        if first is None:
+            first = (value, status)
+    return first or (None, FAILED)
+
+def parse_lenient_json(text: str, expect: str = None):
+    """Parse the first JSON value in `text`, repairing it if needed; None when unrecoverable."""
+    return parse_lenient_json_status(text, expect)[0]
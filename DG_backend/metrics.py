@@ -0,0 +1,185 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import Counter, Histogram
+
+# -------------------------
+# Prometheus Metrics
+# -------------------------
+STAGE_SECONDS = Histogram(
+    "g_eval_stage_seconds", "Wall time of each grading stage", ["stage"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+LLM_CALL_SECONDS = Histogram(
+    "g_eval_llm_call_seconds", "Wall time of each model call", ["stage", "model"],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+)
+MODEL_LOAD_SECONDS = Histogram(
+    "g_eval_model_load_seconds", "Model load time reported by Ollama (load_duration)", ["model"],
+    buckets=(0.01, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+TOKENS_PER_SECOND = Histogram(
+    "g_eval_tokens_per_second", "Generation speed reported by Ollama (eval_count / eval_duration)", ["model"],
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200)
+)
+LLM_CALLS = Counter("g_eval_llm_calls_total", "Model calls", ["stage", "model"])
+PROMPT_TOKENS = Counter("g_eval_prompt_tokens_total", "Prompt tokens evaluated (prompt_eval_count)", ["model"])
+COMPLETION_TOKENS = Counter("g_eval_completion_tokens_total", "Tokens generated (eval_count)", ["model"])
+RETRIES = Counter("g_eval_retries_total", "Extraction attempts after the first", ["stage"])
+JSON_REPAIRS = Counter(
+    "g_eval_json_repairs_total", "Model responses that only parsed after the lenient repair pass", ["stage"]
+)
+PARSE_FAILURES = Counter("g_eval_parse_failures_total", "Model responses whose JSON could not be recovered", ["stage"])
+EVALUATIONS = Counter("g_eval_evaluations_total", "Completed evaluations", ["outcome"])
+
+NS_PER_SECOND = 1e9
+
+# -------------------------
+# Per-Evaluation Timings
+# -------------------------
+class Timings:
+    """
+    Timings of one evaluation: wall time per stage, one record per model call
+    (with the durations and token counts Ollama reports) and retry/parse-failure counts.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.llm_calls = []
+        self.retries = 0
+        self.json_repairs = 0
+        self.parse_failures = 0
+
+    def add_stage(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def as_dict(self) -> dict:
+        """JSON-serializable summary, attached to `result["config"]["timings"]`."""
+        return {
+            "total_seconds": round(time.perf_counter() - self.started, 6),
+            "stages": {stage: round(seconds, 6) for stage, seconds in self.stages.items()},
+            "llm_calls": self.llm_calls,
+            "retries": self.retries,
+            "json_repairs": self.json_repairs,
+            "parse_failures": self.parse_failures,
+            "model_load_seconds": round(sum(call.get("load_seconds") or 0 for call in self.llm_calls), 6),
+            "prompt_tokens": sum(call.get("prompt_tokens") or 0 for call in self.llm_calls),
+            "completion_tokens": sum(call.get("completion_tokens") or 0 for call in self.llm_calls)
+        }
+
+# The evaluation being timed and the stage currently running. Context variables
+# follow asyncio tasks and asyncio.to_thread, so concurrent evaluations in one
+# event loop each record into their own Timings.
+_timings = ContextVar("g_eval_timings", default=None)
+_stage = ContextVar("g_eval_stage", default="unstaged")
+
+@contextmanager
+def track_timings(timings: Timings = None):
+    """
+    Collect the timings of everything run inside the block into `timings`
+    (a new Timings by default). Passing the same Timings again resumes it, for
+    evaluations whose stages run at different times.
+    """
+    timings = timings if timings is not None else Timings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage; model calls made inside it are labelled with `name`."""
+    token = _stage.set(name)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        _stage.reset(token)
+        STAGE_SECONDS.labels(name).observe(elapsed)
+        timings = _timings.get()
+        if timings is not None:
+            timings.add_stage(name, elapsed)
+
+def _response_field(response, name: str):
+    if response is None:
+        return None
+    try:
+        return response.get(name)
+    except AttributeError:
+        return getattr(response, name, None)
+
+def record_llm_call(model: str, seconds: float, response, estimated_prompt_tokens: int = None) -> dict:
+    """
+    Record one model call. `response` is the final (or last streamed) Ollama
+    response; its durations are in nanoseconds and are missing when a stream
+    was stopped before the model finished. `estimated_prompt_tokens` is the
+    size of the text prompt sent; Ollama's prompt_eval_count is lower than it
+    when part of the prompt prefix was served from the model's KV cache.
+    """
+    stage_name = _stage.get()
+    load_ns = _response_field(response, "load_duration")
+    prompt_tokens = _response_field(response, "prompt_eval_count")
+    prompt_ns = _response_field(response, "prompt_eval_duration")
+    completion_tokens = _response_field(response, "eval_count")
+    eval_ns = _response_field(response, "eval_duration")
+    total_ns = _response_field(response, "total_duration")
+    tokens_per_second = completion_tokens / (eval_ns / NS_PER_SECOND) if completion_tokens and eval_ns else None
+    call = {
+        "stage": stage_name,
+        "model": model,
+        "seconds": round(seconds, 6),
+        "total_seconds": total_ns / NS_PER_SECOND if total_ns else None,
+        "load_seconds": load_ns / NS_PER_SECOND if load_ns is not None else None,
+        "estimated_prompt_tokens": estimated_prompt_tokens,
+        "prompt_tokens": prompt_tokens,
+        "prompt_eval_seconds": prompt_ns / NS_PER_SECOND if prompt_ns else None,
+        "completion_tokens": completion_tokens,
+        "eval_seconds": eval_ns / NS_PER_SECOND if eval_ns else None,
+        "tokens_per_second": round(tokens_per_second, 3) if tokens_per_second else None
+    }
+    LLM_CALLS.labels(stage_name, model).inc()
+    LLM_CALL_SECONDS.labels(stage_name, model).observe(seconds)
+    if load_ns is not None:
+        MODEL_LOAD_SECONDS.labels(model).observe(load_ns / NS_PER_SECOND)
+    if prompt_tokens:
+        PROMPT_TOKENS.labels(model).inc(prompt_tokens)
+    if completion_tokens:
+        COMPLETION_TOKENS.labels(model).inc(completion_tokens)
+    if tokens_per_second:
+        TOKENS_PER_SECOND.labels(model).observe(tokens_per_second)
+    timings = _timings.get()
+    if timings is not None:
+        timings.llm_calls.append(call)
+    return call
+
+def record_retry() -> None:
+    RETRIES.labels(_stage.get()).inc()
+    timings = _timings.get()
+    if timings is not None:
+        timings.retries += 1
+
+def record_json_repair() -> None:
+    JSON_REPAIRS.labels(_stage.get()).inc()
+    timings = _timings.get()
+    if timings is not None:
+        timings.json_repairs += 1
+
+def record_parse_failure() -> None:
+    PARSE_FAILURES.labels(_stage.get()).inc()
+    timings = _timings.get()
+    if timings is not None:
+        timings.parse_failures += 1
+
+def record_evaluation(result: dict, timings: Timings) -> dict:
+    """
+    Count the evaluation and attach its timings to `result["config"]`, and record
+    in `result["details"]["json_repair_needed"]` whether any model response
+    needed the lenient repair pass (or could not be parsed at all).
+    """
+    EVALUATIONS.labels("error" if result.get("error") else "ok").inc()
+    result["config"]["timings"] = timings.as_dict()
+    result["details"]["json_repair_needed"] = bool(timings.json_repairs or timings.parse_failures)
+    return result
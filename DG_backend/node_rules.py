@@ -0,0 +1,134 @@
+import re
+import threading
+from typing import Optional
+
+# Raw types from the extraction model that map to exactly one classified type.
+RAW_TYPE_ALIASES = {
+    "start": "start", "begin": "start",
+    "end": "end", "stop": "end", "exit": "end",
+    "input": "input", "read": "input",
+    "output": "output", "display": "output",
+    "print": "print",
+    "process": "process", "rectangle": "process", "action": "process", "assignment": "process",
+    "calculation": "process", "operation": "process",
+    "decision": "decision", "diamond": "decision", "condition": "decision", "conditional": "decision",
+    "if": "if",
+    "loop": "loop",
+    "stack": "stack",
+}
+
+# Text patterns checked in order; the first match decides the type.
+TEXT_PATTERNS = [
+    ("start", re.compile(r"^(start|begin)\b\W*$")),
+    ("end", re.compile(r"^(end|stop|exit|halt)\b\W*$")),
+    ("input", re.compile(r"^(read|input|get|enter|accept|scan)\b")),
+    ("print", re.compile(r"^print\b")),
+    ("output", re.compile(r"^(output|display|write|show)\b")),
+    ("loop", re.compile(r"^(for|while|repeat|until|do while)\b")),
+    ("stack", re.compile(r"^(push|pop)\b")),
+    ("if", re.compile(r"^if\b")),
+]
+COMPARISON = re.compile(r"(==|!=|>=|<=|=>|=<|[<>]|\?$)")
+ASSIGNMENT = re.compile(r"^[a-z_][\w\[\]\.]*\s*(=|:=|<-|←)\s*[^=]")
+
+def normalize_node_text(text) -> str:
+    """Lower-case the node text and collapse whitespace so equivalent labels share a key."""
+    return " ".join(str(text or "").lower().split())
+
+def preclassify_node(node: dict) -> Optional[str]:
+    """
+    Classify a node deterministically, or return None when it is ambiguous.
+    Evidence in the text wins (keyword patterns, then assignments and comparison
+    operators) so a "process" box reading "Read A, B" becomes an input; the raw
+    type is used when the text is inconclusive and it is an unambiguous alias.
+    """
+    text = normalize_node_text(node.get("text"))
+    raw_type = normalize_node_text(node.get("type"))
+    for node_type, pattern in TEXT_PATTERNS:
+        if pattern.match(text):
+            return node_type
+    if ASSIGNMENT.match(text):
+        return "process"
+    if COMPARISON.search(text):
+        return "decision"
+    return RAW_TYPE_ALIASES.get(raw_type)
+
+class NodeTypeMemo:
+    """
+    Corpus-wide memo of LLM node classifications keyed by normalized node text,
+    so a label the model has already classified once is never sent again.
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._types = {}
+        self._lock = threading.Lock()
+
+    def get(self, text) -> Optional[str]:
+        with self._lock:
+            return self._types.get(normalize_node_text(text))
+
+    def remember(self, text, node_type: str) -> None:
+        key = normalize_node_text(text)
+        if not key:
+            return
+        with self._lock:
+            if key not in self._types and len(self._types) >= self.max_entries:
+                self._types.pop(next(iter(self._types)))
+            self._types[key] = node_type
+
+    def clear(self) -> None:
+        with self._lock:
+            self._types.clear()
+
+    def __len__(self) -> int:
+        return len(self._types)
+
+def classified_entry(node: dict, node_type: str, source: str) -> dict:
+    return {
+        "id": node.get("id"),
+        "original_type": node.get("type"),
+        "text": node.get("text"),
+        "classified_type": node_type,
+        "source": source
+    }
+
+def split_nodes(nodes: list, memo: NodeTypeMemo = None) -> tuple:
+    """
+    Resolve what can be resolved without the LLM.
+    Returns the classified entries and the nodes that still need the LLM.
+    """
+    classified = []
+    unresolved = []
+    for node in nodes:
+        node_type = preclassify_node(node)
+        if node_type:
+            classified.append(classified_entry(node, node_type, "rule"))
+            continue
+        node_type = memo.get(node.get("text")) if memo is not None else None
+        if node_type:
+            classified.append(classified_entry(node, node_type, "memo"))
+            continue
+        unresolved.append(node)
+    return classified, unresolved
+
+def merge_llm_classification(nodes: list, classified: list, llm_classified: list, memo: NodeTypeMemo,
+                             valid_types: set) -> list:
+    """
+    Combine rule/memo entries with the LLM's answers in the original node order,
+    remembering every valid LLM answer in the memo.
+    """
+    by_id = {entry["id"]: entry for entry in classified}
+    text_by_id = {node.get("id"): node.get("text") for node in nodes}
+    for item in llm_classified:
+        if not isinstance(item, dict) or "classified_type" not in item:
+            continue
+        node_id = item.get("id")
+        if node_id in by_id or node_id not in text_by_id:
+            continue
+        entry = dict(item, source="llm")
+        by_id[node_id] = entry
+        node_type = str(item["classified_type"]).lower()
+        if memo is not None and node_type in valid_types:
+            memo.remember(text_by_id[node_id], node_type)
+    return [by_id[node.get("id")] for node in nodes if node.get("id") in by_id]
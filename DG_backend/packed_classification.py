@@ -0,0 +1,67 @@
+from prompt_templates import compact_json, estimate_tokens
+
+ID_SEPARATOR = ":"
+
+def namespaced_id(group: int, node_id) -> str:
+    """Node id unique across a packed prompt, e.g. "3:7" for node 7 of submission 3."""
+    return f"{group}{ID_SEPARATOR}{node_id}"
+
+def estimate_node_tokens(nodes: list) -> int:
+    return estimate_tokens(compact_json(nodes))
+
+def namespace_nodes(group: int, nodes: list) -> list:
+    return [dict(node, id=namespaced_id(group, node.get("id"))) for node in nodes]
+
+def pack_groups(node_lists: dict, token_budget: int) -> list:
+    """
+    Pack the node lists of many submissions ({group: nodes}) into prompts of at
+    most `token_budget` estimated tokens each. A submission is never split
+    across packs; one larger than the budget gets a pack of its own.
+    Returns a list of packs, each a list of group keys.
+    """
+    packs = []
+    current = []
+    used = 0
+    for group, nodes in node_lists.items():
+        cost = estimate_node_tokens(namespace_nodes(group, nodes))
+        if current and used + cost > token_budget:
+            packs.append(current)
+            current, used = [], 0
+        current.append(group)
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+def packed_nodes(pack: list, node_lists: dict) -> list:
+    """The nodes of every group in `pack` with namespaced ids, in one list for the prompt."""
+    return [node for group in pack for node in namespace_nodes(group, node_lists[group])]
+
+def split_packed_response(pack: list, node_lists: dict, classified: list) -> tuple:
+    """
+    Split a packed classification array back into per-group entries with the
+    original node ids. Entries with unknown, foreign or duplicate ids and
+    entries without a classified type are dropped.
+    Returns ({group: entries}, {group: nodes missing from the response}); the
+    missing nodes are what a partially malformed or truncated response lost.
+    """
+    originals = {}
+    for group in pack:
+        for node in node_lists[group]:
+            originals[namespaced_id(group, node.get("id"))] = (group, node)
+    per_group = {group: [] for group in pack}
+    answered = set()
+    for item in classified if isinstance(classified, list) else []:
+        if not isinstance(item, dict) or "classified_type" not in item:
+            continue
+        key = str(item.get("id"))
+        if key not in originals or key in answered:
+            continue
+        answered.add(key)
+        group, node = originals[key]
+        per_group[group].append(dict(item, id=node.get("id")))
+    missing = {
+        group: [node for node in node_lists[group] if namespaced_id(group, node.get("id")) not in answered]
+        for group in pack
+    }
+    return per_group, {group: nodes for group, nodes in missing.items() if nodes}
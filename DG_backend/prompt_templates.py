@@ -0,0 +1,157 @@
+"""
+Prompt templates for every model call in the grading pipeline and the Dataset scripts.
+
+Each template is a static instruction block followed by the variable payload.
+The instructions are rendered byte-for-byte the same on every call. Ollama can
+then reuse the KV cache it built for that prefix, and only the payload is
+evaluated again. Payloads are serialized as compact JSON (no indentation, no
+spaces after separators), which cuts the prompt tokens spent on whitespace.
+"""
+import hashlib
+import json
+
+# Rough characters-per-token ratio for llama/granite tokenizers on English and JSON
+CHARS_PER_TOKEN = 4
+
+def compact_json(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of `text`, without loading a tokenizer."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+class PromptTemplate:
+    """A fixed instruction prefix with the variable payload appended after it."""
+
+    def __init__(self, name: str, prefix: str):
+        self.name = name
+        self.prefix = prefix
+        self.fingerprint = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:16]
+        self.prefix_tokens = estimate_tokens(prefix)
+
+    def render(self, payload=None) -> str:
+        """The prompt text: the prefix, then `payload` (strings as-is, anything else as compact JSON)."""
+        if payload is None:
+            return self.prefix
+        return self.prefix + (payload if isinstance(payload, str) else compact_json(payload))
+
+    def __repr__(self) -> str:
+        return f"PromptTemplate({self.name!r}, {self.fingerprint})"
+
+def prompt_token_estimate(messages: list) -> int:
+    """Estimated text tokens of a chat request (images are not counted)."""
+    return sum(estimate_tokens(message.get("content") or "") for message in messages)
+
+# -------------------------
+# Graph Pipeline (g_eval)
+# -------------------------
+EXTRACTION_TEMPLATE = PromptTemplate("extraction", """Convert this flowchart image to JSON with:
+- "nodes": [{"id": int, "type": str, "text": str}]
+- "edges": [{"from": int, "to": int, "label": str}]
+Return only JSON.""")
+
+CLASSIFICATION_TEMPLATE = PromptTemplate("classification", """You are a flowchart expert. Classify each node in the following list into one of these types:
+["start","end","input","output","if","decision","print","process","stack","loop"].
+If unsure, choose the closest type.
+Return only valid JSON in the following format:
+[{"id":<node id>,"original_type":"<raw type>","text":"<node text>","classified_type":"<classified type>"},...]
+Nodes:
+""")
+
+# -------------------------
+# Dataset Scripts
+# -------------------------
+RULE_GRADING_TEMPLATE = PromptTemplate("rule_grading", """You are an AI vision reasoning model. You will receive an image of a flowchart and the scope of the question it is meant to answer. Your task is to analyze the flowchart and, using the following rules, determine whether each rule is satisfied (True) or violated (False). Return your results as a JSON object, where each key is the rule_id and the value is True (rule satisfied) or False (rule violated).
+
+Rules:
+1. All variables used in the flowchart/diagram must be properly initialized before use.
+2. The algorithm should match the expected scope and complexity of the question.
+3. The submitted image or diagram must be clear and legible.
+4. If the diagram is too complex, contains multiple diagrams, or is ambiguous, flag false for human review.
+5. The flowchart must include an end node (terminator).
+6. All decision nodes must be clearly labeled with 'Yes/No' or appropriate conditions.
+7. Loops in the flowchart must be represented with correct loop arrows.
+8. The correct type of box/shape must be used for each node (e.g., rectangles for processes, diamonds for decisions).
+9. Every node must be properly enclosed within its designated box/shape.
+
+Instructions:
+- Carefully analyze the provided flowchart image and the question scope.
+- For each rule, reason whether the flowchart satisfies the rule (True) or violates it (False).
+- Return your answer as a JSON object in the following format:
+{"rule_1":true,"rule_2":false,"rule_3":true,"rule_4":true,"rule_5":true,"rule_6":false,"rule_7":true,"rule_8":true,"rule_9":true}
+
+Input:
+- `flowchart_image`: the attached image
+- `question_scope`: given after these instructions
+
+Output:
+- A JSON object with each `rule_id` as the key and a boolean value indicating if the rule is satisfied.
+
+Example Input:
+- flowchart_image: [image.png]
+- question_scope: "Design a flowchart to calculate the factorial of a number."
+
+Example Output:
+{"rule_1":true,"rule_2":true,"rule_3":true,"rule_4":true,"rule_5":true,"rule_6":true,"rule_7":true,"rule_8":true,"rule_9":true}
+
+Now evaluate the following flowchart:
+""")
+
+CHECKLIST_GRADING_TEMPLATE = PromptTemplate("checklist_grading", """You are an expert flowchart evaluator. You will be given:
+- An image of a flowchart.
+
+Your tasks, in order:
+
+1. Node Classification
+- List every node (by ID or label), classify it as Start, End, Process, or Decision.
+- For each classification, briefly explain your reasoning.
+
+2. Structural & Practical Checks
+For each of the following checks:
+a) Describe how you verify it against the flowchart.
+b) State the result (True or False).
+
+Structural Logic Checks
+- LT_1: Exactly one start node and one end node
+- LT_2: All decision nodes contain clear, meaningful conditions
+- LT_3: All nodes are connected; no isolated nodes
+- LT_4: Node IDs are unique and in ascending order
+- LT_5: At least one valid path from start to end exists
+- LT_6: All node types are valid (Start, End, Process, Decision)
+- LT_7: If loops exist, each has a proper termination condition
+- LT_8: All nodes have clear, meaningful labels
+- LT_9: Each decision node has exactly two outgoing edges (e.g., Yes/No)
+
+Practical Reasoning Checks
+- PT_1: The flowchart works for a basic test case
+- PT_2: The flowchart works for a second, different test case
+
+Additional Checks
+- PT_3: It handles an edge/boundary case well
+- PT_4: It is logically efficient (solves the problem with minimal steps)
+
+3. Final Output
+- Output the results as a JSON object with the following structure:
+{"checks":{"LT_1":true/false,"LT_2":true/false,...,"PT_4":true/false},"practical_questions":{"PT_1":{"question":"...","reasoning":"..."},"PT_2":{"question":"...","reasoning":"..."},...}}
+
+IMPORTANT:
+- Think step by step; do not skip your chain of thought.
+- After your reasoning, **do not** include any extra commentary—just the JSON result.
+
+Now evaluate the following flowchart:
+""")
+
+QUESTION_ANALYSIS_TEMPLATE = PromptTemplate("question_analysis", """You are an expert flowchart evaluator and classifier. You will be given a flowchart-related question (text only, no image).
+
+Classify the question:
+- question_intent: Descriptive, Diagnostic, Predictive or Prescriptive
+- question_difficulty_level: L1 (Beginner), L2 (Intermediate), L3 (Advanced), L4 (Expert) or L5 (Mastery)
+- question_evaluation_type: Conceptual Understanding, Application, Analysis or Creativity
+Also give:
+- evaluation_report: what a correct flowchart for this question must show (structure and logic)
+- reasoning: why you chose the three classifications
+
+Return only a JSON object with exactly these five keys.
+
+Question:
+""")
@@ -0,0 +1,166 @@
+import sys
+import os
+
+# Add the DG_backend directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import asyncio
+import io
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+from async_g_eval import AsyncLLM
+import batch_grade
+from batch_grade import grade_batch, grade_batch_by_model, load_jobs, parse_concurrency
+from g_eval import Config
+from node_rules import NodeTypeMemo
+
+FLOWCHART = {
+    "nodes": [
+        {"id": 1, "type": "start", "text": "Start"},
+        {"id": 2, "type": "process", "text": "Swap A and B"},
+        {"id": 3, "type": "end", "text": "End"}
+    ],
+    "edges": [{"from": 1, "to": 2, "label": ""}, {"from": 2, "to": 3, "label": ""}]
+}
+
+# The "terminal" type fails validation, so every extraction attempt is used
+# and the node is left for the classification model
+UNRESOLVED_FLOWCHART = {
+    "nodes": [{"id": 2, "type": "terminal", "text": "Swap A and B"}],
+    "edges": []
+}
+
+class FakeAsyncClient:
+    """Stands in for ollama.AsyncClient and records peak concurrency per model and the call order."""
+
+    def __init__(self, flowchart=FLOWCHART):
+        self.flowchart = flowchart
+        self.in_flight = {}
+        self.peak = {}
+        self.calls = 0
+        self.models = []
+        self.preloaded = []
+        self.keep_alive = set()
+
+    async def generate(self, model, **kwargs):
+        self.preloaded.append(model)
+
+    async def chat(self, model, messages, **kwargs):
+        self.calls += 1
+        self.models.append(model)
+        self.keep_alive.add(kwargs.get("keep_alive"))
+        self.in_flight[model] = self.in_flight.get(model, 0) + 1
+        self.peak[model] = max(self.peak.get(model, 0), self.in_flight[model])
+        await asyncio.sleep(0.01)
+        self.in_flight[model] -= 1
+        if model == Config.EXTRACTION_MODEL:
+            content = self.flowchart
+        else:
+            nodes = json.loads(messages[0]['content'].split("Nodes:\n", 1)[1])
+            content = [dict(node, original_type=node["type"], classified_type="process") for node in nodes]
+        return {'message': {'content': json.dumps(content)}}
+
+def counting(function, counts):
+    """Wrap an async function to record how many calls of it run at once."""
+    async def wrapper(*args, **kwargs):
+        counts["now"] += 1
+        counts["peak"] = max(counts["peak"], counts["now"])
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            counts["now"] -= 1
+    return wrapper
+
+class TestBatchGrade(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        for i in range(6):
+            with open(os.path.join(self.tmp.name, f"{i}.jpg"), "wb") as f:
+                f.write(f"image {i}".encode())
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_parse_concurrency(self):
+        self.assertEqual(parse_concurrency("llama3.2-vision=2, granite3.2-vision=4"),
+                         {"llama3.2-vision": 2, "granite3.2-vision": 4})
+        self.assertEqual(parse_concurrency(""), {})
+        with self.assertRaises(ValueError):
+            parse_concurrency("4")
+
+    def test_load_jobs_from_manifest(self):
+        manifest = os.path.join(self.tmp.name, "grade.csv")
+        with open(manifest, "w") as f:
+            f.write("image_id,question,image_path\n7,Swap two variables,1.jpg\n")
+        jobs = load_jobs(manifest)
+        self.assertEqual(jobs, [{
+            "id": "7",
+            "image_path": os.path.join(self.tmp.name, "1.jpg"),
+            "problem_description": "Swap two variables"
+        }])
+
+    def test_batch_respects_model_limits_and_streams_ndjson(self):
+        client = FakeAsyncClient()
+        llm = AsyncLLM({Config.EXTRACTION_MODEL: 2}, default_concurrency=3, client=client)
+        output = io.StringIO()
+        jobs = load_jobs(self.tmp.name)
+        written = asyncio.run(grade_batch(jobs, llm, output, use_cache=False))
+        self.assertEqual(written, 6)
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual(sorted(r["id"] for r in records), [str(i) for i in range(6)])
+        self.assertTrue(all(r["error"] is None for r in records))
+        self.assertEqual(client.peak[Config.EXTRACTION_MODEL], 2)
+        # The rules resolve every node, so the classification model is never called
+        self.assertNotIn(Config.CLASSIFICATION_MODEL, client.peak)
+
+    def test_images_in_flight_are_bounded(self):
+        jobs = load_jobs(self.tmp.name)
+        llm = AsyncLLM({Config.EXTRACTION_MODEL: 1}, default_concurrency=1, client=FakeAsyncClient())
+        counts = {"now": 0, "peak": 0}
+        with patch.object(batch_grade, 'graph_based_g_eval_async', counting(batch_grade.graph_based_g_eval_async, counts)):
+            self.assertEqual(asyncio.run(grade_batch(jobs, llm, io.StringIO(), use_cache=False)), 6)
+        self.assertEqual(counts["peak"], 2)
+
+        counts = {"now": 0, "peak": 0}
+        with patch.object(batch_grade, 'extraction_phase_async', counting(batch_grade.extraction_phase_async, counts)):
+            stats = asyncio.run(grade_batch_by_model(jobs, llm, io.StringIO(), use_cache=False, preload=False,
+                                                     max_in_flight=3))
+        self.assertEqual(stats["written"], 6)
+        self.assertEqual(counts["peak"], 3)
+
+    @patch('async_g_eval.node_type_memo', NodeTypeMemo())
+    def test_grouped_batch_runs_each_model_once(self):
+        client = FakeAsyncClient(UNRESOLVED_FLOWCHART)
+        llm = AsyncLLM(default_concurrency=2, client=client, keep_alive="30m")
+        output = io.StringIO()
+        jobs = load_jobs(self.tmp.name)
+        stats = asyncio.run(grade_batch_by_model(jobs, llm, output, use_cache=False))
+        # Both models are preloaded, the extraction model last
+        self.assertEqual(client.preloaded, [Config.CLASSIFICATION_MODEL, Config.EXTRACTION_MODEL])
+        self.assertEqual(client.models, [Config.EXTRACTION_MODEL] * 18 + [Config.CLASSIFICATION_MODEL] * 6)
+        self.assertEqual(client.keep_alive, {"30m"})
+        # Per image: three extraction attempts then classification, i.e. 2 switches per image but the last
+        self.assertEqual(stats["written"], 6)
+        self.assertEqual(stats["llm_calls"], {Config.EXTRACTION_MODEL: 18, Config.CLASSIFICATION_MODEL: 6})
+        self.assertEqual((stats["model_switches"], stats["interleaved_switches"], stats["switches_avoided"]), (1, 11, 10))
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertEqual([r["id"] for r in records], [job["id"] for job in jobs])
+        self.assertEqual(records[0]["details"]["classification"][0]["classified_type"], "process")
+        self.assertEqual(records[0]["config"]["timings"]["retries"], 2)
+
+    @patch('async_g_eval.node_type_memo', NodeTypeMemo())
+    def test_packed_classification_makes_one_call_per_batch(self):
+        client = FakeAsyncClient(UNRESOLVED_FLOWCHART)
+        llm = AsyncLLM(default_concurrency=2, client=client)
+        output = io.StringIO()
+        stats = asyncio.run(grade_batch_by_model(load_jobs(self.tmp.name), llm, output, use_cache=False,
+                                                 pack_tokens=10_000))
+        self.assertEqual(stats["llm_calls"][Config.CLASSIFICATION_MODEL], 1)
+        records = [json.loads(line) for line in output.getvalue().splitlines()]
+        self.assertTrue(all(r["details"]["classification"][0]["classified_type"] == "process" for r in records))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import sys
+import os
+
+# Add the DG_backend directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import tempfile
+import unittest
+import numpy as np
+import g_eval
+from bench_logic_tests import synthetic_flowchart
+from cohort_store import CohortStore
+
+GOOD = {
+    "nodes": [
+        {"id": 1, "type": "start", "text": "Start"},
+        {"id": 2, "type": "decision", "text": "a > b"},
+        {"id": 3, "type": "print", "text": "Print a"},
+        {"id": 4, "type": "end", "text": "End"}
+    ],
+    "edges": [{"from": 1, "to": 2}, {"from": 2, "to": 3}, {"from": 2, "to": 4}, {"from": 3, "to": 4}]
+}
+NO_END = {
+    "nodes": [{"id": 1, "type": "start", "text": "Start"}, {"id": 2, "type": "process", "text": ""}],
+    "edges": [{"from": 1, "to": 2}]
+}
+
+class TestCohortStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = CohortStore()
+        for i, flowchart in enumerate([GOOD, NO_END, synthetic_flowchart(60)]):
+            self.store.add(f"s{i}", flowchart)
+
+    def test_matrix_shape_and_replace(self):
+        self.assertEqual(self.store.matrix.shape, (3, len(g_eval.LOGIC_TESTS)))
+        self.store.add("s1", GOOD)
+        self.assertEqual(len(self.store), 3)
+        self.assertTrue(self.store.matrix[1].all())
+
+    def test_rescore_matches_run_logic_tests(self):
+        flowcharts = [GOOD, NO_END, synthetic_flowchart(60)]
+        subsets = [list(g_eval.LOGIC_TESTS), ["LT_1", "LT_5"], ["LT_8"]]
+        for subset in subsets:
+            expected = [g_eval.run_logic_tests(f, subset)[0] for f in flowcharts]
+            np.testing.assert_allclose(self.store.rescore(test_ids=subset), expected)
+
+    def test_rescore_with_new_weights_and_max_score(self):
+        scores = self.store.rescore({"LT_1": 0, "LT_8": 100}, test_ids=["LT_1", "LT_8"], max_score=10)
+        np.testing.assert_allclose(scores, [10, 0, 10])
+
+    def test_add_tests_appends_columns_in_bulk(self):
+        store = CohortStore(["LT_1", "LT_2"])
+        store.add("a", GOOD)
+        store.add("b", NO_END)
+        self.assertEqual(store.add_tests(["LT_2", "LT_9"]), ["LT_9"])
+        self.assertEqual(store.test_ids, ["LT_1", "LT_2", "LT_9"])
+        self.assertEqual(store.matrix[:, 2].tolist(), [True, True])
+        with self.assertRaises(KeyError):
+            store.add_tests(["LT_99"])
+
+    def test_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "cohort.npz")
+            self.store.save(path)
+            loaded = CohortStore.load(path)
+        self.assertEqual(loaded.submission_ids, self.store.submission_ids)
+        self.assertEqual(loaded.test_ids, self.store.test_ids)
+        np.testing.assert_array_equal(loaded.matrix, self.store.matrix)
+        np.testing.assert_allclose(loaded.rescore(), self.store.rescore())
+        loaded.add("s3", GOOD)
+        self.assertEqual(len(loaded), 4)
+
+    def test_add_result_skips_failed_evaluations(self):
+        store = CohortStore()
+        self.assertFalse(store.add_result({"error": "boom", "flowchart_json": {}, "image_hash": "x"}))
+        self.assertTrue(store.add_result({"error": None, "flowchart_json": GOOD, "image_hash": "abc"}))
+        self.assertEqual(store.submission_ids, ["abc"])
+
+if __name__ == '__main__':
+    unittest.main()
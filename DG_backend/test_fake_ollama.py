@@ -0,0 +1,88 @@
+import sys
+import os
+
+# Add the DG_backend directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import base64
+import json
+import tempfile
+import unittest
+import ollama
+from bench_pipeline import percentile, run
+from fake_ollama import CANNED_FLOWCHART, FakeOllama, MALFORMED_OUTPUTS, image_hash
+from prompt_templates import CLASSIFICATION_TEMPLATE
+
+IMAGE = base64.b64encode(b"not really a png").decode()
+
+class TestFakeOllama(unittest.TestCase):
+
+    def chat(self, fake, content="", images=None, **kwargs):
+        client = ollama.Client(host=fake.url)
+        message = {"role": "user", "content": content}
+        if images:
+            message["images"] = images
+        return client.chat(model="vision", messages=[message], **kwargs)
+
+    def test_image_responses_are_served_by_hash_with_ollama_stats(self):
+        recorded = {"nodes": [{"id": 1, "type": "start", "text": "Begin"}], "edges": []}
+        with FakeOllama({image_hash(IMAGE): recorded}, latency=0.01, load_seconds=0.02) as fake:
+            response = self.chat(fake, "Convert", [IMAGE])
+            self.assertEqual(json.loads(response["message"]["content"]), recorded)
+            self.assertGreaterEqual(response["total_duration"], 30_000_000)
+            self.assertEqual(response["load_duration"], 20_000_000)
+            self.assertGreater(response["prompt_eval_count"], 0)
+            self.assertGreater(response["eval_count"], 0)
+            other = self.chat(fake, "Convert", [base64.b64encode(b"another image").decode()])
+            self.assertEqual(json.loads(other["message"]["content"]), CANNED_FLOWCHART)
+            self.assertEqual(other["load_duration"], 0)
+            self.assertEqual(fake.loads, 1)
+
+    def test_classification_answers_the_prompted_nodes(self):
+        nodes = [{"id": "0:1", "type": "process", "text": "Read n"}, {"id": "0:2", "type": "?", "text": "Swap"}]
+        with FakeOllama() as fake:
+            response = self.chat(fake, CLASSIFICATION_TEMPLATE.render(nodes))
+        answer = json.loads(response["message"]["content"])
+        self.assertEqual([(item["id"], item["classified_type"]) for item in answer],
+                         [("0:1", "input"), ("0:2", "process")])
+
+    def test_failures_and_malformed_output_are_injected(self):
+        with FakeOllama(failure_rate=1.0) as fake:
+            with self.assertRaises(ollama.ResponseError) as raised:
+                self.chat(fake, "Convert", [IMAGE])
+            self.assertEqual(raised.exception.status_code, 500)
+        with FakeOllama(malformed_rate=1.0) as fake:
+            self.assertIn(self.chat(fake, "Convert", [IMAGE])["message"]["content"], MALFORMED_OUTPUTS)
+
+    def test_streamed_response_ends_with_stats(self):
+        with FakeOllama() as fake:
+            chunks = list(self.chat(fake, "Convert", [IMAGE], stream=True))
+        self.assertEqual(json.loads("".join(chunk["message"]["content"] for chunk in chunks)), CANNED_FLOWCHART)
+        self.assertTrue(chunks[-1]["done"])
+        self.assertIsNotNone(chunks[-1]["eval_count"])
+
+class TestPipelineBenchmark(unittest.TestCase):
+
+    def test_scenarios_grade_every_image(self):
+        from PIL import Image
+        with tempfile.TemporaryDirectory() as directory:
+            jobs = []
+            for index in range(3):
+                path = os.path.join(directory, f"{index}.png")
+                Image.new("RGB", (40, 30), (255, 255, 255)).save(path)
+                jobs.append({"id": str(index), "image_path": path, "problem_description": "Swap two numbers"})
+            summaries = run(jobs, FakeOllama(), concurrency=2)
+        self.assertEqual([summary["scenario"] for summary in summaries], ["single", "concurrent", "batch"])
+        for summary in summaries:
+            self.assertEqual(summary["images"], 3)
+            self.assertEqual(summary["errors"], 0)
+            self.assertEqual(summary["retries"], 0)
+            self.assertIsNotNone(summary["p95_seconds"])
+
+    def test_percentile(self):
+        self.assertEqual(percentile([5, 1, 4, 2, 3], 0.5), 3)
+        self.assertEqual(percentile(list(range(1, 101)), 0.95), 95)
+        self.assertIsNone(percentile([], 0.5))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import sys
+import os
+
+# Add the DG_backend directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import unittest
+from unittest.mock import patch
+import g_eval
+from bench_logic_tests import legacy_path_existence, synthetic_flowchart, wide_flowchart
+from flowchart_graph import FlowchartGraph
+
+def flowchart(nodes, edges):
+    return {
+        "nodes": [{"id": i, "type": t, "text": text} for i, t, text in nodes],
+        "edges": [{"from": a, "to": b, "label": ""} for a, b in edges]
+    }
+
+# Counter loop: start -> i = 0 -> i < 5 ? -> (yes) i = i + 1 -> back; (no) -> end
+COUNTER_LOOP = flowchart(
+    [(1, "start", "Start"), (2, "process", "i = 0"), (3, "decision", "i < 5"),
+     (4, "process", "i = i + 1"), (5, "end", "End")],
+    [(1, 2), (2, 3), (3, 4), (4, 3), (3, 5)]
+)
+
+class TestFlowchartGraph(unittest.TestCase):
+
+    def test_strongly_connected_components(self):
+        graph = FlowchartGraph(COUNTER_LOOP)
+        components = sorted(sorted(graph.ids[i] for i in c) for c in graph.strongly_connected_components())
+        self.assertEqual(components, [[1], [2], [3, 4], [5]])
+        self.assertEqual([sorted(graph.ids[i] for i in c) for c in graph.cycles()], [[3, 4]])
+
+    def test_self_loop_is_a_cycle(self):
+        graph = FlowchartGraph(flowchart([(1, "process", "wait")], [(1, 1)]))
+        self.assertEqual(graph.cycles(), [[0]])
+
+    def test_loop_termination(self):
+        self.assertTrue(g_eval.test_loop_termination(COUNTER_LOOP)[0])
+        endless = flowchart(
+            [(1, "start", "Start"), (2, "process", "x = x + 1"), (3, "process", "print x"), (4, "end", "End")],
+            [(1, 2), (2, 3), (3, 2)]
+        )
+        passed, weight, message = g_eval.test_loop_termination(endless)
+        self.assertFalse(passed)
+        self.assertIn("[2, 3]", message)
+
+    def test_labels_present(self):
+        self.assertTrue(g_eval.test_labels_present(COUNTER_LOOP)[0])
+        unlabeled = flowchart([(1, "start", "Start"), (2, "process", "  ")], [(1, 2)])
+        self.assertFalse(g_eval.test_labels_present(unlabeled)[0])
+
+    def test_decision_branches(self):
+        self.assertTrue(g_eval.test_decision_branches(COUNTER_LOOP)[0])
+        one_branch = flowchart([(1, "decision", "a > b"), (2, "end", "End")], [(1, 2)])
+        passed, _, message = g_eval.test_decision_branches(one_branch)
+        self.assertFalse(passed)
+        self.assertIn("[1]", message)
+
+    def test_existing_tests_keep_their_results(self):
+        broken = flowchart(
+            [(2, "start", "Start"), (1, "decision", "done"), (3, "blob", "x"), (3, "end", "End")],
+            [(2, 1)]
+        )
+        self.assertEqual(g_eval.test_start_end(COUNTER_LOOP)[0], True)
+        self.assertEqual(g_eval.test_decision_condition(broken)[0], False)
+        self.assertEqual(g_eval.test_connectivity(broken)[0], False)
+        self.assertEqual(g_eval.test_sequence_order(broken)[2], "Node IDs are not unique.")
+        self.assertEqual(g_eval.test_path_existence(broken)[0], False)
+        self.assertEqual(g_eval.test_node_type_consistency(broken)[2], "Invalid node types found: ['blob']")
+        self.assertEqual(g_eval.test_connectivity({"nodes": [], "edges": []})[0], False)
+
+    def test_path_existence_matches_legacy_bfs(self):
+        for fixture in (COUNTER_LOOP, synthetic_flowchart(500), wide_flowchart(500)):
+            self.assertEqual(g_eval.test_path_existence(fixture)[0], legacy_path_existence(fixture))
+
+    def test_run_logic_tests_scores_all_tests(self):
+        score, details = g_eval.run_logic_tests(COUNTER_LOOP, list(g_eval.LOGIC_TESTS))
+        self.assertEqual([d["logic_id"] for d in details], list(g_eval.LOGIC_TESTS))
+        self.assertEqual(score, g_eval.Config.MAX_SCORE)
+
+    def test_extended_tests_are_only_selected_when_enabled(self):
+        self.assertEqual(g_eval.choose_logic_ids(""), ["LT_1", "LT_2", "LT_3", "LT_4", "LT_5", "LT_6"])
+        with patch.object(g_eval.Config, 'EXTENDED_LOGIC_TESTS', True):
+            self.assertEqual(g_eval.choose_logic_ids(""), list(g_eval.LOGIC_TESTS))
+
+if __name__ == '__main__':
+    unittest.main()
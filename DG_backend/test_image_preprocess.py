@@ -0,0 +1,65 @@
+import sys
+import os
+
+# Add the DG_backend directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import base64
+import hashlib
+import io
+import tempfile
+import unittest
+from unittest.mock import patch
+from PIL import Image, ImageDraw
+import g_eval
+from image_preprocess import prepare_image
+
+class TestImagePreprocess(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        # A large "phone photo" with the diagram drawn in the middle
+        self.image_path = os.path.join(self.tmp.name, "photo.jpg")
+        image = Image.new("RGB", (4000, 3000), "white")
+        ImageDraw.Draw(image).rectangle((1500, 1000, 2500, 2000), outline="black", width=20)
+        image.save(self.image_path, format="JPEG")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_hash_matches_original_file(self):
+        with open(self.image_path, "rb") as f:
+            expected = hashlib.sha256(f.read()).hexdigest()
+        self.assertEqual(prepare_image(self.image_path).sha256, expected)
+
+    def test_downscales_to_max_side(self):
+        prepared = prepare_image(self.image_path, max_side=1120)
+        self.assertTrue(prepared.resized)
+        self.assertEqual((prepared.width, prepared.height), (1120, 840))
+        decoded = Image.open(io.BytesIO(base64.b64decode(prepared.data)))
+        self.assertEqual(decoded.size, (1120, 840))
+
+    def test_crop_to_diagram(self):
+        prepared = prepare_image(self.image_path, max_side=4000, crop=True)
+        self.assertTrue(prepared.cropped)
+        self.assertLess(prepared.width, 1200)
+        self.assertLess(prepared.height, 1200)
+
+    def test_small_image_is_sent_unchanged(self):
+        small = os.path.join(self.tmp.name, "small.png")
+        Image.new("RGB", (200, 100), "white").save(small, format="PNG")
+        prepared = prepare_image(small)
+        with open(small, "rb") as f:
+            self.assertEqual(base64.b64decode(prepared.data), f.read())
+        self.assertFalse(prepared.resized)
+
+    @patch('g_eval.ollama.chat', return_value={'message': {'content': 'no json here'}})
+    def test_retries_reuse_encoded_payload(self, mock_chat):
+        prepared = prepare_image(self.image_path)
+        g_eval.extract_flowchart_json_with_retry(prepared.data, max_attempts=3)
+        self.assertEqual(mock_chat.call_count, 3)
+        images = [call.kwargs['messages'][0]['images'][0] for call in mock_chat.call_args_list]
+        self.assertTrue(all(image is prepared.data for image in images))
+
+if __name__ == '__main__':
+    unittest.main()
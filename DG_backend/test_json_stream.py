@@ -0,0 +1,104 @@
+import sys
+import os
+
+# Add the DG_backend directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import asyncio
+import unittest
+from unittest.mock import patch
+import g_eval
+from async_g_eval import AsyncLLM
+from json_stream import IncrementalJSONScanner, COMPLETE, INVALID, PENDING
+
+def feed_all(scanner, chunks):
+    state = PENDING
+    for chunk in chunks:
+        state = scanner.feed(chunk)
+        if state != PENDING:
+            break
+    return state
+
+class RecordingStream:
+    """A streamed chat response that records how many chunks were consumed and whether it was closed."""
+
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for piece in self.pieces:
+            self.consumed += 1
+            yield {'message': {'content': piece}, 'done': False}
+
+    def close(self):
+        self.closed = True
+
+class RecordingAsyncStream(RecordingStream):
+
+    def __aiter__(self):
+        return self._agen()
+
+    async def _agen(self):
+        for piece in self.pieces:
+            self.consumed += 1
+            yield {'message': {'content': piece}, 'done': False}
+
+    async def aclose(self):
+        self.closed = True
+
+class TestIncrementalJSONScanner(unittest.TestCase):
+
+    def test_completes_when_top_level_object_closes(self):
+        scanner = IncrementalJSONScanner("{", ("nodes", "edges"))
+        chunks = ['Sure! ```json\n{"nodes": [{"id": 1, "text": "a } b"}],', ' "edges": []}', '\n``` This flowchart...']
+        self.assertEqual(feed_all(scanner, chunks), COMPLETE)
+        self.assertEqual(scanner.json_text, '{"nodes": [{"id": 1, "text": "a } b"}], "edges": []}')
+
+    def test_aborts_when_required_key_is_not_an_array(self):
+        scanner = IncrementalJSONScanner("{", ("nodes", "edges"))
+        self.assertEqual(feed_all(scanner, ['{"nodes": "Start', ' then End"']), INVALID)
+        self.assertIn("nodes", scanner.reason)
+
+    def test_nested_keys_are_not_checked(self):
+        scanner = IncrementalJSONScanner("{", ("nodes",))
+        self.assertEqual(feed_all(scanner, ['{"graph": {"nodes": 3}, "nodes": []}']), COMPLETE)
+
+    def test_aborts_on_long_preamble(self):
+        scanner = IncrementalJSONScanner("{", max_preamble=20)
+        self.assertEqual(feed_all(scanner, ["The flowchart shows ", "a process that..."]), INVALID)
+
+    def test_array_of_objects(self):
+        self.assertEqual(feed_all(IncrementalJSONScanner("["), ['[{"id": 1}', ', {"id": 2}] trailing']), COMPLETE)
+        self.assertEqual(feed_all(IncrementalJSONScanner("["), ['["start", "end"]']), INVALID)
+
+class TestStreamingChat(unittest.TestCase):
+
+    @patch.object(g_eval.Config, 'STREAM_RESPONSES', True)
+    @patch('g_eval.ollama.chat')
+    def test_stops_generation_once_json_closes(self, mock_chat):
+        stream = RecordingStream(['{"nodes": [], ', '"edges": []}', ' Explanation: ', 'lots of prose'])
+        mock_chat.return_value = stream
+        content, _ = g_eval.chat_content("m", [], {}, g_eval.EXTRACTION_SHAPE)
+        self.assertEqual(content, '{"nodes": [], "edges": []}')
+        self.assertEqual(stream.consumed, 2)
+        self.assertTrue(stream.closed)
+        self.assertTrue(mock_chat.call_args.kwargs['stream'])
+
+    @patch.object(g_eval.Config, 'STREAM_RESPONSES', True)
+    def test_async_stream_is_closed_on_early_abort(self):
+        stream = RecordingAsyncStream(['{"edges": {', '"from": 1}', '}'])
+
+        class Client:
+            async def chat(self, **kwargs):
+                return stream
+
+        llm = AsyncLLM(client=Client())
+        content, _ = asyncio.run(llm.chat_content("m", [], {}, g_eval.EXTRACTION_SHAPE))
+        self.assertEqual(stream.consumed, 1)
+        self.assertTrue(stream.closed)
+        self.assertFalse(g_eval.is_extraction_valid(g_eval.parse_extraction_response(content)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import sys
+import os
+
+# Add the DG_backend directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import unittest
+import g_eval
+from bench_json_repair import load_corpus
+from lenient_json import FAILED, REPAIRED, STRICT, parse_lenient_json, parse_lenient_json_status
+
+class TestLenientJSONCorpus(unittest.TestCase):
+    """The corpus is synthetic: hand-written responses in the failure modes seen from the models, not recorded output."""
+
+    def test_corpus_responses_parse_to_expected_values(self):
+        for case in load_corpus():
+            with self.subTest(case["name"]):
+                self.assertEqual(parse_lenient_json(case["raw"], case["expect"]), case["expected"])
+
+class TestLenientJSON(unittest.TestCase):
+
+    def test_valid_json_takes_the_strict_path(self):
+        value, status = parse_lenient_json_status('Result: {"a": [1, 2]} and {"b": 3}', "object")
+        self.assertEqual(value, {"a": [1, 2]})
+        self.assertEqual(status, STRICT)
+
+    def test_apostrophes_are_not_turned_into_quotes(self):
+        value, status = parse_lenient_json_status('{"text": "Don\'t stop", "n": 1,}', "object")
+        self.assertEqual(value, {"text": "Don't stop", "n": 1})
+        self.assertEqual(status, REPAIRED)
+
+    def test_truncated_output_is_closed(self):
+        self.assertEqual(parse_lenient_json('{"nodes": [{"id": 1, "text": "Sta', "object"),
+                         {"nodes": [{"id": 1, "text": "Sta"}]})
+
+    def test_quoted_key_after_a_string_ends_it(self):
+        self.assertEqual(parse_lenient_json_status('{"x": "y" "c": 1}', "object"), ({"x": "y", "c": 1}, REPAIRED))
+
+    def test_brackets_in_prose_before_the_json_are_skipped(self):
+        self.assertEqual(parse_lenient_json_status('Use {braces}. {"nodes": []}', "object"), ({"nodes": []}, STRICT))
+        self.assertEqual(parse_lenient_json_status('Use {braces}.', "object"), ({}, REPAIRED))
+
+    def test_no_bracket_fails(self):
+        self.assertEqual(parse_lenient_json_status("no json here", "array"), (None, FAILED))
+
+    def test_g_eval_parsers_use_the_lenient_parser(self):
+        self.assertEqual(g_eval.extract_json_from_response("```json\n{'nodes': [], 'edges': [],}\n```"),
+                         {"nodes": [], "edges": []})
+        self.assertEqual(g_eval.parse_classification_response('[{"id": 1, "classified_type": "end"},]'),
+                         [{"id": 1, "classified_type": "end"}])
+        with self.assertRaises(ValueError):
+            g_eval.parse_classification_response("no array")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import sys
+import os
+
+# Add the DG_backend directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+from prometheus_client import REGISTRY
+import g_eval
+from node_rules import NodeTypeMemo
+
+FLOWCHART = {
+    "nodes": [{"id": 1, "type": "start", "text": "Start"}, {"id": 2, "type": "end", "text": "End"}],
+    "edges": [{"from": 1, "to": 2, "label": ""}]
+}
+
+def ollama_response(content: str) -> dict:
+    """A chat response carrying the durations (in nanoseconds) and token counts Ollama reports."""
+    return {
+        'message': {'content': content},
+        'total_duration': 3_000_000_000,
+        'load_duration': 1_500_000_000,
+        'prompt_eval_count': 600,
+        'prompt_eval_duration': 500_000_000,
+        'eval_count': 80,
+        'eval_duration': 1_000_000_000
+    }
+
+def sample(name: str, **labels) -> float:
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+class TestEvaluationTimings(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.image_path = os.path.join(self.tmp.name, "flowchart.png")
+        with open(self.image_path, "wb") as f:
+            f.write(b"not really a png")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    @patch('g_eval.node_type_memo', NodeTypeMemo())
+    @patch('g_eval.ollama.chat')
+    def test_timings_record_calls_retries_and_parse_failures(self, mock_chat):
+        mock_chat.side_effect = [ollama_response("I cannot read this."), ollama_response(json.dumps(FLOWCHART))]
+        model = g_eval.Config.EXTRACTION_MODEL
+        retries_before = sample("g_eval_retries_total", stage="extraction")
+        failures_before = sample("g_eval_parse_failures_total", stage="extraction")
+        load_before = sample("g_eval_model_load_seconds_count", model=model)
+
+        result = g_eval.graph_based_g_eval(self.image_path, "problem", use_cache=False)
+
+        self.assertIsNone(result["error"])
+        timings = result["config"]["timings"]
+        self.assertEqual(timings["retries"], 1)
+        self.assertEqual(timings["parse_failures"], 1)
+        self.assertEqual(len(timings["llm_calls"]), 2)
+        call = timings["llm_calls"][0]
+        self.assertEqual((call["stage"], call["model"]), ("extraction", model))
+        self.assertEqual(call["tokens_per_second"], 80.0)
+        self.assertEqual(timings["model_load_seconds"], 3.0)
+        self.assertEqual(timings["prompt_tokens"], 1200)
+        self.assertTrue({"image", "extraction", "json_parse", "classification", "logic_tests"} <= set(timings["stages"]))
+        self.assertEqual(sample("g_eval_retries_total", stage="extraction") - retries_before, 1)
+        self.assertEqual(sample("g_eval_parse_failures_total", stage="extraction") - failures_before, 1)
+        self.assertEqual(sample("g_eval_model_load_seconds_count", model=model) - load_before, 2)
+        json.dumps(result)
+
+    def test_failed_evaluation_still_carries_timings(self):
+        result = g_eval.graph_based_g_eval(os.path.join(self.tmp.name, "missing.png"), "problem", use_cache=False)
+        self.assertIsNotNone(result["error"])
+        self.assertEqual(result["config"]["timings"]["llm_calls"], [])
+
+if __name__ == '__main__':
+    unittest.main()
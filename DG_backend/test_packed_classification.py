@@ -0,0 +1,102 @@
+import sys
+import os
+
+# Add the DG_backend directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+from async_g_eval import AsyncLLM, classify_nodes_packed_async
+from g_eval import Config
+from metrics import Timings
+from node_rules import NodeTypeMemo
+from packed_classification import namespaced_id, pack_groups, split_packed_response
+
+def flowchart_nodes(group: int) -> list:
+    """Two nodes the rules cannot resolve (unknown raw type, no keyword in the text)."""
+    return [
+        {"id": 1, "type": "box", "text": f"Swap A and B {group}"},
+        {"id": 2, "type": "box", "text": f"Rotate list {group}"}
+    ]
+
+class ClassifyingClient:
+    """Answers classification prompts for every node in them, optionally dropping the last `truncate` entries."""
+
+    def __init__(self, truncate: int = 0):
+        self.truncate = truncate
+        self.prompts = []
+
+    async def chat(self, model, messages, **kwargs):
+        nodes = json.loads(messages[0]['content'].split("Nodes:\n", 1)[1])
+        self.prompts.append(nodes)
+        answer = [
+            {"id": node["id"], "original_type": node["type"], "text": node["text"], "classified_type": "process"}
+            for node in nodes
+        ]
+        if self.truncate and len(nodes) > 2:
+            answer = answer[:-self.truncate]
+        return {'message': {'content': json.dumps(answer)}}
+
+class TestPacking(unittest.TestCase):
+
+    def test_groups_are_packed_whole_within_budget(self):
+        node_lists = {group: flowchart_nodes(group) for group in range(6)}
+        self.assertEqual(pack_groups(node_lists, 10_000), [list(range(6))])
+        packs = pack_groups(node_lists, 100)
+        self.assertGreater(len(packs), 1)
+        self.assertEqual([group for pack in packs for group in pack], list(range(6)))
+        # A group larger than the budget still gets a pack of its own
+        self.assertEqual(pack_groups(node_lists, 1), [[group] for group in range(6)])
+
+    def test_split_restores_ids_and_reports_missing_nodes(self):
+        node_lists = {0: flowchart_nodes(0), 1: flowchart_nodes(1)}
+        classified = [
+            {"id": namespaced_id(0, 1), "classified_type": "process"},
+            {"id": namespaced_id(0, 1), "classified_type": "end"},   # duplicate
+            {"id": namespaced_id(1, 2), "classified_type": "process"},
+            {"id": "7:1", "classified_type": "process"},            # not in this pack
+            {"id": namespaced_id(0, 2)}                              # no classified type
+        ]
+        per_group, missing = split_packed_response([0, 1], node_lists, classified)
+        self.assertEqual(per_group, {
+            0: [{"id": 1, "classified_type": "process"}],
+            1: [{"id": 2, "classified_type": "process"}]
+        })
+        self.assertEqual(missing, {0: [node_lists[0][1]], 1: [node_lists[1][0]]})
+
+class TestPackedClassification(unittest.TestCase):
+
+    def setUp(self):
+        memo = patch('async_g_eval.node_type_memo', NodeTypeMemo())
+        memo.start()
+        self.addCleanup(memo.stop)
+
+    def test_many_flowcharts_share_one_call(self):
+        client = ClassifyingClient()
+        llm = AsyncLLM(client=client)
+        timings = [Timings() for _ in range(6)]
+        results = asyncio.run(classify_nodes_packed_async(
+            llm, [flowchart_nodes(group) for group in range(6)], token_budget=10_000, timings=timings
+        ))
+        self.assertEqual(llm.calls, {Config.CLASSIFICATION_MODEL: 1})
+        for group, (classified, status) in enumerate(results):
+            self.assertEqual(status, "called")
+            self.assertEqual([entry["id"] for entry in classified], [1, 2])
+            self.assertEqual(classified[0]["text"], f"Swap A and B {group}")
+            self.assertEqual(timings[group].llm_calls[0]["shared_by"], 6)
+
+    def test_partially_malformed_answer_falls_back_per_flowchart(self):
+        client = ClassifyingClient(truncate=3)
+        llm = AsyncLLM(default_concurrency=2, client=client)
+        results = asyncio.run(classify_nodes_packed_async(
+            llm, [flowchart_nodes(group) for group in range(4)], token_budget=10_000
+        ))
+        # One packed call lost the last three answers: groups 2 and 3 are retried on their own
+        self.assertEqual(llm.calls, {Config.CLASSIFICATION_MODEL: 3})
+        self.assertEqual([len(nodes) for nodes in client.prompts], [8, 1, 2])
+        self.assertTrue(all(len(classified) == 2 for classified, _ in results))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import sys
+import os
+
+# Add the DG_backend directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import json
+import unittest
+from unittest.mock import patch
+import g_eval
+from metrics import track_timings
+from prompt_templates import CLASSIFICATION_TEMPLATE, EXTRACTION_TEMPLATE, estimate_tokens
+
+NODES = [
+    {"id": 1, "type": "oval", "text": "Start"},
+    {"id": 2, "type": "parallelogram", "text": "Read A, B"},
+    {"id": 3, "type": "rectangle", "text": "temp = A; A = B; B = temp"},
+    {"id": 4, "type": "parallelogram", "text": "Print A, B"},
+    {"id": 5, "type": "oval", "text": "End"}
+]
+
+class TestPromptTemplates(unittest.TestCase):
+
+    def test_prefix_is_identical_across_payloads(self):
+        first = CLASSIFICATION_TEMPLATE.render(NODES[:2])
+        second = CLASSIFICATION_TEMPLATE.render(NODES[3:])
+        prefix = CLASSIFICATION_TEMPLATE.prefix
+        self.assertTrue(first.startswith(prefix) and second.startswith(prefix))
+        self.assertEqual(json.loads(first[len(prefix):]), NODES[:2])
+        self.assertEqual(EXTRACTION_TEMPLATE.render(), EXTRACTION_TEMPLATE.prefix)
+
+    def test_payload_is_compact(self):
+        payload = CLASSIFICATION_TEMPLATE.render(NODES)[len(CLASSIFICATION_TEMPLATE.prefix):]
+        self.assertNotIn("\n", payload)
+        self.assertNotIn(", ", payload.replace("Read A, B", "").replace("Print A, B", ""))
+        # The indented serialization used before costs far more tokens for the same nodes
+        self.assertLess(estimate_tokens(payload), 0.7 * estimate_tokens(json.dumps(NODES, indent=2)))
+
+    @patch('g_eval.ollama.chat')
+    def test_calls_report_prompt_token_counts(self, mock_chat):
+        mock_chat.return_value = {'message': {'content': '[]'}, 'prompt_eval_count': 40}
+        with track_timings() as timings:
+            g_eval.classify_node_types_with_llm(NODES)
+        prompt = mock_chat.call_args.kwargs['messages'][0]['content']
+        self.assertEqual(prompt, CLASSIFICATION_TEMPLATE.render(NODES))
+        call = timings.llm_calls[0]
+        self.assertEqual(call["estimated_prompt_tokens"], estimate_tokens(prompt))
+        self.assertEqual(call["prompt_tokens"], 40)
+
+if __name__ == '__main__':
+    unittest.main()
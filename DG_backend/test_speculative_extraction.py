@@ -0,0 +1,121 @@
+import sys
+import os
+
+# Add the DG_backend directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+import async_g_eval
+from async_g_eval import AsyncLLM, close_speculative_extraction, extract_flowchart_json_speculative, run_speculative_extraction
+from g_eval import Config
+
+VALID = {
+    "nodes": [
+        {"id": 1, "type": "start", "text": "Start"},
+        {"id": 2, "type": "end", "text": "End"}
+    ],
+    "edges": [{"from": 1, "to": 2, "label": ""}]
+}
+
+class ScriptedClient:
+    """Answers each extraction attempt (identified by its seed) after a scripted delay."""
+
+    def __init__(self, script):
+        self.script = script
+        self.cancelled = []
+        self.completed = []
+
+    async def chat(self, model, messages, options=None, **kwargs):
+        seed = options['seed']
+        delay, content = self.script[seed - Config.SEED]
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            self.cancelled.append(seed)
+            raise
+        self.completed.append(seed)
+        return {'message': {'content': content}}
+
+class ClosingHTTPClient:
+    def __init__(self):
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+class TestSpeculativeExtraction(unittest.TestCase):
+
+    def run_speculative(self, script):
+        client = ScriptedClient(script)
+        llm = AsyncLLM({Config.EXTRACTION_MODEL: len(script)}, client=client)
+        result = asyncio.run(extract_flowchart_json_speculative(llm, "payload", max_attempts=len(script)))
+        return result, client
+
+    def test_first_valid_response_wins_and_rest_are_cancelled(self):
+        (extracted, attempt), client = self.run_speculative([
+            (0.05, "not json"),
+            (0.01, json.dumps(VALID)),
+            (0.5, json.dumps(VALID))
+        ])
+        self.assertEqual(extracted, VALID)
+        self.assertEqual(attempt, 2)
+        self.assertEqual(sorted(client.cancelled), [Config.SEED, Config.SEED + 2])
+
+    def test_invalid_response_does_not_win(self):
+        (extracted, attempt), _ = self.run_speculative([
+            (0.02, json.dumps(VALID)),
+            (0.01, '{"nodes": []}')
+        ])
+        self.assertEqual(attempt, 1)
+
+    def test_falls_back_to_last_attempt_when_none_valid(self):
+        (extracted, attempt), _ = self.run_speculative([
+            (0.01, '{"nodes": []}'),
+            (0.02, '{"nodes": [{"id": 1, "type": "blob", "text": ""}], "edges": []}')
+        ])
+        self.assertIsNone(attempt)
+        self.assertEqual(extracted["nodes"][0]["type"], "blob")
+
+    def test_concurrency_limit_of_one_keeps_sequential_order(self):
+        client = ScriptedClient([(0.01, json.dumps(VALID)), (0.01, json.dumps(VALID))])
+        llm = AsyncLLM({Config.EXTRACTION_MODEL: 1}, client=client)
+        _, attempt = asyncio.run(extract_flowchart_json_speculative(llm, "payload", max_attempts=2))
+        self.assertEqual(attempt, 1)
+        self.assertEqual(client.completed, [Config.SEED])
+
+class TestBlockingSpeculativeExtraction(unittest.TestCase):
+
+    def setUp(self):
+        close_speculative_extraction()
+        self.addCleanup(close_speculative_extraction)
+
+    def test_one_client_serves_every_call_and_is_closed(self):
+        clients = []
+
+        def new_client(host=None):
+            client = ScriptedClient([(0.01, json.dumps(VALID))] * 3)
+            client._client = ClosingHTTPClient()
+            clients.append(client)
+            return client
+
+        with patch.object(async_g_eval.ollama, 'AsyncClient', new_client):
+            self.assertEqual(run_speculative_extraction("payload"), (VALID, 1))
+            self.assertEqual(run_speculative_extraction("payload"), (VALID, 1))
+        self.assertEqual(len(clients), 1)
+        close_speculative_extraction()
+        self.assertTrue(clients[0]._client.closed)
+
+    def test_falls_back_to_sequential_retries_inside_a_running_loop(self):
+        async def extract():
+            return run_speculative_extraction("payload", max_attempts=2)
+
+        with patch.object(async_g_eval, 'extract_flowchart_json_with_attempt', return_value=(VALID, 1)) as sequential:
+            self.assertEqual(asyncio.run(extract()), (VALID, 1))
+        sequential.assert_called_once_with("payload", max_attempts=2)
+        self.assertIsNone(async_g_eval._speculative_loop)
+
+if __name__ == '__main__':
+    unittest.main()
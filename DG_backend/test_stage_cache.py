@@ -0,0 +1,102 @@
+import sys
+import os
+
+# Add the DG_backend directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+import g_eval
+from node_rules import NodeTypeMemo
+from stage_cache import StageCache, make_cache_key
+
+FLOWCHART = {
+    "nodes": [
+        {"id": 1, "type": "start", "text": "Start"},
+        {"id": 2, "type": "process", "text": "Swap A and B"},
+        {"id": 3, "type": "end", "text": "End"}
+    ],
+    "edges": [{"from": 1, "to": 2, "label": ""}, {"from": 2, "to": 3, "label": ""}]
+}
+CLASSIFIED = [
+    {"id": 2, "original_type": "terminal", "text": "Swap A and B", "classified_type": "process"}
+]
+
+def fake_chat(model, messages, options=None, **kwargs):
+    if model == g_eval.Config.EXTRACTION_MODEL:
+        return {'message': {'content': json.dumps(FLOWCHART)}}
+    return {'message': {'content': json.dumps(CLASSIFIED)}}
+
+class TestStageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp.name, "cache.sqlite3")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_ignores_dict_ordering(self):
+        self.assertEqual(make_cache_key("s", {"a": 1, "b": 2}), make_cache_key("s", {"b": 2, "a": 1}))
+        self.assertNotEqual(make_cache_key("s", {"a": 1}), make_cache_key("t", {"a": 1}))
+
+    def test_round_trip_and_counters(self):
+        cache = StageCache(self.cache_path)
+        self.assertIsNone(cache.get("k"))
+        cache.set("k", "extraction", FLOWCHART)
+        self.assertEqual(cache.get("k"), FLOWCHART)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.close()
+        # Entries survive a reopen
+        reopened = StageCache(self.cache_path)
+        self.assertEqual(reopened.get("k"), FLOWCHART)
+        reopened.close()
+
+    def test_lru_eviction_by_size(self):
+        value = "x" * 100
+        cache = StageCache(self.cache_path, max_bytes=250)
+        cache.set("a", "s", value)
+        cache.set("b", "s", value)
+        cache.get("a")  # "b" is now the least recently used entry
+        cache.set("c", "s", value)
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertLessEqual(cache.total_bytes(), 250)
+        cache.close()
+
+    @patch('g_eval.node_type_memo', NodeTypeMemo())
+    @patch('g_eval.ollama.chat', side_effect=fake_chat)
+    def test_regrade_skips_llm_calls(self, mock_chat):
+        image_path = os.path.join(self.tmp.name, "flowchart.png")
+        with open(image_path, "wb") as f:
+            f.write(b"not really a png")
+        cache = StageCache(self.cache_path)
+        with patch('g_eval.get_stage_cache', return_value=cache):
+            first = g_eval.graph_based_g_eval(image_path, "problem")
+            self.assertEqual(mock_chat.call_count, 1)
+            second = g_eval.graph_based_g_eval(image_path, "problem")
+        # Every node is resolved by the rules, so only extraction calls the LLM
+        self.assertEqual(mock_chat.call_count, 1)
+        self.assertIsNone(second["error"])
+        self.assertEqual(first["cache"], {"extraction": "miss", "classification": "skipped"})
+        self.assertEqual(second["cache"], {"extraction": "hit", "classification": "skipped"})
+        self.assertEqual(first["score"], second["score"])
+        cache.close()
+
+    @patch('g_eval.ollama.chat', side_effect=fake_chat)
+    def test_classification_is_cached_by_node_list(self, mock_chat):
+        nodes = [{"id": 2, "type": "terminal", "text": "Swap A and B"}]
+        cache = StageCache(self.cache_path)
+        first, hit = g_eval.cached_classify_node_types(nodes, cache)
+        self.assertFalse(hit)
+        second, hit = g_eval.cached_classify_node_types(nodes, cache)
+        self.assertTrue(hit)
+        self.assertEqual(first, second)
+        self.assertEqual(mock_chat.call_count, 1)
+        cache.close()
+
+if __name__ == '__main__':
+    unittest.main()
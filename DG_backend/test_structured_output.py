@@ -0,0 +1,59 @@
+import sys
+import os
+
+# Add the DG_backend directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+import g_eval
+from node_rules import NodeTypeMemo
+
+FLOWCHART = {
+    "nodes": [{"id": 1, "type": "start", "text": "Start"}, {"id": 2, "type": "end", "text": "End"}],
+    "edges": [{"from": 1, "to": 2, "label": ""}]
+}
+
+class TestStructuredOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.image_path = os.path.join(self.tmp.name, "flowchart.png")
+        with open(self.image_path, "wb") as f:
+            f.write(b"not really a png")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_schemas_restrict_types_to_valid_node_types(self):
+        node_type = g_eval.EXTRACTION_SCHEMA["properties"]["nodes"]["items"]["properties"]["type"]
+        classified_type = g_eval.CLASSIFICATION_SCHEMA["items"]["properties"]["classified_type"]
+        self.assertEqual(set(node_type["enum"]), g_eval.VALID_NODE_TYPES)
+        self.assertEqual(set(classified_type["enum"]), g_eval.VALID_NODE_TYPES)
+
+    @patch('g_eval.node_type_memo', NodeTypeMemo())
+    @patch('g_eval.ollama.chat', return_value={'message': {'content': json.dumps(FLOWCHART)}})
+    def test_schema_is_sent_only_in_structured_mode(self, mock_chat):
+        with patch.object(g_eval.Config, 'STRUCTURED_OUTPUT', True):
+            result = g_eval.graph_based_g_eval(self.image_path, "problem", use_cache=False)
+            structured_key = g_eval.classification_cache_key(FLOWCHART["nodes"])
+        self.assertEqual(mock_chat.call_args.kwargs['format'], g_eval.EXTRACTION_SCHEMA)
+        self.assertTrue(result["config"]["structured_output"])
+        self.assertFalse(result["details"]["json_repair_needed"])
+        g_eval.graph_based_g_eval(self.image_path, "problem", use_cache=False)
+        self.assertIsNone(mock_chat.call_args.kwargs['format'])
+        self.assertNotEqual(structured_key, g_eval.classification_cache_key(FLOWCHART["nodes"]))
+
+    @patch('g_eval.node_type_memo', NodeTypeMemo())
+    @patch('g_eval.ollama.chat')
+    def test_records_when_the_repair_path_was_needed(self, mock_chat):
+        mock_chat.return_value = {'message': {'content': "```json\n" + json.dumps(FLOWCHART)[:-1] + ",}\n```"}}
+        result = g_eval.graph_based_g_eval(self.image_path, "problem", use_cache=False)
+        self.assertIsNone(result["error"])
+        self.assertTrue(result["details"]["json_repair_needed"])
+        self.assertEqual(result["config"]["timings"]["json_repairs"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import os
+import sys
+import argparse
+import asyncio
+import time
+import ollama
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "DG_backend"))
+from batch_grade import parse_concurrency
+from create_ai_score import (
+    RULE_COLUMNS,
+    load_done,
+    open_output,
+    parse_rule_response,
+    resolve_image_path,
+    rule_messages,
+    rule_values,
+)
+
+COMPARISON_COLUMNS = [
+    "image_id", "model_name", *RULE_COLUMNS, "latency_seconds", "load_seconds", "prompt_tokens",
+    "completion_tokens", "tokens_per_second", "error"
+]
+NS_PER_SECOND = 1e9
+
+def load_models(path="model_info.csv"):
+    return list(pd.read_csv(path)["model_name"])
+
+async def grade_with_model(client, model, row, base_dir):
+    """One graded row of the comparison table: the rule answers plus the call's latency and token counts."""
+    record = {"image_id": row["image_id"], "model_name": model}
+    started = time.perf_counter()
+    try:
+        response = await client.chat(model=model, messages=rule_messages(row["question"], resolve_image_path(row, base_dir)))
+        record["latency_seconds"] = round(time.perf_counter() - started, 3)
+        load_ns = response.get("load_duration")
+        eval_ns = response.get("eval_duration")
+        record["load_seconds"] = round(load_ns / NS_PER_SECOND, 3) if load_ns else 0.0
+        record["prompt_tokens"] = response.get("prompt_eval_count")
+        record["completion_tokens"] = response.get("eval_count")
+        if record["completion_tokens"] and eval_ns:
+            record["tokens_per_second"] = round(record["completion_tokens"] / (eval_ns / NS_PER_SECOND), 2)
+        record.update(rule_values(parse_rule_response(response['message']['content'])))
+    except Exception as e:
+        record.setdefault("latency_seconds", round(time.perf_counter() - started, 3))
+        record["error"] = str(e)[:200]
+    return record
+
+async def compare_models(models, rows, output_path, client=None, concurrency=None, default_concurrency=1,
+                         model_at_a_time=False, base_dir="."):
+    """
+    Grade every row with every model. Each model has its own queue of pending
+    rows, drained by as many workers as its concurrency limit allows, so a slow
+    model never holds up a fast one. With `model_at_a_time` the queues run one
+    after the other, which avoids swapping models in and out on a host that
+    can only hold one. Each result is appended to `output_path` as it completes,
+    and (image_id, model_name) pairs already graded there are skipped (see
+    `create_ai_score.load_done`; rows that errored are graded again).
+    Returns the number of rows written per model.
+    """
+    client = client or ollama.AsyncClient()
+    concurrency = concurrency or {}
+    done = load_done(output_path, COMPARISON_COLUMNS)
+    written = {model: 0 for model in models}
+
+    with open_output(output_path, COMPARISON_COLUMNS) as (f, writer):
+
+        async def worker(model, queue):
+            while True:
+                try:
+                    row = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                writer.writerow(await grade_with_model(client, model, row, base_dir))
+                f.flush()
+                written[model] += 1
+
+        async def drain(model):
+            queue = asyncio.Queue()
+            for row in rows:
+                if (str(row["image_id"]), model) not in done:
+                    queue.put_nowait(row)
+            limit = max(1, int(concurrency.get(model, default_concurrency)))
+            await asyncio.gather(*(worker(model, queue) for _ in range(limit)))
+
+        if model_at_a_time:
+            for model in models:
+                await drain(model)
+        else:
+            await asyncio.gather(*(drain(model) for model in models))
+    return written
+
+def summarize(output_path):
+    """
+    Per model: rows graded, errors, median latency, mean generation speed and
+    share of rules satisfied. Only the latest row of each (image_id,
+    model_name) counts, so an error that a later run retried is dropped.
+    """
+    df = pd.read_csv(output_path, dtype={"image_id": str}, on_bad_lines="skip")
+    df = df.drop_duplicates(["image_id", "model_name"], keep="last")
+    ok = df[df["error"].isna()]
+    rules = ok[RULE_COLUMNS].astype(str).apply(lambda column: column.str.lower() == "true")
+    return pd.DataFrame({
+        "rows": df.groupby("model_name").size(),
+        "errors": df[df["error"].notna()].groupby("model_name").size(),
+        "p50_latency_seconds": ok.groupby("model_name")["latency_seconds"].median(),
+        "tokens_per_second": ok.groupby("model_name")["tokens_per_second"].mean(),
+        "rules_satisfied": rules.groupby(ok["model_name"]).mean().mean(axis=1)
+    }).fillna({"errors": 0})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grade every submission with every model in model_info.csv.")
+    parser.add_argument("--input", default="grade.csv")
+    parser.add_argument("--models", default="model_info.csv")
+    parser.add_argument("--output", default="model_comparison.csv")
+    parser.add_argument("--concurrency", default=os.getenv("COMPARE_CONCURRENCY", ""),
+                        help="Per-model limits, e.g. 'llama3.2-vision=2,gemma3=4'")
+    parser.add_argument("--default-concurrency", type=int, default=1)
+    parser.add_argument("--model-at-a-time", action="store_true",
+                        help="Finish one model before starting the next (for hosts that hold one model)")
+    args = parser.parse_args()
+
+    rows = pd.read_csv(args.input, dtype={"image_id": str}).to_dict("records")
+    written = asyncio.run(compare_models(
+        load_models(args.models), rows, args.output, concurrency=parse_concurrency(args.concurrency),
+        default_concurrency=args.default_concurrency, model_at_a_time=args.model_at_a_time,
+        base_dir=os.path.dirname(os.path.abspath(args.input))
+    ))
+    print(f"Graded {sum(written.values())} rows: {written}")
+    print(summarize(args.output).to_string())
@@ -1,86 +1,33 @@
+import os
+import sys
+import argparse
+import csv
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import ollama
 import pandas as pd
-import re
-import json
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "DG_backend"))
+from lenient_json import parse_lenient_json
+from prompt_templates import RULE_GRADING_TEMPLATE
 
 # GLOBAL CONFIGURATIONS
 MODEL_NAME = 'llama3.2-vision'
-GRADING_PROMPT = '''You are an AI vision reasoning model. You will receive an image of a flowchart and the scope of the question it is meant to answer. Your task is to analyze the flowchart and, using the following rules, determine whether each rule is satisfied (True) or violated (False). Return your results as a JSON object, where each key is the rule_id and the value is True (rule satisfied) or False (rule violated).
-
-        Rules:
-
-        1. All variables used in the flowchart/diagram must be properly initialized before use.
-        2. The algorithm should match the expected scope and complexity of the question.
-        3. The submitted image or diagram must be clear and legible.
-        4. If the diagram is too complex, contains multiple diagrams, or is ambiguous, flag false for human review.
-        5. The flowchart must include an end node (terminator).
-        6. All decision nodes must be clearly labeled with 'Yes/No' or appropriate conditions.
-        7. Loops in the flowchart must be represented with correct loop arrows.
-        8. The correct type of box/shape must be used for each node (e.g., rectangles for processes, diamonds for decisions).
-        9. Every node must be properly enclosed within its designated box/shape.
-
-        Instructions:
-
-        - Carefully analyze the provided flowchart image and the question scope.
-        - For each rule, reason whether the flowchart satisfies the rule (True) or violates it (False).
-        - Return your answer as a JSON object in the following format:
-
-        ```json
-        {
-        "rule_1": true,
-        "rule_2": false,
-        "rule_3": true,
-        "rule_4": true,
-        "rule_5": true,
-        "rule_6": false,
-        "rule_7": true,
-        "rule_8": true,
-        "rule_9": true
-        }
-        ```
-
-        Input:
-
-        - `flowchart_image`: [Attach or link to the image]
-        - `question_scope`: [Insert the scope of the question]
-
-        Output:
-
-        - A JSON object with each `rule_id` as the key and a boolean value indicating if the rule is satisfied.
-
-        ---
-
-        **Example Input:**
-
-        - flowchart_image: [image.png]
-        - question_scope: "Design a flowchart to calculate the factorial of a number."
-
-        **Example Output:**
-
-        ```json
-        {
-        "rule_1": true,
-        "rule_2": true,
-        "rule_3": true,
-        "rule_4": true,
-        "rule_5": true,
-        "rule_6": true,
-        "rule_7": true,
-        "rule_8": true,
-        "rule_9": true
-        }
-        '''
-
-
-
-def ollama_func(question, image_path):
+RULE_COLUMNS = [f"rule_{i}" for i in range(1, 10)]
+OUTPUT_COLUMNS = ["image_id", "question", "image_path", *RULE_COLUMNS, "model_name"]
+
+def rule_messages(question, image_path):
+    """The chat messages asking a vision model for the rule checklist of one image."""
+    return [{
+        'role': 'user',
+        'content': RULE_GRADING_TEMPLATE.render(question),
+        'images': [image_path]
+    }]
+
+def ollama_func(question, image_path, model_name=MODEL_NAME):
     response = ollama.chat(
-        model=MODEL_NAME,
-        messages=[{
-            'role': 'user',
-            'content': GRADING_PROMPT + f"\nNow evaluate the following flowchart:\n{question}",
-            'images': [image_path]
-        }]
+        model=model_name,
+        messages=rule_messages(question, image_path)
     )
 
     content = response['message']['content']
@@ -88,35 +35,127 @@ def ollama_func(question, image_path):
     # Print the raw response for debugging
     print("Raw LLM Response:", content)
 
-    # Check if content is empty or invalid
-    if not content.strip():
-        raise ValueError("LLM returned an empty response. Please check the input or LLM configuration.")
-
-    # Parse the JSON response using ```json and ``` delimiters
-    response_text = content
-    match = re.search(r'\s*(\{.*?\})\s*', response_text, re.DOTALL) 
-    if match: 
-        json_str = match.group(1) 
-        parsed_json = json.loads(json_str) 
-        print(parsed_json) 
-    else: 
-        print("No JSON block found.")
-    
+    parsed_json = parse_rule_response(content)
+    print(parsed_json)
 
     return parsed_json
 
-# Load CSV and select range
-df = pd.read_csv('grade.csv').head(2)
-
-
-expanded_results = df.apply(lambda row: ollama_func(row['question'], row['image_path']), axis=1)
-
-result_df = pd.DataFrame(list(expanded_results))
-
-df = pd.concat([df, result_df], axis=1)
-
-df['model_name'] = MODEL_NAME
-
-# Save to a new CSV file
-df.to_csv("ai_grade.csv", mode='a', header=False, index=False)
+def parse_rule_response(content):
+    """The {rule_id: bool} object in a model answer; raises ValueError when there is none."""
+    # Check if content is empty or invalid
+    if not content.strip():
+        raise ValueError("LLM returned an empty response. Please check the input or LLM configuration.")
 
+    # The first JSON object in the answer (fenced or not, nested objects included), repaired if needed
+    parsed = parse_lenient_json(content, expect="object")
+    if parsed is None:
+        raise ValueError("No JSON object found.")
+    return parsed
+
+def rule_values(rules):
+    """The RULE_COLUMNS of a parsed answer; rules missing from it are left blank."""
+    return {rule: rules.get(rule) for rule in RULE_COLUMNS}
+
+def resolve_image_path(row, base_dir="."):
+    """The image of a grade.csv row; relative paths are relative to `base_dir` (the manifest's directory)."""
+    image_path = row["image_path"]
+    if not os.path.isabs(image_path):
+        image_path = os.path.join(base_dir, image_path)
+    return image_path
+
+# -------------------------
+# Checkpointed Runner
+# -------------------------
+def load_done(output_path, fieldnames=OUTPUT_COLUMNS):
+    """
+    (image_id, model_name) pairs already graded in `output_path`; a torn last
+    line and rows with an "error" are ignored, so they are graded again.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f, fieldnames=fieldnames):
+            if row["image_id"] == "image_id" or row["model_name"] is None or row.get("error"):
+                continue
+            done.add((str(row["image_id"]), row["model_name"]))
+    return done
+
+@contextmanager
+def open_output(output_path, fieldnames=OUTPUT_COLUMNS):
+    """
+    Open a checkpointed CSV for appending; yields the file and a DictWriter.
+    A row torn by an interrupted run (not in `load_done`, so graded again) is
+    dropped first. Only complete lines are kept, so a file holding no
+    complete line (a header without its newline, or one partial row) is
+    emptied, and the header is written to an empty file.
+    """
+    new_file = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+    if not new_file:
+        with open(output_path, "rb+") as f:
+            content = f.read()
+            if not content.endswith(b"\n"):
+                complete = content.rfind(b"\n") + 1
+                f.truncate(complete)
+                new_file = complete == 0
+    with open(output_path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        if new_file:
+            writer.writeheader()
+        yield f, writer
+
+def grade_row(row, model_name, base_dir="."):
+    """Grade one grade.csv row; returns the output row (rule columns missing from the answer are left blank)."""
+    rules = ollama_func(row["question"], resolve_image_path(row, base_dir), model_name)
+    return {
+        "image_id": row["image_id"],
+        "question": row["question"],
+        "image_path": row["image_path"],
+        **rule_values(rules),
+        "model_name": model_name
+    }
+
+def run(input_path="grade.csv", output_path="ai_grade.csv", model_name=MODEL_NAME, workers=2, limit=None):
+    """
+    Grade every row of `input_path` with `model_name` on a pool of `workers`
+    threads. Each graded row is appended to `output_path` as soon as it
+    completes, and rows whose (image_id, model_name) is already in the output
+    are skipped, so an interrupted run picks up where it stopped. Rows that fail
+    are reported and left out, to be retried by the next run.
+    Returns (rows written, rows failed, rows skipped).
+    """
+    df = pd.read_csv(input_path, dtype={"image_id": str})
+    if limit:
+        df = df.head(limit)
+    done = load_done(output_path)
+    pending = [row for row in df.to_dict("records") if (str(row["image_id"]), model_name) not in done]
+    base_dir = os.path.dirname(os.path.abspath(input_path))
+    written = failed = 0
+
+    with open_output(output_path) as (f, writer):
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(grade_row, row, model_name, base_dir): row for row in pending}
+            for future in as_completed(futures):
+                row = futures[future]
+                try:
+                    graded = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"Image {row['image_id']} failed: {e}")
+                    continue
+                writer.writerow(graded)
+                f.flush()
+                written += 1
+    return written, failed, len(df) - len(pending)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grade the dataset images against the rule checklist with a vision model.")
+    parser.add_argument("--input", default="grade.csv")
+    parser.add_argument("--output", default="ai_grade.csv")
+    parser.add_argument("--model", default=os.getenv("MODEL_NAME", MODEL_NAME))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("GRADE_WORKERS", 2)))
+    parser.add_argument("--limit", type=int, help="Grade only the first N rows")
+    args = parser.parse_args()
+
+    written, failed, skipped = run(args.input, args.output, args.model, args.workers, args.limit)
+    print(f"Graded {written} rows with {args.model} ({skipped} already done, {failed} failed).")
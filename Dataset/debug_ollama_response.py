@@ -1,69 +1,19 @@
+import os
+import sys
 import ollama
 import json
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "DG_backend"))
+from prompt_templates import CHECKLIST_GRADING_TEMPLATE
+
 # GLOBAL CONFIGURATIONS
 MODEL_NAME = 'llama3.2-vision:latest'
-GRADING_PROMPT = '''
-You are an expert flowchart evaluator. You will be given:
-  - An image of a flowchart.
-
-Your tasks, in order:
-
-1. Node Classification
-   - List every node (by ID or label), classify it as Start, End, Process, or Decision.
-   - For each classification, briefly explain your reasoning.
-
-2. Structural & Practical Checks
-   For each of the following checks:
-   a) Describe how you verify it against the flowchart.
-   b) State the result (True or False).
-
-   ### Structural Logic Checks
-   - LT_1: Exactly one start node and one end node
-   - LT_2: All decision nodes contain clear, meaningful conditions
-   - LT_3: All nodes are connected; no isolated nodes
-   - LT_4: Node IDs are unique and in ascending order
-   - LT_5: At least one valid path from start to end exists
-   - LT_6: All node types are valid (Start, End, Process, Decision)
-   - LT_7: If loops exist, each has a proper termination condition
-   - LT_8: All nodes have clear, meaningful labels
-   - LT_9: Each decision node has exactly two outgoing edges (e.g., Yes/No)
-
-   ### Practical Reasoning Checks
-   - PT_1: The flowchart works for a basic test case
-   - PT_2: The flowchart works for a second, different test case
-
-   ### Additional Checks
-   - PT_3: It handles an edge/boundary case well
-   - PT_4: It is logically efficient (solves the problem with minimal steps)
-
-4. Final Output
-   - Output the results as a JSON object with the following structure:
-     {
-       "checks": {
-         "LT_1": true/false,
-         "LT_2": true/false,
-         ...
-         "PT_4": true/false
-       },
-       "practical_questions": {
-         "PT_1": {"question": "...", "reasoning": "..."},
-         "PT_2": {"question": "...", "reasoning": "..."},
-         ...
-       }
-     }
-
-IMPORTANT: 
-- Think step by step; do not skip your chain of thought.
-- After your reasoning, **do not** include any extra commentary—just the JSON result.
-'''
-
 def ollama_func(question, image_path):
     response = ollama.chat(
         model=MODEL_NAME,
         messages=[{
             'role': 'user',
-            'content': GRADING_PROMPT + f"\nNow evaluate the following flowchart:\n{question}",
+            'content': CHECKLIST_GRADING_TEMPLATE.render(question),
             'images': [image_path]
         }]
     )
@@ -1,68 +1,112 @@
+import os
+import sys
+import argparse
+import hashlib
 import ollama
 import pandas as pd
-import re
 
-MODEL = 'granite3.2-vision:latest'
-
-grading_prompt = '''
-You are an expert flowchart evaluator and classifier.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "DG_backend"))
+from lenient_json import parse_lenient_json
+from prompt_templates import QUESTION_ANALYSIS_TEMPLATE
+from stage_cache import StageCache, make_cache_key
 
-    You will be given:
-    - A flowchart-related question.
+MODEL = 'granite3.2-vision:latest'
+CACHE_PATH = os.getenv(
+    "QUESTION_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "DG_backend", ".cache", "question_analysis.sqlite3")
+)
 
-    Your task is to:
-    1. Classify the question into the following categories:
-        - **Question Intent:** Descriptive, Diagnostic, Predictive, Prescriptive
-        - **Difficulty Level:** L1 (Beginner), L2 (Intermediate), L3 (Advanced), L4 (Expert), L5 (Mastery)
-        - **Evaluation Type:** Conceptual Understanding, Application, Analysis, Creativity
+QUESTION_INTENTS = ["Descriptive", "Diagnostic", "Predictive", "Prescriptive"]
+DIFFICULTY_LEVELS = ["L1", "L2", "L3", "L4", "L5"]
+EVALUATION_TYPES = ["Conceptual Understanding", "Application", "Analysis", "Creativity"]
+ANALYSIS_COLUMNS = [
+    "question_intent", "question_difficulty_level", "question_evaluation_type", "evaluation_report", "reasoning"
+]
 
-    2. Evaluate the flowchart in terms of structure and logic as detailed below.
-    3. Extract reasoning for the classification of the question.
+# JSON Schema passed as Ollama's `format`, so the answer is always a parseable object with valid labels
+QUESTION_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question_intent": {"type": "string", "enum": QUESTION_INTENTS},
+        "question_difficulty_level": {"type": "string", "enum": DIFFICULTY_LEVELS},
+        "question_evaluation_type": {"type": "string", "enum": EVALUATION_TYPES},
+        "evaluation_report": {"type": "string"},
+        "reasoning": {"type": "string"}
+    },
+    "required": ANALYSIS_COLUMNS
+}
 
-    ### Output Format:
-    Return the following:
-    - `question_intent` (Descriptive, Diagnostic, Predictive, Prescriptive)
-    - `question_difficulty_level` (L1, L2, L3, L4, L5)
-    - `question_evaluation_type` (Conceptual Understanding, Application, Analysis, Creativity)
-    - **Evaluation Report** based on the flowchart checks (as per the original grading system).
+def normalize_question(question):
+    """Lower-case the question and collapse whitespace so re-typed copies share one analysis."""
+    return " ".join(str(question).lower().split())
 
-Now, classify and evaluate the following flowchart question:
-'''
+def question_hash(question):
+    return hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
 
-def ollama_func(question, image_path):
+def ollama_func(question, model=MODEL):
+    """Analyse one question from its text alone; raises ValueError when the answer is not a valid analysis."""
     response = ollama.chat(
-        model=MODEL,
-        messages=[{
-            'role': 'tool',
-            'content': grading_prompt + "and here is the question: " + question,
-            'images': [image_path]
-        }]
+        model=model,
+        messages=[{'role': 'user', 'content': QUESTION_ANALYSIS_TEMPLATE.render(question)}],
+        format=QUESTION_ANALYSIS_SCHEMA,
+        options={'temperature': 0}
     )
-    
-    # Parse the response to extract the classifications and grading
-    matches = re.findall(r'question_intent: (.*?),\s*question_difficulty_level: (.*?),\s*question_evaluation_type: (.*?),\s*total_score: (\d+)', response['message']['content'])
+    analysis = parse_lenient_json(response['message']['content'], expect="object")
+    if not isinstance(analysis, dict):
+        raise ValueError(f"Question analysis is not a JSON object: {response['message']['content'][:200]!r}")
+    allowed = {
+        "question_intent": QUESTION_INTENTS,
+        "question_difficulty_level": DIFFICULTY_LEVELS,
+        "question_evaluation_type": EVALUATION_TYPES
+    }
+    for column, values in allowed.items():
+        if analysis.get(column) not in values:
+            raise ValueError(f"Invalid {column} {analysis.get(column)!r} in question analysis")
+    return {column: analysis.get(column, "") for column in ANALYSIS_COLUMNS}
 
-    if matches:
-        question_intent, difficulty_level, evaluation_type
-    else:
-        # Fallback if the response does not match expected format
-        question_intent, difficulty_level, evaluation_type = "Unknown", "L1", "Conceptual Understanding"
-    
-    return question_intent, difficulty_level, evaluation_type
-
-# Load CSV
-df = pd.read_csv('grade.csv').head(1)
-
-# Apply the function and create the new columns
-df[['question_intent', 'question_difficulty_level', 'question_evaluation_type']] = df.apply(
-    lambda row: pd.Series(ollama_func(row['question'], row['image'])),
-    axis=1
-)
+def analyze_questions(questions, model=MODEL, cache=None):
+    """
+    Analyse each distinct question once. Questions are deduplicated by
+    `question_hash`, and analyses are looked up in `cache` (a StageCache)
+    before calling the model. Returns one row per distinct question, keyed by
+    `question_hash`, to join back onto submissions with `join_analysis`.
+    """
+    rows = {}
+    for question in questions:
+        digest = question_hash(question)
+        if digest in rows:
+            continue
+        key = make_cache_key("question_analysis", digest, model, QUESTION_ANALYSIS_TEMPLATE.fingerprint)
+        analysis = cache.get(key) if cache is not None else None
+        if analysis is None:
+            analysis = ollama_func(question, model)
+            if cache is not None:
+                cache.set(key, "question_analysis", analysis)
+        rows[digest] = {"question_hash": digest, **analysis, "question_classification_model": model}
+    return pd.DataFrame(
+        list(rows.values()), columns=["question_hash", *ANALYSIS_COLUMNS, "question_classification_model"]
+    )
 
-# Add model name used for classification
-df['question_classification_model'] = MODEL
+def join_analysis(submissions, analysis):
+    """Attach the per-question analysis to every submission row with the same (normalized) question."""
+    submissions = submissions.assign(question_hash=submissions["question"].map(question_hash))
+    return submissions.merge(analysis, on="question_hash", how="left")
 
-df = df[['id','question','question_intent', 'question_difficulty_level','question_evaluation_type']]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Classify the intent, difficulty and evaluation type of each question.")
+    parser.add_argument("--input", default="grade.csv")
+    parser.add_argument("--output", default="grade_question_analysis.csv")
+    parser.add_argument("--model", default=os.getenv("QUESTION_MODEL", MODEL))
+    parser.add_argument("--no-cache", action="store_true", help="Analyse every question again")
+    args = parser.parse_args()
 
-# Save the updated DataFrame
-df.to_csv('grade_question_analysis.csv', index=False)
+    df = pd.read_csv(args.input)
+    cache = None
+    if not args.no_cache:
+        os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+        cache = StageCache(CACHE_PATH)
+    analysis = analyze_questions(df["question"], args.model, cache)
+    df = join_analysis(df, analysis)
+    df = df[["image_id", "question", "question_hash", *ANALYSIS_COLUMNS, "question_classification_model"]]
+    df.to_csv(args.output, index=False)
+    print(f"Analysed {len(analysis)} distinct questions for {len(df)} submissions.")
@@ -0,0 +1,70 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+DEFAULT_RULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rule_engine.csv")
+MAX_SCORE = 10
+MANUAL_ACTION = "flag for manual grading"
+
+class RuleTable:
+    """
+    The rules of rule_engine.csv as arrays: the rule column of each rule
+    (rule_<id>), the points its violation deducts and whether its violation
+    sends the submission to manual grading.
+    """
+
+    def __init__(self, rules: pd.DataFrame):
+        self.columns = [f"rule_{rule_id}" for rule_id in rules["rule_id"]]
+        self.points = rules["points_to_deduct"].to_numpy(dtype=float)
+        self.manual = rules["rule_action"].str.strip().str.lower().eq(MANUAL_ACTION).to_numpy()
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_RULES) -> "RuleTable":
+        return cls(pd.read_csv(path))
+
+def rule_matrix(df: pd.DataFrame, columns: list) -> tuple:
+    """
+    The rule answers of every submission as two boolean matrices (rows x rules):
+    rules answered satisfied, and rules with no usable answer (missing column,
+    blank cell or anything other than true/false).
+    """
+    answers = df.reindex(columns=columns).astype(str).apply(lambda column: column.str.strip().str.lower())
+    values = answers.to_numpy()
+    satisfied = values == "true"
+    unknown = ~satisfied & (values != "false")
+    return satisfied, unknown
+
+def score_submissions(df: pd.DataFrame, rules: RuleTable, max_score: float = MAX_SCORE) -> pd.DataFrame:
+    """
+    Apply the rule deductions to every submission at once. Each violated rule
+    deducts its points (the grade is clipped at 0), and a violated "flag for
+    manual grading" rule, or a rule with no usable answer, sets manual_review.
+    Returns `df` with ai_grade, deducted_points, violated_rules and manual_review added.
+    """
+    satisfied, unknown = rule_matrix(df, rules.columns)
+    violated = ~satisfied & ~unknown
+    deducted = violated.astype(float) @ rules.points
+    # ";"-joined names of the violated rules, built one rule column at a time
+    joined = np.full(len(df), "", dtype=object)
+    for index, column in enumerate(rules.columns):
+        joined = joined + np.where(violated[:, index], column + ";", "")
+    scored = df.copy()
+    scored["deducted_points"] = deducted
+    scored["ai_grade"] = np.clip(max_score - deducted, 0, max_score)
+    scored["violated_rules"] = pd.Series(joined, index=df.index, dtype=str).str.rstrip(";")
+    scored["manual_review"] = (violated & rules.manual).any(axis=1) | unknown.any(axis=1)
+    return scored
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score rule-check results (e.g. ai_grade_*.csv) with the rule_engine.csv deductions.")
+    parser.add_argument("input", help="CSV with rule_1..rule_9 columns")
+    parser.add_argument("--rules", default=DEFAULT_RULES)
+    parser.add_argument("--max-score", type=float, default=MAX_SCORE)
+    parser.add_argument("--output", "-o", help="Scored CSV (defaults to <input>_scored.csv)")
+    args = parser.parse_args()
+
+    scored = score_submissions(pd.read_csv(args.input), RuleTable.load(args.rules), args.max_score)
+    output = args.output or f"{os.path.splitext(args.input)[0]}_scored.csv"
+    scored.to_csv(output, index=False)
+    print(f"Scored {len(scored)} submissions ({int(scored['manual_review'].sum())} flagged for manual review) into {output}")
@@ -0,0 +1,54 @@
+import sys
+import os
+
+# Add the Dataset directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import unittest
+import asyncio
+import tempfile
+import ollama
+import pandas as pd
+from compare_models import compare_models, summarize
+from fake_ollama import FakeOllama
+
+ROWS = [
+    {"image_id": "1", "question": "Swap two numbers", "image_path": "1.jpg"},
+    {"image_id": "2", "question": "Push onto a stack", "image_path": "2.jpg"},
+    {"image_id": "3", "question": "Find the largest", "image_path": "3.jpg"}
+]
+
+class TestCompareModels(unittest.TestCase):
+
+    def test_every_model_grades_every_row_into_one_table(self):
+        base_dir = os.path.abspath(os.path.dirname(__file__))
+        with FakeOllama(latency=0.01) as fake, tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "comparison.csv")
+            client = ollama.AsyncClient(host=fake.url)
+            written = asyncio.run(compare_models(["model-a", "model-b"], ROWS, output, client,
+                                                 concurrency={"model-a": 2}, base_dir=base_dir))
+            self.assertEqual(written, {"model-a": 3, "model-b": 3})
+            table = pd.read_csv(output)
+            self.assertEqual(len(table), 6)
+            self.assertTrue(table["error"].isna().all())
+            self.assertTrue((table["prompt_tokens"] > 0).all())
+            self.assertTrue((table["tokens_per_second"] > 0).all())
+            self.assertTrue(table["rule_1"].all())
+
+            # A rerun with a new model grades only that model's rows; failed rows are retried later
+            fake.failure_rate = 1.0
+            asyncio.run(compare_models(["model-a", "model-c"], ROWS, output, client, base_dir=base_dir))
+            self.assertEqual(len(pd.read_csv(output)), 9)
+            fake.failure_rate = 0.0
+            written = asyncio.run(compare_models(["model-a", "model-b", "model-c"], ROWS, output, client,
+                                                 model_at_a_time=True, base_dir=base_dir))
+            self.assertEqual(written, {"model-a": 0, "model-b": 0, "model-c": 3})
+            summary = summarize(output)
+            self.assertEqual(list(summary.index), ["model-a", "model-b", "model-c"])
+            # The errors of the first model-c run were retried, so only the latest rows count
+            self.assertEqual(len(pd.read_csv(output)), 12)
+            self.assertEqual((summary.loc["model-c", "rows"], summary.loc["model-c", "errors"]), (3, 0))
+            self.assertEqual(summary.loc["model-a", "rules_satisfied"], 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
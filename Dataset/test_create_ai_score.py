@@ -10,59 +10,92 @@ sys.path.append(os.path.abspath(os.path.dirname(__file__)))
 import unittest
 from unittest.mock import patch, MagicMock
 import json
+import tempfile
 import pandas as pd
-from create_ai_score import ollama_func
+from create_ai_score import OUTPUT_COLUMNS, ollama_func, run
 
 class TestCreateAIScore(unittest.TestCase):
 
     @patch('create_ai_score.ollama.chat')
     def test_ollama_func(self, mock_chat):
-        # Mock response from the LLM
-        mock_response = {
-            'message': {
-                'content': json.dumps({
-                    "checks": {
-                        "LT_1": True,
-                        "LT_2": False,
-                        "LT_3": True,
-                        "LT_4": True,
-                        "LT_5": False,
-                        "LT_6": True,
-                        "LT_7": True,
-                        "LT_8": False,
-                        "LT_9": True,
-                        "PT_1": True,
-                        "PT_2": False,
-                        "PT_3": True,
-                        "PT_4": True
-                    },
-                    "practical_questions": {
-                        "PT_1": {"question": "What is the basic test case?", "reasoning": "It works for the basic case."},
-                        "PT_2": {"question": "What is the second test case?", "reasoning": "It fails for the second case."},
-                        "PT_3": {"question": "What is the edge case?", "reasoning": "It handles the edge case well."},
-                        "PT_4": {"question": "Is it efficient?", "reasoning": "It is logically efficient."}
-                    },
-                    "total_score": 7.5
-                })
-            }
-        }
-
-        mock_chat.return_value = mock_response
-
-        # Input data
-        question = "Sample flowchart question"
-        image_path = "sample_image.jpg"
+        # Mock response from the LLM: a fenced rule_N object with a nested object after the rules
+        rules = {f"rule_{i}": i % 2 == 1 for i in range(1, 10)}
+        content = "Here is the result:\n```json\n" + json.dumps({**rules, "notes": {"rule_2": "no end node"}}) + "\n```"
+        mock_chat.return_value = {'message': {'content': content}}
 
         # Call the function
-        result = ollama_func(question, image_path)
+        result = ollama_func("Sample flowchart question", "sample_image.jpg")
 
         # Assertions
-        self.assertEqual(result['LT_1'], True)
-        self.assertEqual(result['LT_2'], False)
-        self.assertEqual(result['LT_3'], True)
-        self.assertEqual(result['p1_question'], "What is the basic test case?")
-        self.assertEqual(result['p1_reasoning'], "It works for the basic case.")
-        self.assertEqual(result['ai_grade'], 7.5)
+        self.assertEqual(mock_chat.call_args.kwargs['messages'][0]['images'], ["sample_image.jpg"])
+        self.assertEqual({rule: result[rule] for rule in rules}, rules)
+        self.assertEqual(result['notes'], {"rule_2": "no end node"})
+
+    @patch('create_ai_score.ollama.chat')
+    def test_ollama_func_rejects_answers_without_json(self, mock_chat):
+        for content in ("", "I cannot grade this flowchart."):
+            mock_chat.return_value = {'message': {'content': content}}
+            with self.assertRaises(ValueError):
+                ollama_func("Sample flowchart question", "sample_image.jpg")
+
+class TestCheckpointedRun(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.input = os.path.join(self.directory.name, "grade.csv")
+        self.output = os.path.join(self.directory.name, "ai_grade.csv")
+        pd.DataFrame({
+            "image_id": [1, 2, 3],
+            "question": ["Swap two numbers", "Push onto a stack", "Find the largest"],
+            "image_path": ["1.jpg", "2.jpg", "3.jpg"]
+        }).to_csv(self.input, index=False)
+
+    def rules_response(self, **kwargs):
+        rules = {f"rule_{i}": True for i in range(1, 10)}
+        return {'message': {'content': json.dumps(rules)}}
+
+    @patch('create_ai_score.ollama.chat')
+    def test_rows_are_appended_and_skipped_on_restart(self, mock_chat):
+        mock_chat.side_effect = lambda **kwargs: (
+            {'message': {'content': 'no json'}} if kwargs['messages'][0]['images'][0].endswith("2.jpg")
+            else self.rules_response()
+        )
+        self.assertEqual(run(self.input, self.output, "model-a", workers=2), (2, 1, 0))
+        self.assertEqual(sorted(pd.read_csv(self.output)["image_id"]), [1, 3])
+
+        mock_chat.side_effect = lambda **kwargs: self.rules_response()
+        mock_chat.reset_mock()
+        self.assertEqual(run(self.input, self.output, "model-a", workers=2), (1, 0, 2))
+        self.assertEqual(mock_chat.call_count, 1)
+        # Another model grades every row again
+        self.assertEqual(run(self.input, self.output, "model-b", workers=2), (3, 0, 0))
+        graded = pd.read_csv(self.output)
+        self.assertEqual(len(graded), 6)
+        self.assertTrue(graded["rule_1"].all())
+
+    @patch('create_ai_score.ollama.chat')
+    def test_torn_last_row_is_regraded(self, mock_chat):
+        mock_chat.side_effect = lambda **kwargs: self.rules_response()
+        run(self.input, self.output, "model-a", limit=2)
+        with open(self.output, "a", encoding="utf-8") as f:
+            f.write("3,Find the largest,3.jpg,True,Tr")
+        self.assertEqual(run(self.input, self.output, "model-a"), (1, 0, 2))
+        graded = pd.read_csv(self.output)
+        self.assertEqual(sorted(graded["image_id"]), [1, 2, 3])
+        self.assertTrue((graded["model_name"] == "model-a").all())
+
+    @patch('create_ai_score.ollama.chat')
+    def test_output_without_a_complete_line_gets_its_header_back(self, mock_chat):
+        mock_chat.side_effect = lambda **kwargs: self.rules_response()
+        for content in (",".join(OUTPUT_COLUMNS), "1,Swap two numbers,1.jpg,Tr"):
+            with self.subTest(content):
+                with open(self.output, "w", encoding="utf-8") as f:
+                    f.write(content)
+                self.assertEqual(run(self.input, self.output, "model-a"), (3, 0, 0))
+                graded = pd.read_csv(self.output)
+                self.assertEqual(list(graded.columns), OUTPUT_COLUMNS)
+                self.assertEqual(sorted(graded["image_id"]), [1, 2, 3])
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
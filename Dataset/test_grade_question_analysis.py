@@ -0,0 +1,63 @@
+import sys
+import os
+
+# Add the Dataset directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import unittest
+from unittest.mock import patch
+import json
+import tempfile
+import pandas as pd
+from grade_question_analysis import QUESTION_ANALYSIS_SCHEMA, analyze_questions, join_analysis, ollama_func
+from stage_cache import StageCache
+
+ANALYSIS = {
+    "question_intent": "Descriptive",
+    "question_difficulty_level": "L1",
+    "question_evaluation_type": "Application",
+    "evaluation_report": "Swap through a temporary variable.",
+    "reasoning": "A direct, basic procedure."
+}
+
+class TestQuestionAnalysis(unittest.TestCase):
+
+    @patch('grade_question_analysis.ollama.chat')
+    def test_question_is_analysed_from_text_with_structured_output(self, mock_chat):
+        mock_chat.return_value = {'message': {'content': json.dumps(ANALYSIS)}}
+        self.assertEqual(ollama_func("Swap two numbers"), ANALYSIS)
+        kwargs = mock_chat.call_args.kwargs
+        message = kwargs['messages'][0]
+        self.assertEqual(message['role'], 'user')
+        self.assertNotIn('images', message)
+        self.assertTrue(message['content'].endswith("Swap two numbers"))
+        self.assertEqual(kwargs['format'], QUESTION_ANALYSIS_SCHEMA)
+
+    @patch('grade_question_analysis.ollama.chat')
+    def test_invalid_answer_raises_instead_of_defaulting(self, mock_chat):
+        mock_chat.return_value = {'message': {'content': json.dumps(dict(ANALYSIS, question_intent="Unknown"))}}
+        with self.assertRaises(ValueError):
+            ollama_func("Swap two numbers")
+
+    @patch('grade_question_analysis.ollama.chat')
+    def test_each_distinct_question_is_analysed_once_and_joined_back(self, mock_chat):
+        mock_chat.return_value = {'message': {'content': json.dumps(ANALYSIS)}}
+        submissions = pd.DataFrame({
+            "image_id": [1, 2, 3],
+            "question": ["Swap two numbers.", "  swap TWO numbers. ", "Push onto a stack."]
+        })
+        with tempfile.TemporaryDirectory() as directory:
+            cache = StageCache(os.path.join(directory, "cache.sqlite3"))
+            analysis = analyze_questions(submissions["question"], "model-a", cache)
+            self.assertEqual(len(analysis), 2)
+            self.assertEqual(mock_chat.call_count, 2)
+            analyze_questions(submissions["question"], "model-a", cache)
+            self.assertEqual(mock_chat.call_count, 2)
+            cache.close()
+        joined = join_analysis(submissions, analysis)
+        self.assertEqual(list(joined["image_id"]), [1, 2, 3])
+        self.assertEqual(joined.loc[0, "question_hash"], joined.loc[1, "question_hash"])
+        self.assertTrue((joined["question_intent"] == "Descriptive").all())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import sys
+import os
+
+# Add the Dataset directory to the Python path to ensure imports work
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+
+import unittest
+import numpy as np
+import pandas as pd
+from rule_scoring import RuleTable, score_submissions
+
+def submissions(*rows):
+    return pd.DataFrame([{f"rule_{i}": value for i, value in enumerate(row, start=1)} for row in rows])
+
+class TestRuleScoring(unittest.TestCase):
+
+    def setUp(self):
+        self.rules = RuleTable.load()
+
+    def test_rule_table_is_compiled_from_rule_engine_csv(self):
+        self.assertEqual(self.rules.columns, [f"rule_{i}" for i in range(1, 10)])
+        self.assertEqual(self.rules.points[0], 1)
+        self.assertEqual(list(np.flatnonzero(self.rules.manual)), [2, 3])
+
+    def test_deductions_and_manual_review_flags(self):
+        df = submissions(
+            [True] * 9,
+            [False, False, True, True, True, True, True, True, True],
+            ["True", "true", "False", True, True, True, True, True, True],
+            [True, None, True, True, True, True, True, True, "maybe"]
+        )
+        scored = score_submissions(df, self.rules)
+        self.assertEqual(list(scored["ai_grade"]), [10, 8, 0, 10])
+        self.assertEqual(list(scored["violated_rules"]), ["", "rule_1;rule_2", "rule_3", ""])
+        self.assertEqual(list(scored["manual_review"]), [False, False, True, True])
+
+    def test_rule_edits_rescore_the_cohort(self):
+        df = submissions(*[[i % 2 == 0] + [True] * 8 for i in range(1000)])
+        table = pd.read_csv(os.path.join(os.path.dirname(__file__), "rule_engine.csv"))
+        table.loc[0, "points_to_deduct"] = 3
+        scored = score_submissions(df, RuleTable(table), max_score=20)
+        self.assertEqual(scored["ai_grade"].value_counts().to_dict(), {20: 500, 17: 500})
+
+    def test_existing_ai_grade_csv_scores(self):
+        df = pd.read_csv(os.path.join(os.path.dirname(__file__), "ai_grade_llama.csv"))
+        scored = score_submissions(df, self.rules)
+        self.assertEqual(len(scored), len(df))
+        self.assertTrue(scored["ai_grade"].between(0, 10).all())
+
+if __name__ == '__main__':
+    unittest.main()
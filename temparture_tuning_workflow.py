@@ -1,12 +1,20 @@
 import ollama
-import hashlib
+import argparse
+import csv
 import json
-import re
+import math
 import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from dotenv import load_dotenv
 from collections import Counter
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "DG_backend"))
+from lenient_json import parse_lenient_json
+from prompt_templates import CLASSIFICATION_TEMPLATE, EXTRACTION_TEMPLATE
+
 # Load environment variables from a .env file
 load_dotenv()
 
@@ -23,35 +31,14 @@ def validate_image_path(image_path: str) -> bool:
     return path.exists() and path.suffix[1:].lower() in Config.ALLOWED_EXTENSIONS
 
 def extract_json_from_response(raw_response: str) -> dict:
-    start_idx = raw_response.find('{')
-    end_idx = raw_response.rfind('}')
-    if start_idx == -1 or end_idx == -1:
-        return None
-    json_str = raw_response[start_idx:end_idx+1]
-    json_str = (
-        json_str.strip()
-        .replace('\\\n', '')
-        .replace('```
-        .replace('...', '')
-        .replace("'", '"')
-    )
-    json_str = re.sub(r',\s*}', '}', json_str)
-    json_str = re.sub(r',\s*]', ']', json_str)
-    try:
-        return json.loads(json_str)
-    except Exception:
-        return None
+    return parse_lenient_json(raw_response, expect="object")
 
 def extract_flowchart_json(image_path, temperature=0.0, seed=42):
-    extraction_prompt = """Convert this flowchart image to JSON with:
-- "nodes": [{"id": int, "type": str, "text": str}]
-- "edges": [{"from": int, "to": int, "label": str}]
-Return only JSON."""
     response = ollama.chat(
         model=Config.EXTRACTION_MODEL,
         messages=[{
             'role': 'user',
-            'content': extraction_prompt,
+            'content': EXTRACTION_TEMPLATE.render(),
             'images': [image_path]
         }],
         options={'temperature': temperature, 'seed': seed}
@@ -59,32 +46,14 @@ Return only JSON."""
     return extract_json_from_response(response['message']['content'])
 
 def classify_node_types_with_llm(nodes, temperature=0.0, seed=42):
-    prompt = f"""
-You are a flowchart expert. Classify each node in the following list into one of these types:
-["start", "end", "input", "output", "if", "decision", "print", "process", "stack", "loop"].
-If unsure, choose the closest type.
-Return only valid JSON in the following format:
-[
-  {{"id": <node id>, "original_type": "<raw type>", "text": "<node text>", "classified_type": "<classified type>"}},
-  ...
-]
-Nodes:
-{json.dumps(nodes, indent=2)}
-"""
+    prompt = CLASSIFICATION_TEMPLATE.render(nodes)
     response = ollama.chat(
         model=Config.CLASSIFICATION_MODEL,
         messages=[{'role': 'user', 'content': prompt}],
         options={'temperature': temperature, 'seed': seed}
     )
-    start_idx = response['message']['content'].find('[')
-    end_idx = response['message']['content'].rfind(']')
-    if start_idx == -1 or end_idx == -1:
-        return []
-    json_str = response['message']['content'][start_idx:end_idx+1]
-    try:
-        return json.loads(json_str)
-    except Exception:
-        return []
+    classified = parse_lenient_json(response['message']['content'], expect="array")
+    return classified if isinstance(classified, list) else []
 
 def update_node_types(flowchart_json, classified_nodes):
     node_map = {item["id"]: item["classified_type"].lower() for item in classified_nodes}
@@ -108,35 +77,194 @@ def grade_flowchart(image_path, temperature, seed):
     score = dummy_graph_score(flowchart_json)
     return score
 
-def temperature_tuning(image_path, runs_per_temp=3):
-    temperatures = [0.0, 0.1, 0.2, 0.3, 0.5, 0.7, 1.0]
-    results = {}
-
-    print("Temperature tuning for consistent grading:\n")
-    for temp in temperatures:
-        scores = []
-        for i in range(runs_per_temp):
-            score = grade_flowchart(image_path, temperature=temp, seed=Config.SEED + i)
-            scores.append(score)
-        score_counts = Counter(scores)
-        most_common_score, freq = score_counts.most_common(1)
-        consistent = freq == runs_per_temp
-        results[temp] = {
+# -------------------------
+# Adaptive Sweep
+# -------------------------
+TEMPERATURES = [0.0, 0.1, 0.2, 0.3, 0.5, 0.7, 1.0]
+DEFAULT_MANIFEST = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Dataset", "grade.csv")
+DEFAULT_CHECKPOINT = "temperature_sweep.jsonl"
+CONSISTENT = "consistent"
+INCONSISTENT = "inconsistent"
+
+def runs_needed(confidence=0.8, tolerance=0.5, max_runs=8):
+    """
+    Runs after which identical scores establish consistency. If each repeat
+    disagreed with probability `tolerance`, k agreeing repeats after the first
+    run would happen with probability (1 - tolerance) ** k; once that is at
+    most 1 - confidence, i.e. k >= log(1 - confidence) / log(1 - tolerance),
+    a disagreement rate of `tolerance` or more is rejected at `confidence`
+    (the exact binomial test with zero observed disagreements).
+    """
+    repeats = math.ceil(math.log(1 - confidence) / math.log(1 - tolerance))
+    return min(max_runs, 1 + max(1, repeats))
+
+def decide(scores, needed):
+    """Verdict for one image at one temperature: inconsistent on the first disagreement, consistent after `needed` agreeing runs, else None (keep sampling)."""
+    if len(set(scores)) > 1:
+        return INCONSISTENT
+    if len(scores) >= needed:
+        return CONSISTENT
+    return None
+
+def load_jobs(manifest=DEFAULT_MANIFEST):
+    """Read the grade.csv manifest (image_id, question, image_path relative to the manifest)."""
+    jobs = []
+    with open(manifest, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            image_path = Path(row["image_path"])
+            if not image_path.is_absolute():
+                image_path = Path(manifest).parent / image_path
+            jobs.append({"id": row.get("image_id") or image_path.stem, "image_path": str(image_path)})
+    return jobs
+
+def new_cell():
+    return {"scores": [], "failures": 0}
+
+def load_checkpoint(path):
+    """
+    Runs already recorded, as {(image_id, temperature): {"scores", "failures"}};
+    a run without a score is a failure, and a torn last line is ignored.
+    """
+    samples = {}
+    if not os.path.exists(path):
+        return samples
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            cell = samples.setdefault((record["image_id"], record["temperature"]), new_cell())
+            if record.get("score") is None:
+                cell["failures"] += 1
+            else:
+                cell["scores"].append(record["score"])
+    return samples
+
+def terminate_last_line(path):
+    """End a torn last line of the checkpoint so the next record starts on a line of its own."""
+    if os.path.exists(path) and os.path.getsize(path):
+        with open(path, "rb+") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+
+def sweep(jobs, temperatures=TEMPERATURES, checkpoint=DEFAULT_CHECKPOINT, workers=4, needed=None, grade=None,
+          max_failures=None):
+    """
+    Sample every (image, temperature) pair until `decide` reaches a verdict,
+    running up to `workers` pairs at once. Each run is appended to the
+    `checkpoint` JSONL file as soon as it finishes, and runs already in the
+    file are reused, so an interrupted sweep resumes where it stopped.
+    `grade(image_path, temperature, seed)` defaults to `grade_flowchart`.
+    A run that raises or returns None (nothing extracted) is a failure: it is
+    recorded with its error but is not a score, so it never counts as a
+    disagreement. A pair is given up, without a verdict, after `max_failures`
+    failures (default: `needed`).
+    Returns {(image_id, temperature): {"scores", "failures", "failure_rate", "verdict", "most_common_score"}}.
+    """
+    needed = needed or runs_needed()
+    max_failures = max_failures or needed
+    grade = grade or grade_flowchart
+    samples = load_checkpoint(checkpoint)
+    terminate_last_line(checkpoint)
+    lock = threading.Lock()
+
+    def sample(job, temperature):
+        key = (job["id"], temperature)
+        cell = samples.get(key, new_cell())
+        scores, failures = list(cell["scores"]), cell["failures"]
+        while decide(scores, needed) is None and failures < max_failures:
+            run = len(scores) + failures
+            try:
+                score = grade(job["image_path"], temperature, Config.SEED + run)
+                error = None if score is not None else "No flowchart extracted"
+            except Exception as e:
+                score, error = None, str(e)
+            if score is None:
+                failures += 1
+            else:
+                scores.append(score)
+            record = {"image_id": job["id"], "temperature": temperature, "run": run,
+                      "seed": Config.SEED + run, "score": score, "error": error}
+            with lock:
+                with open(checkpoint, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+        most_common_score = Counter(scores).most_common(1)[0][0] if scores else None
+        return key, {
             "scores": scores,
-            "consistent": consistent,
+            "failures": failures,
+            "failure_rate": failures / (len(scores) + failures) if scores or failures else 0.0,
+            "verdict": decide(scores, needed),
             "most_common_score": most_common_score
         }
-        print(f"Temp={temp:.1f}: Scores={scores} | Consistent: {consistent}")
-    print("\nSummary Table:")
-    print("Temperature | Scores           | Consistent")
-    print("-------------------------------------------")
-    for temp, info in results.items():
-        print(f"{temp:<11} | {info['scores']} | {info['consistent']}")
-    print("\nRecommendation: Use the lowest temperature that gives consistent scores for production grading.")
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(sample, job, temperature) for job in jobs for temperature in temperatures]
+        return dict(future.result() for future in futures)
+
+def summarize(results, temperatures=TEMPERATURES):
+    """
+    Per temperature: images consistent, inconsistent and undecided (given up
+    after failures), runs spent, and the failed runs and their rate.
+    """
+    summary = {}
+    for temperature in temperatures:
+        cells = [cell for (_, temp), cell in results.items() if temp == temperature]
+        runs = sum(len(cell["scores"]) + cell["failures"] for cell in cells)
+        failures = sum(cell["failures"] for cell in cells)
+        summary[temperature] = {
+            "consistent": sum(1 for cell in cells if cell["verdict"] == CONSISTENT),
+            "inconsistent": sum(1 for cell in cells if cell["verdict"] == INCONSISTENT),
+            "undecided": sum(1 for cell in cells if cell["verdict"] is None),
+            "runs": runs,
+            "failures": failures,
+            "failure_rate": failures / runs if runs else 0.0
+        }
+    return summary
+
+def recommend(summary):
+    """The lowest temperature with no inconsistent image and at least one consistent one, or None."""
+    for temperature, counts in sorted(summary.items()):
+        if counts["inconsistent"] == 0 and counts["consistent"]:
+            return temperature
+    return None
+
+def temperature_tuning(jobs, temperatures=TEMPERATURES, checkpoint=DEFAULT_CHECKPOINT, workers=4, needed=None):
+    needed = needed or runs_needed()
+    print(f"Temperature tuning for consistent grading: {len(jobs)} images, "
+          f"{len(temperatures)} temperatures, up to {needed} runs each\n")
+    results = sweep(jobs, temperatures, checkpoint, workers, needed)
+    summary = summarize(results, temperatures)
+    print("Summary Table:")
+    print("Temperature | Consistent | Inconsistent | Undecided | Runs | Failed runs")
+    print("--------------------------------------------------------------------------")
+    for temperature, counts in summary.items():
+        print(f"{temperature:<11} | {counts['consistent']:<10} | {counts['inconsistent']:<12} | "
+              f"{counts['undecided']:<9} | {counts['runs']:<4} | {counts['failures']} ({counts['failure_rate']:.0%})")
+    print(f"\nWorst case without early stopping: {len(jobs) * len(temperatures) * needed} runs")
+    best = recommend(summary)
+    if best is None:
+        print("\nRecommendation: no temperature was consistent on every image.")
+    else:
+        print(f"\nRecommendation: use temperature {best} (the lowest with no inconsistent image) for production grading.")
+    return results
 
 if __name__ == "__main__":
-    image_path = "2.jpg"  # Change to your image file
-    if not validate_image_path(image_path):
-        print(f"ERROR: Image file '{image_path}' not found or invalid extension.")
+    parser = argparse.ArgumentParser(description="Find the lowest temperature that grades every image consistently.")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST, help="grade.csv-style manifest of images")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="JSONL file of runs, resumed if it exists")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SWEEP_WORKERS", 4)),
+                        help="Image/temperature pairs sampled at once")
+    parser.add_argument("--confidence", type=float, default=0.8)
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="Largest acceptable chance of a disagreeing run at that confidence")
+    parser.add_argument("--max-runs", type=int, default=8)
+    args = parser.parse_args()
+
+    jobs = [job for job in load_jobs(args.manifest) if validate_image_path(job["image_path"])]
+    if not jobs:
+        print(f"ERROR: No valid images listed in '{args.manifest}'.")
     else:
-        temperature_tuning(image_path, runs_per_temp=3)
+        temperature_tuning(jobs, TEMPERATURES, args.checkpoint, args.workers,
+                           runs_needed(args.confidence, args.tolerance, args.max_runs))
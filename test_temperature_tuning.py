@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+from temparture_tuning_workflow import CONSISTENT, INCONSISTENT, decide, recommend, runs_needed, summarize, sweep
+
+JOBS = [{"id": "1", "image_path": "1.jpg"}, {"id": "2", "image_path": "2.jpg"}]
+
+def fake_grade(image_path, temperature, seed):
+    # Deterministic at 0.0; image 2 changes score with the seed above that
+    if temperature == 0.0 or image_path == "1.jpg":
+        return 70
+    return 60 + seed % 2 * 10
+
+def test_early_stopping_rules():
+    assert runs_needed(confidence=0.8, tolerance=0.5) == 4
+    # 3 agreeing repeats reject a 50% disagreement rate at 80% confidence, 2 do not
+    assert 0.5 ** 3 <= 0.2 < 0.5 ** 2
+    assert decide([70, 70], 4) is None
+    assert decide([70, 60], 4) == INCONSISTENT
+    assert decide([70] * 4, 4) == CONSISTENT
+
+def test_sweep_stops_early_and_recommends_lowest_consistent_temperature():
+    with tempfile.TemporaryDirectory() as directory:
+        checkpoint = os.path.join(directory, "sweep.jsonl")
+        results = sweep(JOBS, [0.0, 0.5], checkpoint, workers=2, needed=4, grade=fake_grade)
+    assert results[("2", 0.5)]["verdict"] == INCONSISTENT
+    assert len(results[("2", 0.5)]["scores"]) == 2
+    assert results[("1", 0.5)]["most_common_score"] == 70
+    summary = summarize(results, [0.0, 0.5])
+    assert summary[0.0] == {"consistent": 2, "inconsistent": 0, "undecided": 0, "runs": 8, "failures": 0, "failure_rate": 0.0}
+    assert recommend(summary) == 0.0
+
+def test_interrupted_sweep_resumes_from_checkpoint():
+    calls = []
+
+    def grade(image_path, temperature, seed):
+        calls.append(seed)
+        return 70
+
+    with tempfile.TemporaryDirectory() as directory:
+        checkpoint = os.path.join(directory, "sweep.jsonl")
+        with open(checkpoint, "w", encoding="utf-8") as f:
+            for run in range(3):
+                f.write(json.dumps({"image_id": "1", "temperature": 0.0, "run": run, "seed": 42 + run, "score": 70}) + "\n")
+            f.write('{"image_id": "1", "tempera')
+        results = sweep(JOBS[:1], [0.0], checkpoint, workers=1, needed=4, grade=grade)
+        with open(checkpoint, encoding="utf-8") as f:
+            assert json.loads(f.read().splitlines()[-1])["run"] == 3
+    assert results[("1", 0.0)]["verdict"] == CONSISTENT
+    assert len(calls) == 1
+
+def test_failed_runs_are_counted_apart_from_the_verdict():
+    def grade(image_path, temperature, seed):
+        # Image 1 fails on alternate runs; image 2 never extracts
+        if image_path == "2.jpg":
+            return None
+        if seed % 2:
+            raise ConnectionError("model unavailable")
+        return 70
+
+    with tempfile.TemporaryDirectory() as directory:
+        checkpoint = os.path.join(directory, "sweep.jsonl")
+        results = sweep(JOBS, [0.0], checkpoint, workers=2, needed=3, grade=grade)
+        resumed = sweep(JOBS, [0.0], checkpoint, workers=2, needed=3, grade=None)
+    assert results[("1", 0.0)]["verdict"] == CONSISTENT
+    assert results[("1", 0.0)]["scores"] == [70, 70, 70]
+    assert results[("1", 0.0)]["failures"] == 2
+    assert results[("2", 0.0)] == {"scores": [], "failures": 3, "failure_rate": 1.0, "verdict": None, "most_common_score": None}
+    assert resumed == results
+    summary = summarize(results, [0.0])
+    assert (summary[0.0]["undecided"], summary[0.0]["failures"], summary[0.0]["runs"]) == (1, 5, 8)
+    assert recommend(summary) == 0.0